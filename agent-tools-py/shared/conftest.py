@@ -0,0 +1,3 @@
+# The shared modules import each other from the 'src' package, the same way they do inside an
+# agent. Having a conftest here puts this directory on sys.path when the tests are run from
+# agent-tools-py, so 'src' also resolves to shared/src
@@ -0,0 +1,57 @@
+import pytest
+
+from addresses import (
+    get_address_gauges,
+    normalize_address,
+    parse_address,
+    to_checksum_address,
+    to_hex_address,
+)
+
+
+ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+CHECKSUM_ADDR = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+
+
+def test_normalize_address():
+    """
+    Any hex form of the same address should normalize to the same 20-byte value
+    """
+    key = normalize_address(ADDR)
+
+    assert len(key) == 20
+    assert normalize_address(ADDR.upper().replace("0X", "0x")) == key
+    assert normalize_address(ADDR[2:]) == key
+    assert parse_address(ADDR) == key
+    assert to_hex_address(key) == ADDR
+
+
+@pytest.mark.parametrize(
+    "addr", [None, "", "0x", "0x1234", ADDR + "00", "0x" + "zz" * 20, ADDR[:-2] + "  "]
+)
+def test_normalize_invalid_address(addr):
+    """
+    Strings that aren't 20-byte hex values are not addresses
+    """
+    assert normalize_address(addr) is None
+    assert parse_address(addr) is None
+
+
+def test_address_table():
+    """
+    An address seen again should come out of the table as the same key
+    """
+    key = normalize_address(CHECKSUM_ADDR)
+    hits = get_address_gauges()["address_table_hits"]
+
+    assert normalize_address(CHECKSUM_ADDR) is key
+    assert get_address_gauges()["address_table_hits"] == hits + 1
+    assert get_address_gauges()["address_table_entries"] > 0
+
+
+def test_to_checksum_address():
+    """
+    Checksummed addresses should follow EIP-55 whatever form they are given in
+    """
+    assert to_checksum_address(CHECKSUM_ADDR.lower()) == CHECKSUM_ADDR
+    assert to_checksum_address(CHECKSUM_ADDR[2:].upper()) == CHECKSUM_ADDR
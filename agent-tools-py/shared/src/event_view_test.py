@@ -0,0 +1,66 @@
+from forta_agent import create_transaction_event
+
+from addresses import normalize_address
+from event_view import EventView, get_event_views
+
+SENDER = "0x000000000000000000000000000000000000dEaD"
+ROUTER = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+TOPIC = "0xE1FFFCC4923D04B559F4D29A8BFC6CDA04EB5B0D3C460751C2402C5C5CC9109C"
+
+
+def gen_event(data="0x", to=ROUTER, logs=None):
+    """
+    Generate a transaction event from the sender to 'to'
+    """
+    return create_transaction_event(
+        {
+            "transaction": {"from": SENDER, "to": to, "data": data},
+            "receipt": {"logs": logs or []},
+            "addresses": {SENDER: True, ROUTER: True, "0x1234": True},
+        }
+    )
+
+
+def test_event_view():
+    """
+    The fields should be decoded from the event, with the addresses as 20-byte keys
+    """
+    logs = [
+        {"address": ROUTER, "topics": [TOPIC], "data": "0x"},
+        {"address": ROUTER, "topics": [], "data": "0x"},
+        {"address": SENDER, "topics": [TOPIC.lower()], "data": "0x01"},
+    ]
+    view = EventView(gen_event("0x7ff36ab50001", logs=logs))
+
+    assert view.selector == "0x7ff36ab5"
+    assert view.calldata == bytes.fromhex("7ff36ab50001")
+    assert view.to_key == normalize_address(ROUTER)
+    assert view.from_key == normalize_address(SENDER)
+    assert view.address_keys[SENDER] == normalize_address(SENDER)
+    assert view.address_keys["0x1234"] is None
+    assert [log.data for log in view.logs_by_topic[TOPIC.lower()]] == ["0x", "0x01"]
+    assert len(view.logs_by_topic) == 1
+
+
+def test_event_view_missing_fields():
+    """
+    Contract creations and short or invalid calldata should decode to None
+    """
+    view = EventView(gen_event("0x1234", to=None))
+
+    assert view.to_key is None
+    assert view.selector is None
+    assert view.calldata == bytes.fromhex("1234")
+    assert EventView(gen_event("0xzz")).calldata is None
+    assert view.logs_by_topic == {}
+
+
+def test_get_event_views():
+    """
+    Views built by the caller should be used as they are, and built otherwise
+    """
+    events = [gen_event(), gen_event()]
+    views = [EventView(event) for event in events]
+
+    assert get_event_views(events, views) is views
+    assert [view.transaction_event for view in get_event_views(events)] == events
@@ -0,0 +1,156 @@
+import pytest
+
+from forta_agent import Finding, FindingSeverity, FindingType, create_transaction_event
+
+from finding_filter import (
+    FindingFilter,
+    build_finding_filter,
+    filter_batch_findings,
+    filter_findings,
+)
+
+ALERT_ID = "AE-TEST-ALERT"
+OTHER_ALERT_ID = "AE-TEST-OTHER"
+
+
+def gen_finding(sender, alert_id=ALERT_ID):
+    """
+    Generate a finding raised by a sender
+    """
+    return Finding(
+        {
+            "name": "Test alert",
+            "description": "Test alert",
+            "alert_id": alert_id,
+            "type": FindingType.Suspicious,
+            "severity": FindingSeverity.Low,
+            "metadata": {"from": sender, "addresses": [sender, "0xb"]},
+        }
+    )
+
+
+def test_filter_summarizes_burst():
+    """
+    Findings for the same key within the window should be held back, and summarized with
+    their count once the window has passed
+    """
+    finding_filter = FindingFilter(10, {ALERT_ID: ["from"]})
+
+    first = gen_finding("0xa")
+    assert finding_filter.filter([first], 100) == [first]
+    for position in range(101, 105):
+        assert finding_filter.filter([gen_finding("0xa")], position) == []
+
+    # Other senders and alert ids without key fields aren't held back
+    other_sender = gen_finding("0xc")
+    other_alert = gen_finding("0xa", OTHER_ALERT_ID)
+    assert finding_filter.filter([other_sender, other_alert], 105) == [other_sender, other_alert]
+    assert finding_filter.filter([], 109) == []
+
+    findings = finding_filter.filter([gen_finding("0xa")], 110)
+    assert len(findings) == 2
+    summary = findings[0]
+    assert summary.alert_id == f"{ALERT_ID}-SUMMARY"
+    assert summary.severity == FindingSeverity.Low
+    assert summary.metadata == {
+        "from": "0xa",
+        "count": 5,
+        "suppressed": 4,
+        "window_start": 100,
+        "window_end": 104,
+        "window": "10 blocks",
+    }
+    # The finding that follows opens a new window
+    assert findings[1].alert_id == ALERT_ID
+    assert finding_filter.suppressed == 4
+
+    # The group for 0xc held nothing back, so it closes without a summary
+    assert finding_filter.flush() == []
+    assert len(finding_filter) == 0
+
+
+def test_filter_list_key():
+    """
+    Findings should be grouped on list metadata regardless of the order of the list
+    """
+    finding_filter = FindingFilter(10, {ALERT_ID: ["addresses"]})
+
+    finding = gen_finding("0xa")
+    reordered = gen_finding("0xa")
+    reordered.metadata["addresses"].reverse()
+    assert finding_filter.filter([finding, reordered], 1) == [finding]
+
+    summaries = finding_filter.flush()
+    assert len(summaries) == 1
+    assert summaries[0].metadata["addresses"] == ["0xa", "0xb"]
+
+
+def test_filter_max_keys():
+    """
+    Past the limit the oldest groups should be closed early, without losing their counts
+    """
+    finding_filter = FindingFilter(100, {ALERT_ID: ["from"]}, max_keys=2)
+
+    finding_filter.filter([gen_finding("0xa"), gen_finding("0xa")], 1)
+    finding_filter.filter([gen_finding("0xb")], 2)
+    findings = finding_filter.filter([gen_finding("0xc")], 3)
+
+    assert len(finding_filter) == 2
+    assert finding_filter.evicted == 1
+    assert [finding.alert_id for finding in findings] == [f"{ALERT_ID}-SUMMARY", ALERT_ID]
+    assert findings[0].metadata["from"] == "0xa"
+
+
+def test_filter_without_position():
+    """
+    Findings that can't be placed in a window should be passed through
+    """
+    finding_filter = FindingFilter(10, {ALERT_ID: ["from"]})
+    findings = [gen_finding("0xa"), gen_finding("0xa")]
+
+    assert finding_filter.filter(findings, None) == findings
+
+
+def test_filter_batch_across_blocks():
+    """
+    A batch spanning several blocks should be filtered the same as its transactions one at
+    a time
+    """
+    tx_events = [
+        create_transaction_event({"block": {"number": block_number}})
+        for block_number in (100, 100, 105, 120)
+    ]
+    findings = [[gen_finding("0xa")], [gen_finding("0xa")], [], [gen_finding("0xa")]]
+
+    single_filter = FindingFilter(10, {ALERT_ID: ["from"]})
+    expected = [
+        finding
+        for tx_event, tx_findings in zip(tx_events, findings)
+        for finding in filter_findings(single_filter, tx_event, tx_findings)
+    ]
+    batch_filter = FindingFilter(10, {ALERT_ID: ["from"]})
+    filtered = filter_batch_findings(batch_filter, tx_events, findings)
+
+    assert [finding.alert_id for finding in expected] == [
+        ALERT_ID,
+        f"{ALERT_ID}-SUMMARY",
+        ALERT_ID,
+    ]
+    assert [finding.toJson() for finding in filtered] == [finding.toJson() for finding in expected]
+    assert filter_batch_findings(None, tx_events, findings) == [
+        finding for tx_findings in findings for finding in tx_findings
+    ]
+
+
+def test_build_finding_filter():
+    """
+    The filter should only be built when enabled, with a known window type
+    """
+    assert build_finding_filter(None) is None
+    assert build_finding_filter({"enabled": False}) is None
+
+    finding_filter = build_finding_filter({"enabled": True, "type": "seconds", "size": 60})
+    assert finding_filter.window == "60 seconds"
+
+    with pytest.raises(ValueError):
+        build_finding_filter({"enabled": True, "type": "days"})
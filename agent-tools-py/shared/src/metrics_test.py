@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def disabled_metrics():
+    """
+    Leave instrumentation off, with no exporter and no collectors, after every test
+    """
+    yield
+    metrics.configure({"enabled": False})
+    metrics.COLLECTORS.clear()
+
+
+def test_counters_and_timings():
+    metrics.configure({"enabled": True})
+    metrics.increment("transactions")
+    metrics.increment("transactions", 2)
+    metrics.record_time("decode", 1000)
+    metrics.record_time("decode", 3000)
+    assert metrics.timed("finding", max, 1, 2) == 2
+
+    snapshot = metrics.get_snapshot()
+
+    assert snapshot["counters"] == {"transactions": 3}
+    assert snapshot["timings"]["decode"]["count"] == 2
+    assert snapshot["timings"]["decode"]["avg_seconds"] == pytest.approx(2e-6)
+    assert snapshot["timings"]["decode"]["max_seconds"] == pytest.approx(3e-6)
+    assert snapshot["timings"]["finding"]["count"] == 1
+
+
+def test_format_prometheus():
+    metrics.configure({"enabled": True})
+    metrics.add_collector(lambda: {"store.entries": 12})
+    metrics.increment("rejected_not_router", 4)
+    metrics.record_time("decode", 2000)
+
+    text = metrics.format_prometheus(metrics.get_snapshot(), "uniswap")
+
+    assert "# TYPE uniswap_rejected_not_router_total counter\n" in text
+    assert "uniswap_rejected_not_router_total 4\n" in text
+    assert 'uniswap_stage_seconds_sum{stage="decode"} 0.000002000\n' in text
+    assert 'uniswap_stage_seconds_count{stage="decode"} 1\n' in text
+    assert "uniswap_store_entries 12\n" in text
+
+
+def test_configure_disabled():
+    """
+    Configuring with no settings leaves instrumentation off and clears earlier values
+    """
+    metrics.configure({"enabled": True})
+    metrics.increment("transactions")
+
+    metrics.configure(None)
+
+    assert not metrics.ENABLED
+    assert metrics.EXPORTER is None
+    assert metrics.get_snapshot()["counters"] == {}
+
+
+def test_export_json(tmp_path):
+    """
+    The exporter writes a last snapshot when it is stopped
+    """
+    path = tmp_path / "metrics.json"
+    metrics.configure(
+        {"enabled": True, "export_path": str(path), "export_format": "json", "export_interval_seconds": 3600}
+    )
+    metrics.increment("findings")
+
+    metrics.configure({"enabled": False})
+
+    assert json.loads(path.read_text())["counters"] == {"findings": 1}
+
+
+def test_export_failing_collector(tmp_path):
+    """
+    A gauge collector that raises should be left out of the snapshot, without stopping the
+    export of the other metrics
+    """
+    path = tmp_path / "metrics.json"
+    exporter = metrics.MetricsExporter(str(path), "json")
+    metrics.add_collector(lambda: {"entries": 2})
+    metrics.add_collector(lambda: {}["version"])
+    metrics.increment("findings")
+
+    assert exporter.export()
+    assert isinstance(exporter.last_error, KeyError)
+    snapshot = json.loads(path.read_text())
+    assert snapshot["gauges"] == {"entries": 2}
+    assert snapshot["counters"] == {"findings": 1}
+
+
+def test_invalid_export_format(tmp_path):
+    with pytest.raises(ValueError):
+        metrics.configure({"enabled": True, "export_path": str(tmp_path / "m"), "export_format": "xml"})
@@ -0,0 +1,212 @@
+import os
+import sys
+import types
+
+import pytest
+
+from forta_agent import create_transaction_event
+
+import slow_capture
+from slow_capture import SlowCallCapture, load_fixture, read_fixture, to_fixture
+
+SENDER = "0x000000000000000000000000000000000000dead"
+WETH_ADDR = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+
+
+@pytest.fixture(autouse=True)
+def disabled_capture():
+    """
+    Leave captures off after every test
+    """
+    yield
+    slow_capture.configure(None)
+
+
+def gen_tx_event(value=0):
+    """
+    Generate a transaction event with a value, a log and a trace
+    """
+    return create_transaction_event(
+        {
+            "network": 5,
+            "transaction": {"from": SENDER, "to": WETH_ADDR, "value": hex(value), "data": "0x"},
+            "receipt": {
+                "status": "0x1",
+                "gasUsed": "0x5208",
+                "logs": [{"address": WETH_ADDR, "topics": ["0x01"], "data": "0x", "logIndex": 2}],
+            },
+            "traces": [{"action": {"from": SENDER, "to": WETH_ADDR, "value": "0x1"}}],
+            "addresses": {SENDER: True, WETH_ADDR: True},
+            "block": {"number": 12, "timestamp": 100},
+        }
+    )
+
+
+def handle_transaction(transaction_event):
+    """
+    A stand-in agent entry point that spends 'value' microseconds in a decode stage
+    """
+    slow_capture.metrics.record_time("decode", transaction_event.transaction.value * 1000)
+    return []
+
+
+def timed_handle_transaction(transaction_event):
+    """
+    A stand-in agent entry point that only times its stage while metrics are enabled, like the
+    agents do
+    """
+    if slow_capture.metrics.ENABLED:
+        handle_transaction(transaction_event)
+    return []
+
+
+def test_to_fixture():
+    """
+    An event rebuilt from its fixture should hold the same values
+    """
+    tx_event = gen_tx_event(7)
+    copy = create_transaction_event(to_fixture(tx_event))
+
+    assert copy.network == tx_event.network
+    assert copy.from_ == SENDER
+    assert copy.transaction.value == 7
+    assert copy.receipt.status is True
+    assert copy.receipt.gas_used == 21000
+    assert copy.receipt.logs[0].log_index == 2
+    assert copy.traces[0].action.from_ == SENDER
+    assert copy.addresses == tx_event.addresses
+    assert copy.block_number == 12
+    assert to_fixture(copy) == to_fixture(tx_event)
+
+
+def test_capture_slow_calls(tmp_path):
+    """
+    Calls over the budget should be written as fixtures with their stage timings, and calls
+    under it should not
+    """
+    capture = SlowCallCapture(str(tmp_path), budget_ms=0)
+    capture.budget_ns = 10 ** 9
+
+    assert capture.call(handle_transaction, gen_tx_event(5)) == []
+    assert capture.captured == 0
+
+    capture.budget_ns = 0
+    capture.call(handle_transaction, gen_tx_event(5))
+
+    assert capture.captured == 1
+    events, slow_call = read_fixture(capture.get_fixture_path(0))
+    assert len(events) == 1
+    assert slow_call["entry"] == "handle_transaction"
+    assert slow_call["events"] == 1
+    assert slow_call["stages_ms"] == {"decode": pytest.approx(0.005)}
+
+    tx_events, _ = load_fixture(capture.get_fixture_path(0))
+    assert tx_events[0].transaction.value == 5
+    assert slow_capture.metrics.CALL_TIMINGS is None
+
+
+def test_fixture_ring(tmp_path):
+    """
+    Only the last 'max_fixtures' slow calls should be kept, and a new capture should carry
+    on after the newest fixture
+    """
+    capture = SlowCallCapture(str(tmp_path), budget_ms=0, max_fixtures=2)
+    for value in (1, 2, 3):
+        capture.call(handle_transaction, gen_tx_event(value))
+
+    assert sorted(os.listdir(tmp_path)) == ["slow-0000.jsonl", "slow-0001.jsonl"]
+    tx_events, _ = load_fixture(capture.get_fixture_path(0))
+    assert tx_events[0].transaction.value == 3
+
+    # The first slot holds the newest fixture
+    os.utime(capture.get_fixture_path(1), (1, 1))
+    assert SlowCallCapture(str(tmp_path), max_fixtures=2)._next_slot == 1
+
+
+def test_configure(tmp_path):
+    """
+    Entry points should only be timed while captures are enabled
+    """
+    entry = slow_capture.captured(handle_transaction)
+    assert entry.__name__ == "handle_transaction"
+    assert slow_capture.captured(lambda events, extra=None: extra)([], extra=3) == 3
+
+    entry(gen_tx_event(1))
+    assert slow_capture.get_capture_gauges() == {}
+
+    slow_capture.configure({"enabled": True, "path": str(tmp_path), "budget_ms": 0})
+    entry(gen_tx_event(1))
+
+    assert slow_capture.get_capture_gauges() == {"slow_calls_captured": 1}
+    assert os.path.exists(slow_capture.CAPTURE.get_fixture_path(0))
+
+    assert slow_capture.metrics.ENABLED
+    slow_capture.configure(None)
+    assert not slow_capture.metrics.ENABLED
+
+    # Metrics turned on by their settings stay on, even if they were already on for captures
+    slow_capture.configure({"enabled": True, "path": str(tmp_path)})
+    slow_capture.metrics.configure({"enabled": True})
+    try:
+        slow_capture.configure(None)
+        assert slow_capture.metrics.ENABLED
+    finally:
+        slow_capture.metrics.configure(None)
+
+
+def test_capture_stage_timings(tmp_path):
+    """
+    Stages should be timed while captures are enabled, even with metrics off
+    """
+    assert not slow_capture.metrics.ENABLED
+    slow_capture.configure({"enabled": True, "path": str(tmp_path), "budget_ms": 0})
+    slow_capture.captured(timed_handle_transaction)(gen_tx_event(5))
+
+    _, slow_call = read_fixture(slow_capture.CAPTURE.get_fixture_path(0))
+    assert slow_call["stages_ms"] == {"decode": pytest.approx(0.005)}
+
+
+def test_profile_fixture(tmp_path, capsys):
+    """
+    Stages should be timed while profiling, even with metrics off
+    """
+    capture = SlowCallCapture(str(tmp_path))
+    capture.capture("handle_transaction", gen_tx_event(5), 0, {})
+    agent = types.SimpleNamespace(handle_transaction=timed_handle_transaction)
+
+    call_timings = slow_capture.profile_fixture(agent, capture.get_fixture_path(0), repeat=2)
+
+    assert call_timings == {"decode": 10000}
+    assert "stages per run: decode 0.005ms" in capsys.readouterr().out
+    assert not slow_capture.metrics.ENABLED
+
+
+def test_main_disables_capture(tmp_path, monkeypatch):
+    """
+    Profiling should not capture the fixtures again. Run with -m, main is in a different module
+    from the one the agent's entry points were wrapped by, which is where captures are turned off
+    """
+    from src import slow_capture as agent_capture
+
+    capture = SlowCallCapture(str(tmp_path))
+    capture.capture("handle_transaction", gen_tx_event(5), 0, {})
+    calls = []
+
+    def entry(transaction_event):
+        calls.append(transaction_event)
+        return []
+
+    agent = types.ModuleType("src.agent")
+    agent.handle_transaction = agent_capture.captured(entry)
+    monkeypatch.setitem(sys.modules, "src.agent", agent)
+
+    captures_path = tmp_path / "captures"
+    agent_capture.configure({"enabled": True, "path": str(captures_path), "budget_ms": 0})
+    try:
+        assert agent_capture is not slow_capture
+        slow_capture.main([capture.get_fixture_path(0), "--limit", "1"])
+    finally:
+        agent_capture.configure(None)
+
+    assert len(calls) == 1
+    assert not captures_path.exists()
@@ -0,0 +1,68 @@
+import pytest
+
+from swap_window import SwapWindow
+
+
+SENDER = "0x000000000000000000000000000000000000dead"
+OTHER_SENDER = "0x000000000000000000000000000000000000beef"
+
+
+def test_window_crosses_threshold():
+    """
+    Swaps under the threshold should be reported once their total crosses it, and only once
+    """
+    window = SwapWindow(size=10, threshold=10)
+
+    assert window.add(SENDER, 4, 100) is None
+    assert window.add(OTHER_SENDER, 9, 101) is None
+    assert window.add(SENDER, 4, 102) is None
+    assert window.add(SENDER, 4, 102) == 12
+    assert window.add(SENDER, 1, 103) is None
+
+
+def test_window_expires_old_swaps():
+    """
+    Swaps that left the window no longer count towards the total, and a sender whose total
+    fell back under the threshold can be reported again
+    """
+    window = SwapWindow(size=10, threshold=10)
+
+    assert window.add(SENDER, 6, 100) is None
+    assert window.add(SENDER, 6, 110) is None
+    assert window.add(SENDER, 6, 111) == 12
+
+    assert window.add(SENDER, 1, 125) is None
+    assert window.add(SENDER, 9, 126) == 10
+
+
+def test_window_drops_idle_senders():
+    window = SwapWindow(size=10, threshold=10)
+    window.add(SENDER, 1, 100)
+    window.add(OTHER_SENDER, 1, 105)
+
+    window.add(OTHER_SENDER, 1, 112)
+
+    assert len(window) == 1
+
+
+def test_window_max_senders():
+    """
+    The least recently active senders are dropped first to stay under the limit
+    """
+    window = SwapWindow(size=1000, threshold=10, max_senders=2)
+    window.add(SENDER, 5, 100)
+    window.add(OTHER_SENDER, 5, 101)
+    window.add(SENDER, 1, 102)
+
+    window.add("0x0000000000000000000000000000000000000001", 1, 103)
+
+    assert len(window) == 2
+    assert window.evicted == 1
+    assert window.add(SENDER, 4, 104) == 10
+    # The other sender was dropped, so its earlier swap no longer counts
+    assert window.add(OTHER_SENDER, 5, 105) is None
+
+
+def test_window_invalid_size():
+    with pytest.raises(ValueError):
+        SwapWindow(size=0, threshold=10)
@@ -0,0 +1,142 @@
+import json
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from forta_agent import Finding, FindingSeverity, FindingType
+
+import metrics
+from worker import Worker, create_server
+
+SENDER = "0x000000000000000000000000000000000000dead"
+
+
+def handle_transaction(transaction_event):
+    """
+    Raise a finding for each transaction with a value
+    """
+    if not transaction_event.transaction.value:
+        return []
+
+    return [
+        Finding(
+            {
+                "name": "Test alert",
+                "description": "Test alert",
+                "alert_id": "AE-TEST-ALERT",
+                "type": FindingType.Info,
+                "severity": FindingSeverity.Low,
+                "metadata": {"from": transaction_event.from_},
+            }
+        )
+    ]
+
+
+@pytest.fixture
+def worker():
+    """
+    A worker for a stand-in agent, with instrumentation on
+    """
+    metrics.configure({"enabled": True})
+    yield Worker(SimpleNamespace(handle_transaction=handle_transaction, metrics=metrics))
+    metrics.configure({"enabled": False})
+
+
+def gen_request(request_id, values, flush=False):
+    """
+    Generate a request line for transactions with the given values
+    """
+    events = [
+        {"transaction": {"from": SENDER, "value": hex(value)}, "receipt": {"logs": []}}
+        for value in values
+    ]
+    request = {"id": request_id, "events": events}
+    if flush:
+        request["flush"] = True
+
+    return json.dumps(request).encode() + b"\n"
+
+
+def read_responses(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_handle_request(worker):
+    """
+    The findings of a batch should be streamed back before the line that ends the request
+    """
+    responses = read_responses(worker.handle_request(gen_request(7, [0, 5, 6])))
+
+    assert [response["id"] for response in responses] == [7, 7, 7]
+    assert [response["finding"]["metadata"]["from"] for response in responses[:2]] == [SENDER] * 2
+    assert responses[2]["done"]
+    assert responses[2]["events"] == 3
+    assert responses[2]["findings"] == 2
+    assert responses[2]["handle_us"] >= 0
+    assert responses[2]["overhead_us"] >= 0
+
+    snapshot = metrics.get_snapshot()
+    assert snapshot["counters"] == {"worker_requests": 1, "worker_events": 3}
+    assert snapshot["timings"]["worker_handle"]["count"] == 1
+
+
+def test_flush_request(worker):
+    """
+    A flush request should also be answered with the findings the agent held back
+    """
+    held_back = handle_transaction(
+        SimpleNamespace(transaction=SimpleNamespace(value=1), from_=SENDER)
+    )
+    worker.agent.flush_findings = lambda: held_back
+
+    responses = read_responses(worker.handle_request(gen_request(3, [0])))
+    assert responses[-1]["findings"] == 0
+
+    responses = read_responses(worker.handle_request(gen_request(4, [0], flush=True)))
+    assert responses[0]["finding"]["alertId"] == "AE-TEST-ALERT"
+    assert responses[-1]["findings"] == 1
+
+
+def test_handle_invalid_request(worker):
+    """
+    Requests that can't be decoded, or that the agent fails on, should be answered with an
+    error
+    """
+    responses = read_responses(worker.handle_request(b'{"id": 1}\n'))
+    assert responses[0]["id"] == 1
+    assert "invalid request" in responses[0]["error"]
+
+    responses = read_responses(worker.handle_request(b"not json\n"))
+    assert responses[0]["id"] is None
+
+    worker.agent = SimpleNamespace(handle_transaction=lambda _: 1 / 0)
+    responses = read_responses(worker.handle_request(gen_request(2, [1])))
+    assert "ZeroDivisionError" in responses[0]["error"]
+
+
+def test_server(worker, tmp_path):
+    """
+    A client should be able to send several requests over the same connection
+    """
+    socket_path = str(tmp_path / "worker.sock")
+    server = create_server(worker, socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(socket_path)
+            client.sendall(gen_request(1, [1]) + b"\n" + gen_request(2, [0, 0]))
+            with client.makefile("rb") as f:
+                responses = read_responses([f.readline() for _ in range(3)])
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert [response["id"] for response in responses] == [1, 1, 2]
+    assert "finding" in responses[0]
+    assert responses[1]["findings"] == 1
+    assert responses[2]["findings"] == 0
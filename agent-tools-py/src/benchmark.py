@@ -0,0 +1,418 @@
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from src.replay import load_agent
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROUTER_ADDR = "0x7a250d5630b4cf539739df2c5dacb4c659f2488d"
+WETH_ADDR = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+# An address from the built-in list of malicious-addr-py
+MALICIOUS_ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+
+DEPOSIT_TOPIC = "0xe1fffcc4923d04b559f4d29a8bfc6cda04eb5b0d3c460751c2402c5c5cc9109c"
+WITHDRAWAL_TOPIC = "0x7fcf532c15f0a6db0bd6d0e038bea71d30d808c7d98cb3bf7268a95bf5081b65"
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+ETHER = 10 ** 18
+
+# Number of calls made before measuring, so that lazily built tables are in place
+WARMUP_CALLS = 100
+# Number of calls traced to measure allocations. Tracing is slow, so only a sample is used
+ALLOC_SAMPLE_CALLS = 200
+
+# Number of addresses, e.g. tokens and routers, that most activity goes to in the workloads that
+# reuse addresses
+HOT_ADDRESSES = 10000
+
+# Metrics compared against the baseline, and whether a higher value is better
+METRICS = {
+    "throughput_per_s": True,
+    "p50_us": False,
+    "p99_us": False,
+    "alloc_bytes": False,
+}
+
+
+def random_address(rng):
+    return "0x" + rng.getrandbits(160).to_bytes(20, "big").hex()
+
+
+def get_address_picker(rng, reuse):
+    """
+    Return a function that picks addresses: a hot address a 'reuse' fraction of the time,
+    with a few of them picked far more often than the rest, and otherwise a new address
+    """
+    if not reuse:
+        return lambda: random_address(rng)
+
+    hot_addresses = [random_address(rng) for _ in range(HOT_ADDRESSES)]
+
+    def pick_address():
+        if rng.random() < reuse:
+            return hot_addresses[int(HOT_ADDRESSES * rng.random() ** 3)]
+        return random_address(rng)
+
+    return pick_address
+
+
+def random_word(rng):
+    return "0x" + rng.getrandbits(256).to_bytes(32, "big").hex()
+
+
+def address_word(addr):
+    return "0x" + addr[2:].rjust(64, "0")
+
+
+def get_selector(signature):
+    from web3 import Web3
+
+    return "0x" + bytes(Web3.keccak(text=signature)[:4]).hex()
+
+
+def encode_call(signature, args):
+    """
+    ABI encode a call from its signature and its arguments. Integers and addresses are
+    static words, lists of addresses are dynamic arrays stored after the head
+    """
+    head = []
+    tail = []
+    tail_offset = len(args) * 32
+    for arg in args:
+        if isinstance(arg, list):
+            head.append(tail_offset.to_bytes(32, "big"))
+            tail.append(len(arg).to_bytes(32, "big"))
+            tail.extend(bytes(12) + bytes.fromhex(addr[2:]) for addr in arg)
+            tail_offset += (len(arg) + 1) * 32
+        elif isinstance(arg, str):
+            head.append(bytes(12) + bytes.fromhex(arg[2:]))
+        else:
+            head.append(arg.to_bytes(32, "big"))
+
+    return get_selector(signature) + b"".join(head + tail).hex()
+
+
+def gen_transaction(to, data="0x", value=0, from_=None, rng=None):
+    return {
+        "hash": random_word(rng),
+        "from": from_ or random_address(rng),
+        "to": to,
+        "value": hex(value),
+        "data": data,
+    }
+
+
+def gen_swap_events(rng, count, _):
+    """
+    Router transactions calling a mix of swap functions, with about one in five over the
+    threshold, plus transactions that are not swaps at all
+    """
+    events = []
+    for _ in range(count):
+        amount = rng.randrange(1, 6 * ETHER)
+        token = random_address(rng)
+        to = random_address(rng)
+        deadline = rng.randrange(1 << 32)
+        kind = rng.randrange(5)
+
+        if kind == 0:
+            data = encode_call(
+                "swapExactETHForTokens(uint256,address[],address,uint256)",
+                [rng.randrange(1 << 64), [WETH_ADDR, token], to, deadline],
+            )
+            transaction = gen_transaction(ROUTER_ADDR, data, amount, rng=rng)
+        elif kind == 1:
+            data = encode_call(
+                "swapExactTokensForETH(uint256,uint256,address[],address,uint256)",
+                [rng.randrange(1 << 64), amount, [token, WETH_ADDR], to, deadline],
+            )
+            transaction = gen_transaction(ROUTER_ADDR, data, rng=rng)
+        elif kind == 2:
+            data = encode_call(
+                "swapExactTokensForTokens(uint256,uint256,address[],address,uint256)",
+                [amount, rng.randrange(1 << 64), [WETH_ADDR, token, random_address(rng)], to, deadline],
+            )
+            transaction = gen_transaction(ROUTER_ADDR, data, rng=rng)
+        elif kind == 3:
+            data = encode_call(
+                "addLiquidityETH(address,uint256,uint256,uint256,address,uint256)",
+                [token, amount, amount, amount, to, deadline],
+            )
+            transaction = gen_transaction(ROUTER_ADDR, data, amount, rng=rng)
+        else:
+            data = encode_call("transfer(address,uint256)", [to, amount])
+            transaction = gen_transaction(token, data, rng=rng)
+
+        events.append({"transaction": transaction, "receipt": {"logs": []}})
+
+    return events
+
+
+def get_logs_bloom(logs):
+    """
+    Compute the logs bloom of a receipt from its logs
+    """
+    from web3 import Web3
+
+    bloom = 0
+    for log in logs:
+        for item in [log["address"]] + log["topics"]:
+            item_hash = bytes(Web3.keccak(hexstr=item))
+            for i in (0, 2, 4):
+                bloom |= 1 << (int.from_bytes(item_hash[i:i + 2], "big") & 2047)
+
+    return "0x" + bloom.to_bytes(256, "big").hex()
+
+
+def gen_receipt_events(rng, count, logs_per_receipt, reuse=0):
+    """
+    Router transactions whose receipts hold 'logs_per_receipt' logs: token transfers, with a
+    WETH Deposit or Withdrawal about the router in about half of them. A 'reuse' fraction of
+    the addresses are hot addresses seen again and again, the others are new
+    """
+    pick_address = get_address_picker(rng, reuse)
+    router_word = address_word(ROUTER_ADDR)
+    events = []
+    for _ in range(count):
+        logs = []
+        for _ in range(logs_per_receipt):
+            logs.append(
+                {
+                    "address": pick_address(),
+                    "topics": [TRANSFER_TOPIC, address_word(pick_address()), router_word],
+                    "data": random_word(rng),
+                }
+            )
+
+        if logs and rng.randrange(2):
+            topic = rng.choice([DEPOSIT_TOPIC, WITHDRAWAL_TOPIC])
+            amount = rng.randrange(1, 10 * ETHER)
+            logs[rng.randrange(len(logs))] = {
+                "address": WETH_ADDR,
+                "topics": [topic, router_word],
+                "data": "0x" + amount.to_bytes(32, "big").hex(),
+            }
+
+        events.append(
+            {
+                "transaction": gen_transaction(ROUTER_ADDR, "0x7ff36ab5", rng=rng),
+                "receipt": {"logs": logs, "logsBloom": get_logs_bloom(logs)},
+            }
+        )
+
+    return events
+
+
+def gen_address_events(rng, count, addresses_per_tx, reuse=0):
+    """
+    Transactions that touch 'addresses_per_tx' addresses, one in a hundred of them including
+    a malicious address. A 'reuse' fraction of the addresses are hot addresses seen again and
+    again, the others are new
+    """
+    pick_address = get_address_picker(rng, reuse)
+    events = []
+    for _ in range(count):
+        addresses = list({pick_address(): True for _ in range(addresses_per_tx)})
+        if rng.randrange(100) == 0:
+            addresses[rng.randrange(len(addresses))] = MALICIOUS_ADDR
+
+        events.append(
+            {
+                "transaction": gen_transaction(addresses[-1], from_=addresses[0], rng=rng),
+                "receipt": {"logs": []},
+                "addresses": {addr: True for addr in addresses},
+            }
+        )
+
+    return events
+
+
+# Workload name -> (agent directory, event generator, size parameter). Every address is new in
+# the plain workloads, the worst case for the agents' address table, while in the 'hot' ones
+# 90% of them are hot addresses, closer to mainnet traffic
+WORKLOADS = {
+    "uniswap-py/swaps": ("uniswap-py", gen_swap_events, None),
+    "uniswap-event-py/logs-4": ("uniswap-event-py", gen_receipt_events, 4),
+    "uniswap-event-py/logs-64": ("uniswap-event-py", gen_receipt_events, 64),
+    "uniswap-event-py/logs-64-hot": (
+        "uniswap-event-py",
+        functools.partial(gen_receipt_events, reuse=0.9),
+        64,
+    ),
+    "malicious-addr-py/addresses-4": ("malicious-addr-py", gen_address_events, 4),
+    "malicious-addr-py/addresses-64": ("malicious-addr-py", gen_address_events, 64),
+    "malicious-addr-py/addresses-64-hot": (
+        "malicious-addr-py",
+        functools.partial(gen_address_events, reuse=0.9),
+        64,
+    ),
+    "malicious-addr-py/addresses-1024": ("malicious-addr-py", gen_address_events, 1024),
+}
+
+
+def get_percentile(sorted_values, percentile):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * percentile / 100))
+    return sorted_values[index]
+
+
+def run_workload(workload, count, seed, repo_dir=REPO_DIR):
+    """
+    Load the agent of a workload in this process, generate its transactions and time
+    handle_transaction on each of them. Returns the results as a dict
+    """
+    from forta_agent import create_transaction_event
+
+    agent_name, gen_events, size = WORKLOADS[workload]
+    agent = load_agent(os.path.join(repo_dir, agent_name))
+
+    rng = random.Random(f"{seed}:{workload}")
+    tx_events = [create_transaction_event(event) for event in gen_events(rng, count, size)]
+    handle_transaction = agent.handle_transaction
+
+    for tx_event in tx_events[:WARMUP_CALLS]:
+        handle_transaction(tx_event)
+
+    findings = 0
+    latencies = []
+    perf_counter_ns = time.perf_counter_ns
+    for tx_event in tx_events:
+        start = perf_counter_ns()
+        findings += len(handle_transaction(tx_event))
+        latencies.append(perf_counter_ns() - start)
+
+    # Peak memory allocated during each call, while tracing is restarted for every call
+    alloc_bytes = []
+    for tx_event in tx_events[:ALLOC_SAMPLE_CALLS]:
+        tracemalloc.start()
+        handle_transaction(tx_event)
+        alloc_bytes.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "findings": findings,
+        "throughput_per_s": len(latencies) / (sum(latencies) / 1e9),
+        "p50_us": get_percentile(latencies, 50) / 1000,
+        "p99_us": get_percentile(latencies, 99) / 1000,
+        "alloc_bytes": statistics.median(alloc_bytes),
+    }
+
+
+def run_benchmarks(workloads, count, seed, repo_dir=REPO_DIR):
+    """
+    Run each workload in a fresh process, so that agents don't share modules or warm caches
+    """
+    results = {}
+    for workload in workloads:
+        with multiprocessing.Pool(1) as pool:
+            results[workload] = pool.apply(run_workload, (workload, count, seed, repo_dir))
+
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Compare results with a baseline. Returns a list of (workload, metric, baseline value,
+    value) for every metric that got worse by more than 'tolerance', e.g. 0.2 for 20%
+    """
+    regressions = []
+    for workload, workload_results in results.items():
+        baseline_results = baseline.get(workload)
+        if baseline_results is None:
+            continue
+
+        for metric, higher_is_better in METRICS.items():
+            old = baseline_results.get(metric)
+            new = workload_results[metric]
+            if not old:
+                continue
+
+            if higher_is_better:
+                worse = new < old / (1 + tolerance)
+            else:
+                worse = new > old * (1 + tolerance)
+
+            if worse:
+                regressions.append((workload, metric, old, new))
+
+    return regressions
+
+
+def main(argv=None):
+    """
+    Benchmark handle_transaction of the Python agents on synthetic workloads, optionally
+    saving the results as a baseline or comparing them with one
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Python agents")
+    parser.add_argument(
+        "-w",
+        "--workload",
+        action="append",
+        choices=sorted(WORKLOADS),
+        help="workload to run, can be given more than once (default: all)",
+    )
+    parser.add_argument("-n", "--count", type=int, default=5000, help="transactions per workload")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated transactions")
+    parser.add_argument("--save", help="save the results to this baseline file")
+    parser.add_argument("--baseline", help="compare the results with this baseline file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="how much worse a metric can get before it counts as a regression (default: 0.2)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.workload or list(WORKLOADS), args.count, args.seed)
+
+    for workload, workload_results in results.items():
+        print(
+            f"{workload:36} {workload_results['throughput_per_s']:>10.0f} tx/s"
+            f" p50 {workload_results['p50_us']:>8.1f} us"
+            f" p99 {workload_results['p99_us']:>8.1f} us"
+            f" {workload_results['alloc_bytes']:>8.0f} B/call"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "count": args.count,
+                    "seed": args.seed,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        if baseline["count"] != args.count or baseline["seed"] != args.seed:
+            print("Warning: the baseline was run with a different count or seed", file=sys.stderr)
+
+        regressions = compare_results(results, baseline["results"], args.tolerance)
+        for workload, metric, old, new in regressions:
+            print(f"Regression: {workload} {metric} {old:.1f} -> {new:.1f}", file=sys.stderr)
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
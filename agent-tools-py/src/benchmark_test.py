@@ -0,0 +1,64 @@
+import random
+
+from benchmark import (
+    METRICS,
+    WORKLOADS,
+    compare_results,
+    encode_call,
+    gen_receipt_events,
+    run_benchmarks,
+)
+
+
+def test_encode_call():
+    """
+    Encoded calldata should match the ABI layout, with dynamic arrays after the head
+    """
+    data = encode_call(
+        "swapExactTokensForETH(uint256,uint256,address[],address,uint256)",
+        [1, 2, ["0x" + "11" * 20, "0x" + "22" * 20], "0x" + "33" * 20, 3],
+    )
+
+    words = [data[10 + i:10 + i + 64] for i in range(0, len(data) - 10, 64)]
+    assert data[:10] == "0x18cbafe5"
+    assert int(words[2], 16) == 5 * 32
+    assert int(words[5], 16) == 2
+    assert words[6].endswith("11" * 20)
+    assert words[7].endswith("22" * 20)
+
+
+def test_workloads_are_reproducible():
+    first = gen_receipt_events(random.Random(1), 10, 8)
+    second = gen_receipt_events(random.Random(1), 10, 8)
+
+    assert first == second
+    assert all(len(event["receipt"]["logs"]) == 8 for event in first)
+
+
+def test_run_benchmarks():
+    """
+    Every workload should run against its agent and report every metric
+    """
+    results = run_benchmarks(list(WORKLOADS), 50, 0)
+
+    assert list(results) == list(WORKLOADS)
+    for workload_results in results.values():
+        assert workload_results["calls"] == 50
+        for metric in METRICS:
+            assert workload_results[metric] > 0
+
+    # About one in five swaps and half of the WETH events are over the threshold
+    assert results["uniswap-py/swaps"]["findings"] > 0
+    assert results["uniswap-event-py/logs-4"]["findings"] > 0
+
+
+def test_compare_results():
+    baseline = {"a": {"throughput_per_s": 1000, "p50_us": 10, "p99_us": 20, "alloc_bytes": 100}}
+    results = {
+        "a": {"throughput_per_s": 700, "p50_us": 11, "p99_us": 30, "alloc_bytes": 100},
+        "b": {"throughput_per_s": 1, "p50_us": 1, "p99_us": 1, "alloc_bytes": 1},
+    }
+
+    regressions = compare_results(results, baseline, 0.2)
+
+    assert regressions == [("a", "throughput_per_s", 1000, 700), ("a", "p99_us", 20, 30)]
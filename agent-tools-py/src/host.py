@@ -0,0 +1,371 @@
+import argparse
+import builtins
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import inspect
+import itertools
+import json
+import os
+import re
+import sys
+
+from src.replay import (
+    flush_agent,
+    get_block_number,
+    in_block_range,
+    read_fixture_lines,
+)
+
+# Prefix of the package each hosted agent's modules are loaded under
+PACKAGE_PREFIX = "hosted_"
+
+
+def get_package_name(agent_dir):
+    """
+    Return the name of the package an agent's modules are loaded under, e.g. hosted_uniswap_py
+    for the uniswap-py directory. An agent loaded again, e.g. by another host in the same
+    process, gets a new package, e.g. hosted_uniswap_py_2
+    """
+    package = PACKAGE_PREFIX + re.sub(r"\W", "_", os.path.basename(agent_dir))
+    name = package
+    for count in itertools.count(2):
+        if name not in sys.modules:
+            return name
+        name = f"{package}_{count}"
+
+
+def get_agent_builtins(package):
+    """
+    Return the builtins of a hosted agent's modules: those of this process, with an
+    __import__ that imports the 'src' package and its modules, whether with 'import src.x' or
+    'from src.x import y', from the package the agent is loaded under instead
+    """
+
+    def agent_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and (name == "src" or name.startswith("src.")):
+            name = package + name[len("src") :]
+
+        return builtins.__import__(name, globals, locals, fromlist, level)
+
+    return {**vars(builtins), "__import__": agent_import}
+
+
+class AgentModuleLoader(importlib.machinery.SourceFileLoader):
+    """
+    Loads a module of a hosted agent from its source file, as it is, with the builtins of its
+    agent. Functions look their builtins up in their module, so the module's imports run at
+    any time, e.g. inside a function, resolve 'src' to the agent's package as well
+    """
+
+    def __init__(self, fullname, path, agent_builtins):
+        super().__init__(fullname, path)
+        self.agent_builtins = agent_builtins
+
+    def exec_module(self, module):
+        module.__builtins__ = self.agent_builtins
+        super().exec_module(module)
+
+
+class AgentPackageFinder(importlib.abc.MetaPathFinder):
+    """
+    Finds the package of one hosted agent, which has no __init__.py, and the modules of its
+    src/ directory
+    """
+
+    def __init__(self, package, src_dir):
+        self.package = package
+        self.src_dir = src_dir
+        self.agent_builtins = get_agent_builtins(package)
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname == self.package:
+            spec = importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+            spec.submodule_search_locations = [self.src_dir]
+            return spec
+
+        package, _, name = fullname.rpartition(".")
+        if package != self.package:
+            return None
+
+        path = os.path.join(self.src_dir, f"{name}.py")
+        if not os.path.exists(path):
+            return None
+
+        loader = AgentModuleLoader(fullname, path, self.agent_builtins)
+        return importlib.util.spec_from_file_location(fullname, path, loader=loader)
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        pass
+
+
+def load_agents(agent_dirs):
+    """
+    Import the agent module of each agent directory into this process. Every agent imports
+    its modules from a package named 'src', so each one is loaded under a package of its own,
+    e.g. hosted_uniswap_py, and its modules import from that package whenever they import
+    from 'src'. The agents don't share any module, and the 'src' package of this process is
+    left alone.
+    Returns a list of (agent name, agent module)
+    """
+    previous_dir = os.getcwd()
+    agents = []
+    try:
+        for agent_dir in agent_dirs:
+            agent_dir = os.path.abspath(agent_dir)
+            package = get_package_name(agent_dir)
+            sys.meta_path.insert(0, AgentPackageFinder(package, os.path.join(agent_dir, "src")))
+            # The agents read their ABI files relative to the working directory
+            os.chdir(agent_dir)
+            agent = importlib.import_module(f"{package}.agent")
+
+            agents.append((os.path.basename(agent_dir), agent))
+    finally:
+        os.chdir(previous_dir)
+
+    return agents
+
+
+def accepts_keyword(func, name):
+    """
+    Return True if 'func' has a parameter called 'name'
+    """
+    try:
+        return name in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def find_event_view(agents):
+    """
+    Return the EventView class of the first agent that has one, or None
+    """
+    for _, agent in agents:
+        module = sys.modules.get(f"{agent.__package__}.event_view")
+        if module is not None:
+            return module.EventView
+
+    return None
+
+
+class DetectorHost:
+    """
+    Runs several agents in one process. Each transaction event is parsed once and decoded
+    once into a view, e.g. its method id, the keys of its addresses and its logs by topic,
+    and the same event and view are handed to every agent that takes one. Each agent sees the
+    events in the same order as when it runs on its own, so its findings are the same
+    """
+
+    def __init__(self, agents, event_view=None):
+        # List of (agent name, agent module), in the order the agents are run
+        self.agents = agents
+        # Class of the views shared by the agents, by default the first agent's EventView
+        self.event_view = find_event_view(agents) if event_view is None else event_view
+        # Names of the agents whose entry points take the shared views
+        self.view_agents = {
+            name
+            for name, agent in agents
+            if accepts_keyword(agent.handle_transaction, "event_view")
+        }
+        self.batch_view_agents = {
+            name
+            for name, agent in agents
+            if accepts_keyword(getattr(agent, "handle_transaction_batch", None), "event_views")
+        }
+
+    @classmethod
+    def load(cls, agent_dirs):
+        return cls(load_agents(agent_dirs))
+
+    def get_event_view(self, transaction_event):
+        if self.event_view is None:
+            return None
+
+        return self.event_view(transaction_event)
+
+    def run_transaction(self, name, agent, transaction_event, event_view):
+        if event_view is not None and name in self.view_agents:
+            return agent.handle_transaction(transaction_event, event_view=event_view)
+
+        return agent.handle_transaction(transaction_event)
+
+    def handle_transaction(self, transaction_event):
+        """
+        Return the findings of every agent for a transaction, as (agent name, finding)
+        pairs in agent order
+        """
+        event_view = self.get_event_view(transaction_event)
+
+        return [
+            (name, finding)
+            for name, agent in self.agents
+            for finding in self.run_transaction(name, agent, transaction_event, event_view)
+        ]
+
+    def handle_transaction_batch(self, transaction_events):
+        """
+        Return the findings of every agent for a batch of transactions, e.g. a block, as
+        (agent name, finding) pairs in agent order. Agents that don't handle batches are
+        given the transactions one at a time
+        """
+        event_views = [self.get_event_view(tx_event) for tx_event in transaction_events]
+
+        findings = []
+        for name, agent in self.agents:
+            handle_transaction_batch = getattr(agent, "handle_transaction_batch", None)
+            if handle_transaction_batch is None:
+                agent_findings = [
+                    finding
+                    for tx_event, event_view in zip(transaction_events, event_views)
+                    for finding in self.run_transaction(name, agent, tx_event, event_view)
+                ]
+            elif self.event_view is not None and name in self.batch_view_agents:
+                agent_findings = handle_transaction_batch(
+                    transaction_events, event_views=event_views
+                )
+            else:
+                agent_findings = handle_transaction_batch(transaction_events)
+
+            findings.extend((name, finding) for finding in agent_findings)
+
+        return findings
+
+    def flush(self):
+        """
+        Return the findings the agents still hold back, e.g. on shutdown, as (agent name,
+        finding) pairs in agent order
+        """
+        return [(name, finding) for name, agent in self.agents for finding in flush_agent(agent)]
+
+
+def get_worker_module(host):
+    """
+    Return the worker module of the first hosted agent, which the host is served with
+    """
+    for _, agent in host.agents:
+        try:
+            return importlib.import_module(f"{agent.__package__}.worker")
+        except ImportError:
+            continue
+
+    raise ValueError("none of the hosted agents has a worker module")
+
+
+def create_host_server(host, address=None, port=None, socket_path=None):
+    """
+    Create a server for the agents of a host, speaking the protocol of the agents' worker.
+    Each finding line also names the agent that raised it:
+
+        {"id": 1, "agent": "uniswap-py", "finding": {...}}
+
+    The timings are recorded in the metrics of the first agent
+    """
+    worker = get_worker_module(host)
+
+    class HostWorker(worker.Worker):
+        def run(self, tx_events, flush=False):
+            findings = host.handle_transaction_batch(tx_events)
+            if flush:
+                findings = findings + host.flush()
+
+            return findings
+
+        def encode_findings(self, request_id, findings):
+            prefix = '{"id": ' + json.dumps(request_id) + ', "agent": '
+            return [
+                (prefix + json.dumps(name) + ', "finding": ' + finding.toJson() + "}\n").encode()
+                for name, finding in findings
+            ]
+
+    host_worker = HostWorker(host, metrics=host.agents[0][1].metrics)
+    address = worker.DEFAULT_HOST if address is None else address
+    port = worker.DEFAULT_PORT if port is None else port
+
+    return worker.create_server(host_worker, address, port, socket_path)
+
+
+def host_replay(host, fixture_paths, block_range=(None, None)):
+    """
+    Replay recorded transaction events through every agent of a host and yield
+    (block number, agent name, finding as a dict) in fixture order. Each line of the fixtures
+    is parsed once for all of the agents
+    """
+    from forta_agent import create_transaction_event
+
+    events = (json.loads(line) for line in read_fixture_lines(fixture_paths))
+    events = (
+        (block_number, event)
+        for block_number, event in ((get_block_number(event), event) for event in events)
+        if in_block_range(block_number, block_range)
+    )
+
+    block_number = None
+    for block_number, block_events in itertools.groupby(events, key=lambda item: item[0]):
+        tx_events = [create_transaction_event(event) for _, event in block_events]
+        for name, finding in host.handle_transaction_batch(tx_events):
+            yield block_number, name, json.loads(finding.toJson())
+
+    # Findings still held back are filed under the last block
+    for name, finding in host.flush():
+        yield block_number, name, json.loads(finding.toJson())
+
+
+def main(argv=None):
+    """
+    Replay JSONL fixtures of recorded transaction events through several Python agents in a
+    single process and write their findings as JSONL, or with --serve serve the agents live
+    """
+    parser = argparse.ArgumentParser(description="Run several Python agents in one process")
+    parser.add_argument(
+        "-a",
+        "--agent",
+        dest="agent_dirs",
+        action="append",
+        required=True,
+        help="directory of an agent, e.g. ../malicious-addr-py. Repeat for each agent",
+    )
+    parser.add_argument("fixtures", nargs="*", help="JSONL fixture files, optionally gzip compressed")
+    parser.add_argument("-o", "--output", help="file to write the findings to (default: stdout)")
+    parser.add_argument("--start-block", type=int, help="first block to replay")
+    parser.add_argument("--end-block", type=int, help="last block to replay")
+    parser.add_argument(
+        "--serve", action="store_true", help="serve the agents with the worker protocol instead"
+    )
+    parser.add_argument("--host", dest="address", help="address to serve on")
+    parser.add_argument("--port", type=int, help="port to serve on")
+    parser.add_argument("--socket", dest="socket_path", help="serve on a Unix socket instead")
+    args = parser.parse_args(argv)
+    if not args.serve and not args.fixtures:
+        parser.error("fixtures are required unless --serve is given")
+
+    fixture_paths = [os.path.abspath(path) for path in args.fixtures]
+    host = DetectorHost.load(args.agent_dirs)
+
+    if args.serve:
+        server = create_host_server(host, args.address, args.port, args.socket_path)
+        with server:
+            server.serve_forever()
+        return
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    count = 0
+    try:
+        for block_number, name, finding in host_replay(
+            host, fixture_paths, (args.start_block, args.end_block)
+        ):
+            line = {"agent": name, "block_number": block_number, "finding": finding}
+            output.write(json.dumps(line) + "\n")
+            count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"{count} findings", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
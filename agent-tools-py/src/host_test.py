@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import socket
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark import gen_address_events, gen_receipt_events, gen_swap_events
+from host import DetectorHost, create_host_server, host_replay, load_agents, main
+from replay import replay
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+AGENT_NAMES = ["uniswap-py", "uniswap-event-py", "malicious-addr-py"]
+AGENT_DIRS = [os.path.join(REPO_DIR, name) for name in AGENT_NAMES]
+
+
+@pytest.fixture
+def fixture_path(tmp_path):
+    """
+    A fixture mixing the transactions of the benchmark workloads of every agent, five
+    transactions per block
+    """
+    rng = random.Random(7)
+    events = (
+        gen_swap_events(rng, 60, None)
+        + gen_receipt_events(rng, 60, 4)
+        + gen_address_events(rng, 300, 4)
+    )
+    rng.shuffle(events)
+    for index, event in enumerate(events):
+        event["block"] = {"number": 100 + index // 5}
+
+    path = tmp_path / "blocks.jsonl"
+    path.write_text("".join(json.dumps(event) + "\n" for event in events))
+
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def host():
+    return DetectorHost.load(AGENT_DIRS)
+
+
+def test_load_agents(host):
+    """
+    Every agent should be loaded under a package of its own, and loading them should leave
+    this process' 'src' package and working directory as they were
+    """
+    agents = dict(host.agents)
+
+    assert list(agents) == AGENT_NAMES
+    assert [agent.__name__ for agent in agents.values()] == [
+        "hosted_uniswap_py.agent",
+        "hosted_uniswap_event_py.agent",
+        "hosted_malicious_addr_py.agent",
+    ]
+    uniswap, uniswap_event = agents["uniswap-py"], agents["uniswap-event-py"]
+    assert uniswap.metrics is not uniswap_event.metrics
+    assert uniswap.metrics.__name__ == "hosted_uniswap_py.metrics"
+    assert "src.agent" not in sys.modules
+    assert os.getcwd() != AGENT_DIRS[-1]
+
+
+def test_load_agents_import_forms(tmp_path):
+    """
+    Both 'import src.x' and 'from src.x import y', at import time or inside a function,
+    should import from the agent's own package, for agents whose modules have the same names
+    """
+    agent_dirs = []
+    for name in ("first", "second"):
+        src_dir = tmp_path / f"{name}-agent" / "src"
+        src_dir.mkdir(parents=True)
+        (src_dir / "helper.py").write_text(f"NAME = {name!r}\n")
+        (src_dir / "agent.py").write_text(
+            "import src.helper\n"
+            "import src.helper as helper_alias\n"
+            "from src import helper as helper_module\n"
+            "from src.helper import NAME\n"
+            "\n"
+            "\n"
+            "def get_name():\n"
+            "    import src.helper\n"
+            "    from src.helper import NAME\n"
+            "\n"
+            "    return src.helper.NAME, NAME\n"
+        )
+        agent_dirs.append(str(tmp_path / f"{name}-agent"))
+
+    agents = dict(load_agents(agent_dirs))
+
+    for name in ("first", "second"):
+        agent = agents[f"{name}-agent"]
+        assert agent.src.__name__ == agent.__package__
+        assert agent.src.helper.NAME == name
+        assert agent.helper_alias is agent.helper_module is agent.src.helper
+        assert agent.NAME == name
+        assert agent.get_name() == (name, name)
+    assert "src.helper" not in sys.modules
+
+
+def test_host_shares_event_views():
+    """
+    Each event should be decoded into a view once, and the same view handed to every agent
+    that takes one. Agents that don't take views should still be called
+    """
+    seen = []
+
+    def handle_transaction(transaction_event, event_view=None):
+        seen.append(("handle", transaction_event, event_view))
+        return []
+
+    def handle_transaction_batch(transaction_events, event_views=None):
+        seen.append(("batch", transaction_events, event_views))
+        return ["finding"]
+
+    def handle_plain(transaction_event):
+        seen.append(("plain", transaction_event, None))
+        return []
+
+    built = []
+
+    def event_view(transaction_event):
+        built.append(transaction_event)
+        return ("view", transaction_event)
+
+    host = DetectorHost(
+        [
+            ("one", SimpleNamespace(handle_transaction=handle_transaction)),
+            (
+                "two",
+                SimpleNamespace(
+                    handle_transaction=handle_transaction,
+                    handle_transaction_batch=handle_transaction_batch,
+                ),
+            ),
+            ("three", SimpleNamespace(handle_transaction=handle_plain)),
+        ],
+        event_view=event_view,
+    )
+
+    assert host.handle_transaction_batch(["a", "b"]) == [("two", "finding")]
+    assert built == ["a", "b"]
+    views = [("view", "a"), ("view", "b")]
+    assert seen == [
+        ("handle", "a", views[0]),
+        ("handle", "b", views[1]),
+        ("batch", ["a", "b"], views),
+        ("plain", "a", None),
+        ("plain", "b", None),
+    ]
+
+
+def test_host_findings_match_separate_agents(host, fixture_path):
+    """
+    Each agent should raise the same findings, in the same order, when hosted with the other
+    agents as when it is replayed on its own
+    """
+    hosted = {name: [] for name in AGENT_NAMES}
+    for block_number, name, finding in host_replay(host, [fixture_path]):
+        hosted[name].append((block_number, finding))
+
+    for name, agent_dir in zip(AGENT_NAMES, AGENT_DIRS):
+        separate = list(replay(agent_dir, [fixture_path], jobs=1))
+        assert separate, name
+        assert hosted[name] == separate, name
+
+
+def test_host_cli(fixture_path, tmp_path):
+    output = tmp_path / "findings.jsonl"
+
+    main(["-a", AGENT_DIRS[0], "-a", AGENT_DIRS[2], fixture_path, "-o", str(output)])
+
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    assert {line["agent"] for line in lines} == {"uniswap-py", "malicious-addr-py"}
+    assert all(line["finding"]["alertId"] for line in lines)
+
+
+def test_host_serve(host, fixture_path):
+    """
+    Serving the host should answer a request with the findings of every agent, each naming
+    the agent that raised it, the same as a replay of the same events
+    """
+    with open(fixture_path) as f:
+        events = [json.loads(line) for line in f]
+    block_number = events[0]["block"]["number"]
+    events = [event for event in events if event["block"]["number"] == block_number]
+
+    server = create_host_server(host, "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with socket.create_connection(server.server_address) as conn:
+            conn.sendall(json.dumps({"id": 3, "events": events}).encode() + b"\n")
+            responses = []
+            with conn.makefile("rb") as f:
+                for line in f:
+                    responses.append(json.loads(line))
+                    if responses[-1].get("done"):
+                        break
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert responses[-1]["done"]
+    assert responses[-1]["events"] == len(events)
+    from forta_agent import create_transaction_event
+
+    expected = host.handle_transaction_batch([create_transaction_event(e) for e in events])
+    assert [(r["agent"], r["finding"]["alertId"]) for r in responses[:-1]] == [
+        (name, json.loads(finding.toJson())["alertId"]) for name, finding in expected
+    ]
@@ -0,0 +1,285 @@
+import argparse
+import gzip
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+
+# Number of fixture lines handed to a worker at a time
+DEFAULT_CHUNK_SIZE = 1000
+# Most chunks read ahead of the results, per worker. Fixtures are read as the workers get
+# through them, so a month of them is never held in memory at once
+MAX_PENDING_PER_JOB = 2
+
+# Set in each worker process by init_worker()
+AGENT = None
+BLOCK_RANGE = None
+# Last block replayed by this worker, which findings flushed at the end are filed under
+LAST_BLOCK = None
+
+
+def load_agent(agent_dir):
+    """
+    Import the agent module of a Python agent directory, the same way the Forta runner does.
+    The agents read their ABI files relative to the working directory and import their
+    modules from the 'src' package, so this changes the working directory and sys.path of
+    the current process
+    """
+    agent_dir = os.path.abspath(agent_dir)
+    os.chdir(agent_dir)
+    sys.path.insert(0, agent_dir)
+
+    return importlib.import_module("src.agent")
+
+
+def open_fixture(path):
+    """
+    Open a fixture file for reading. Files ending in .gz are gzip compressed
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+
+    return open(path, "r")
+
+
+def read_fixture_lines(paths):
+    """
+    Stream the non-empty lines of each fixture file, in order
+    """
+    for path in paths:
+        with open_fixture(path) as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def read_chunks(lines, chunk_size):
+    """
+    Group lines into lists of at most 'chunk_size' lines
+    """
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_block_number(event):
+    """
+    Return the block number of a recorded transaction event as an integer, or None
+    """
+    block_number = event.get("block", {}).get("number")
+    if block_number is None:
+        receipt = event.get("receipt", {})
+        block_number = receipt.get("blockNumber", receipt.get("block_number"))
+
+    if isinstance(block_number, str):
+        return int(block_number, 0)
+
+    return block_number
+
+
+def in_block_range(block_number, block_range):
+    start_block, end_block = block_range
+    if block_number is None:
+        return start_block is None and end_block is None
+    if start_block is not None and block_number < start_block:
+        return False
+    if end_block is not None and block_number > end_block:
+        return False
+
+    return True
+
+
+def imap_bounded(pool, func, items, max_pending):
+    """
+    Same as pool.imap, but with at most 'max_pending' items read from 'items' whose results
+    haven't been returned yet. pool.imap reads its input as fast as it can, which would queue
+    the whole input in memory
+    """
+    items = iter(items)
+    slots = threading.Semaphore(max_pending)
+    closed = threading.Event()
+
+    def read_items():
+        # Run by the pool's task thread, which blocks here until a result is taken
+        while True:
+            slots.acquire()
+            if closed.is_set():
+                return
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            yield item
+
+    try:
+        for result in pool.imap(func, read_items()):
+            slots.release()
+            yield result
+    finally:
+        # Lets the task thread finish if the results stop being read early
+        closed.set()
+        slots.release()
+
+
+def init_worker(agent_dir, block_range):
+    """
+    Load the agent once per worker process so that it stays warm for every chunk
+    """
+    global AGENT
+    global BLOCK_RANGE
+
+    AGENT = load_agent(agent_dir)
+    BLOCK_RANGE = block_range
+
+
+def run_agent(agent, tx_events):
+    """
+    Run the transactions of one block through the agent, in a single batch if the agent
+    supports it
+    """
+    handle_transaction_batch = getattr(agent, "handle_transaction_batch", None)
+    if handle_transaction_batch is not None:
+        return handle_transaction_batch(tx_events)
+
+    findings = []
+    for tx_event in tx_events:
+        findings.extend(agent.handle_transaction(tx_event))
+
+    return findings
+
+
+def flush_agent(agent):
+    """
+    Return the findings an agent still holds back, e.g. alerts waiting on a lookup, if it
+    has a flush_findings() function
+    """
+    flush_findings = getattr(agent, "flush_findings", None)
+    if flush_findings is None:
+        return []
+
+    return flush_findings()
+
+
+def replay_chunk(lines):
+    """
+    Replay a chunk of fixture lines through the agent loaded in this worker. Consecutive
+    transactions from the same block are handled as one batch. Returns a list of
+    (block number, finding as a dict) pairs in fixture order
+    """
+    from forta_agent import create_transaction_event
+
+    global LAST_BLOCK
+
+    events = []
+    for line in lines:
+        event = json.loads(line)
+        block_number = get_block_number(event)
+        if in_block_range(block_number, BLOCK_RANGE):
+            events.append((block_number, event))
+
+    results = []
+    for block_number, block_events in itertools.groupby(events, key=lambda item: item[0]):
+        tx_events = [create_transaction_event(event) for _, event in block_events]
+        for finding in run_agent(AGENT, tx_events):
+            results.append((block_number, json.loads(finding.toJson())))
+        LAST_BLOCK = block_number
+
+    return results
+
+
+def flush_worker():
+    """
+    Return the findings the agent loaded in this worker still holds back, as (block number,
+    finding as a dict) pairs filed under the last block replayed
+    """
+    return [(LAST_BLOCK, json.loads(finding.toJson())) for finding in flush_agent(AGENT)]
+
+
+def get_agent_state(agent_dir):
+    """
+    Return whether an agent, as configured, keeps state from one transaction to the next.
+    Agents declare this with is_stateful(), and agents that don't are taken to be stateless
+    """
+    agent = load_agent(agent_dir)
+    is_stateful = getattr(agent, "is_stateful", None)
+
+    return bool(is_stateful and is_stateful())
+
+
+def is_stateful_agent(agent_dir):
+    """
+    Check whether an agent is stateful in a separate process, so that loading it doesn't
+    change the working directory or modules of this one
+    """
+    with multiprocessing.Pool(1) as pool:
+        return pool.apply(get_agent_state, (os.path.abspath(agent_dir),))
+
+
+def replay(agent_dir, fixture_paths, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE, block_range=(None, None)):
+    """
+    Replay recorded transaction events through an agent on a pool of worker processes and
+    yield (block number, finding as a dict) pairs. Chunks are handed out in fixture order
+    and their results are collected in that same order. Only a few chunks per worker are
+    read ahead, so the fixtures are streamed however long they are. Each worker starts from an empty
+    state, so a stateful agent is replayed on a single worker, which sees every transaction
+    in order. Findings the agent still holds back at the end are flushed from it and
+    yielded last
+    """
+    agent_dir = os.path.abspath(agent_dir)
+    if jobs != 1 and is_stateful_agent(agent_dir):
+        jobs = 1
+
+    fixture_paths = [os.path.abspath(path) for path in fixture_paths]
+    chunks = read_chunks(read_fixture_lines(fixture_paths), chunk_size)
+
+    max_pending = (jobs or os.cpu_count() or 1) * MAX_PENDING_PER_JOB
+    with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(agent_dir, block_range)) as pool:
+        for results in imap_bounded(pool, replay_chunk, chunks, max_pending):
+            yield from results
+
+        # Only stateful agents hold findings back, and they are replayed on a single worker
+        yield from pool.apply(flush_worker)
+
+
+def main(argv=None):
+    """
+    Replay JSONL fixtures of recorded transaction events through a Python agent and write
+    its findings as JSONL
+    """
+    parser = argparse.ArgumentParser(description="Replay recorded transactions through a Python agent")
+    parser.add_argument("agent_dir", help="directory of the agent, e.g. ../malicious-addr-py")
+    parser.add_argument("fixtures", nargs="+", help="JSONL fixture files, optionally gzip compressed")
+    parser.add_argument("-o", "--output", help="file to write the findings to (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="lines per work item")
+    parser.add_argument("--start-block", type=int, help="first block to replay")
+    parser.add_argument("--end-block", type=int, help="last block to replay")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    count = 0
+    try:
+        for block_number, finding in replay(
+            args.agent_dir,
+            args.fixtures,
+            args.jobs,
+            args.chunk_size,
+            (args.start_block, args.end_block),
+        ):
+            output.write(json.dumps({"block_number": block_number, "finding": finding}) + "\n")
+            count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"{count} findings", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import gzip
+import json
+import os
+import shutil
+from multiprocessing.pool import ThreadPool
+
+import pytest
+
+from replay import get_block_number, imap_bounded, main, replay
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MALICIOUS_ADDR_AGENT = os.path.join(REPO_DIR, "malicious-addr-py")
+
+MALICIOUS_ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+CLEAN_ADDR = "0x000000000000000000000000000000000000dead"
+
+
+def gen_event(block_number, tx_index, malicious):
+    """
+    Generate a recorded transaction event, involving the malicious address or not
+    """
+    addresses = [CLEAN_ADDR, MALICIOUS_ADDR] if malicious else [CLEAN_ADDR]
+    return {
+        "transaction": {
+            "hash": f"0x{block_number:032x}{tx_index:032x}",
+            "from": addresses[-1],
+            "to": CLEAN_ADDR,
+            "value": "0x0",
+            "data": "0x",
+        },
+        "receipt": {"blockNumber": hex(block_number), "logs": []},
+        "block": {"number": block_number},
+        "addresses": {addr: True for addr in addresses},
+    }
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    """
+    Two fixture files, one gzip compressed, covering blocks 100 to 119 with a malicious
+    transaction every third transaction
+    """
+    events = [
+        gen_event(block_number, tx_index, (block_number * 4 + tx_index) % 3 == 0)
+        for block_number in range(100, 120)
+        for tx_index in range(4)
+    ]
+
+    first = tmp_path / "blocks-100.jsonl"
+    first.write_text("".join(json.dumps(event) + "\n" for event in events[:40]))
+
+    second = tmp_path / "blocks-110.jsonl.gz"
+    with gzip.open(second, "wt") as f:
+        f.writelines(json.dumps(event) + "\n" for event in events[40:])
+
+    return [str(first), str(second)], events
+
+
+def test_get_block_number():
+    assert get_block_number({"block": {"number": 12}}) == 12
+    assert get_block_number({"receipt": {"blockNumber": "0xc"}}) == 12
+    assert get_block_number({}) is None
+
+
+def test_replay_is_deterministic(fixtures):
+    """
+    Findings should come out in fixture order no matter how many workers are used
+    """
+    paths, events = fixtures
+    expected_blocks = [get_block_number(event) for event in events if len(event["addresses"]) == 2]
+
+    single = list(replay(MALICIOUS_ADDR_AGENT, paths, jobs=1, chunk_size=1000))
+    sharded = list(replay(MALICIOUS_ADDR_AGENT, paths, jobs=3, chunk_size=3))
+
+    assert [block_number for block_number, _ in single] == expected_blocks
+    assert sharded == single
+    for _, finding in single:
+        assert finding["alertId"] == "AE-MALICIOUS-ADDR"
+        assert finding["metadata"]["malicious_addresses"] == [MALICIOUS_ADDR]
+
+
+def test_replay_block_range(fixtures):
+    paths, events = fixtures
+
+    results = list(replay(MALICIOUS_ADDR_AGENT, paths, jobs=2, chunk_size=5, block_range=(105, 111)))
+
+    assert results
+    assert all(105 <= block_number <= 111 for block_number, _ in results)
+
+
+def test_replay_cli(fixtures, tmp_path):
+    paths, events = fixtures
+    output = tmp_path / "findings.jsonl"
+
+    main([MALICIOUS_ADDR_AGENT, *paths, "-o", str(output), "-j", "2"])
+
+    lines = output.read_text().splitlines()
+    assert len(lines) == sum(1 for event in events if len(event["addresses"]) == 2)
+    assert json.loads(lines[0])["finding"]["alertId"] == "AE-MALICIOUS-ADDR"
+
+
+STATEFUL_AGENT = '''
+import time
+
+from forta_agent import Finding, FindingSeverity, FindingType
+
+# Number of transactions seen from each sender
+SEEN = {}
+
+
+def is_stateful():
+    return True
+
+
+def handle_transaction(transaction_event):
+    # Slow enough that every worker of a pool gets some of the chunks
+    time.sleep(0.002)
+
+    sender = transaction_event.from_
+    SEEN[sender] = SEEN.get(sender, 0) + 1
+    if SEEN[sender] % 3:
+        return []
+
+    return [
+        Finding(
+            {
+                "name": "Third transaction",
+                "description": f"{sender} sent {SEEN[sender]} transactions",
+                "alert_id": "AE-TEST-THIRD",
+                "type": FindingType.Info,
+                "severity": FindingSeverity.Info,
+            }
+        )
+    ]
+
+
+def flush_findings():
+    return [
+        Finding(
+            {
+                "name": "Remaining transactions",
+                "description": f"{sender} sent {count % 3} more transactions",
+                "alert_id": "AE-TEST-REST",
+                "type": FindingType.Info,
+                "severity": FindingSeverity.Info,
+            }
+        )
+        for sender, count in sorted(SEEN.items())
+        if count % 3
+    ]
+'''
+
+
+def test_replay_stateful_agent(fixtures, tmp_path):
+    """
+    An agent that keeps state between transactions should give the same findings whatever
+    the number of workers, followed by the findings it flushes at the end
+    """
+    paths, events = fixtures
+    agent_dir = tmp_path / "stateful-agent"
+    (agent_dir / "src").mkdir(parents=True)
+    (agent_dir / "src" / "agent.py").write_text(STATEFUL_AGENT)
+
+    single = list(replay(str(agent_dir), paths, jobs=1, chunk_size=1))
+    sharded = list(replay(str(agent_dir), paths, jobs=4, chunk_size=1))
+
+    # One finding for every third transaction of each sender, then one for each sender with
+    # transactions left over
+    senders = [event["transaction"]["from"] for event in events]
+    counts = [senders.count(sender) for sender in set(senders)]
+    rest = [count for count in counts if count % 3]
+    assert len(single) == sum(count // 3 for count in counts) + len(rest)
+    assert [finding["alertId"] for _, finding in single[len(single) - len(rest):]] == [
+        "AE-TEST-REST"
+    ] * len(rest)
+    assert single[-1][0] == events[-1]["block"]["number"]
+    assert sharded == single
+
+
+def test_replay_flushes_finding_filter(fixtures, tmp_path):
+    """
+    A replay that ends before the finding filter's window has passed should still end with
+    the summary of the findings the filter held back
+    """
+    paths, events = fixtures
+    agent_dir = tmp_path / "malicious-addr-py"
+    shutil.copytree(
+        os.path.join(MALICIOUS_ADDR_AGENT, "src"),
+        agent_dir / "src",
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    config_path = agent_dir / "src" / "config" / "agent-settings.json"
+    config = json.loads(config_path.read_text())
+    config["finding_filter"]["enabled"] = True
+    config_path.write_text(json.dumps(config))
+
+    findings = [finding for _, finding in replay(str(agent_dir), paths, jobs=1)]
+
+    # The 100 block window starts at block 100 and the fixtures end at block 119
+    malicious = [event for event in events if MALICIOUS_ADDR in event["addresses"]]
+    assert [finding["alertId"] for finding in findings] == [
+        "AE-MALICIOUS-ADDR",
+        "AE-MALICIOUS-ADDR-SUMMARY",
+    ]
+    assert findings[-1]["metadata"]["count"] == len(malicious)
+
+
+def test_imap_bounded():
+    """
+    A long input should be read only a few items ahead of the results taken, and all of its
+    results should come back in order. Stopping early should not hang the pool
+    """
+    read = [0]
+
+    def gen_items(count):
+        for item in range(count):
+            read[0] += 1
+            yield item
+
+    with ThreadPool(4) as pool:
+        results = []
+        most_ahead = 0
+        for result in imap_bounded(pool, abs, gen_items(20000), 8):
+            results.append(result)
+            most_ahead = max(most_ahead, read[0] - len(results))
+        assert results == list(range(20000))
+        assert most_ahead <= 8
+
+        read[0] = 0
+        stopped = imap_bounded(pool, abs, gen_items(20000), 8)
+        assert [next(stopped) for _ in range(3)] == [0, 1, 2]
+        stopped.close()
+        assert read[0] <= 3 + 8
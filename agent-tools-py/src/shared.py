@@ -0,0 +1,84 @@
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The one copy of the shared modules that is edited and tested. Each agent is built from its
+# own directory, so the agents carry a copy of these in their src/ that is kept in sync
+SHARED_DIR = os.path.join(REPO_DIR, "agent-tools-py", "shared", "src")
+
+# Shared module files and the agents that carry a copy of them
+SHARED_FILES = {
+    "addresses.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+    "event_view.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+    "finding_filter.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+    "metrics.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+    "slow_capture.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+    "swap_window.py": ("uniswap-py", "uniswap-event-py"),
+    "windows.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+    "worker.py": ("malicious-addr-py", "uniswap-py", "uniswap-event-py"),
+}
+
+
+def get_copies(repo_dir=REPO_DIR, shared_dir=SHARED_DIR):
+    """
+    Yield the path of each shared module and the path of its copy in an agent
+    """
+    for name, agents in sorted(SHARED_FILES.items()):
+        for agent in agents:
+            yield os.path.join(shared_dir, name), os.path.join(repo_dir, agent, "src", name)
+
+
+def find_drift(repo_dir=REPO_DIR, shared_dir=SHARED_DIR):
+    """
+    Return the paths of the agents' copies of the shared modules that are missing or differ
+    from the shared module
+    """
+    return [
+        copy
+        for source, copy in get_copies(repo_dir, shared_dir)
+        if not os.path.exists(copy) or not filecmp.cmp(source, copy, shallow=False)
+    ]
+
+
+def sync(repo_dir=REPO_DIR, shared_dir=SHARED_DIR):
+    """
+    Copy the shared modules over the agents' copies that drifted and return their paths
+    """
+    drifted = find_drift(repo_dir, shared_dir)
+    for source, copy in get_copies(repo_dir, shared_dir):
+        if copy in drifted:
+            shutil.copyfile(source, copy)
+
+    return drifted
+
+
+def main(argv=None):
+    """
+    Copy the shared modules into the agents, or with --check exit with status 1 if any copy
+    differs from them
+    """
+    parser = argparse.ArgumentParser(description="Sync the shared modules into the agents")
+    parser.add_argument(
+        "--check", action="store_true", help="only report copies that differ, don't write them"
+    )
+    args = parser.parse_args(argv)
+
+    if args.check:
+        drifted = find_drift(REPO_DIR, SHARED_DIR)
+        for path in drifted:
+            path = os.path.relpath(path, REPO_DIR)
+            print(f"{path} differs from the shared module", file=sys.stderr)
+        if drifted:
+            print("Run 'python3 -m src.shared' to update the copies", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    for path in sync(REPO_DIR, SHARED_DIR):
+        print(f"Updated {os.path.relpath(path, REPO_DIR)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+import shared
+from shared import SHARED_FILES, find_drift, main, sync
+
+
+@pytest.fixture
+def repo_dir(tmp_path):
+    """
+    A copy of the shared modules and of the agents that carry them
+    """
+    shared_dir = tmp_path / "shared"
+    shared_dir.mkdir()
+    for name, agents in SHARED_FILES.items():
+        (shared_dir / name).write_text(f"# {name}\n")
+        for agent in agents:
+            os.makedirs(tmp_path / agent / "src", exist_ok=True)
+            (tmp_path / agent / "src" / name).write_text(f"# {name}\n")
+
+    return tmp_path
+
+
+def test_agents_match_shared_modules():
+    # Fails when a copy in an agent was edited instead of the module in shared/src, or the
+    # other way around. Run 'python3 -m src.shared' from agent-tools-py to update the copies
+    assert find_drift() == []
+
+
+def test_sync(repo_dir):
+    shared_dir = str(repo_dir / "shared")
+    assert find_drift(str(repo_dir), shared_dir) == []
+
+    edited = repo_dir / "uniswap-py" / "src" / "metrics.py"
+    edited.write_text("# metrics.py, edited\n")
+    missing = repo_dir / "malicious-addr-py" / "src" / "worker.py"
+    missing.unlink()
+    assert find_drift(str(repo_dir), shared_dir) == [str(edited), str(missing)]
+
+    assert sync(str(repo_dir), shared_dir) == [str(edited), str(missing)]
+    assert edited.read_text() == "# metrics.py\n"
+    assert missing.read_text() == "# worker.py\n"
+    assert find_drift(str(repo_dir), shared_dir) == []
+
+
+def test_check(repo_dir, monkeypatch):
+    monkeypatch.setattr(shared, "REPO_DIR", str(repo_dir))
+    monkeypatch.setattr(shared, "SHARED_DIR", str(repo_dir / "shared"))
+    main(["--check"])
+
+    (repo_dir / "uniswap-event-py" / "src" / "swap_window.py").write_text("")
+    with pytest.raises(SystemExit) as e:
+        main(["--check"])
+    assert e.value.code == 1
@@ -0,0 +1,330 @@
+from hashlib import blake2b
+
+from src.addresses import parse_address
+
+# The content hash is the sum of the hashes of every entry modulo 2**128, so it doesn't depend
+# on the order entries were added in and is updated in place as entries change
+ENTRY_HASH_SIZE = 16
+HASH_MODULUS = 1 << (8 * ENTRY_HASH_SIZE)
+
+# Separator used for multiple tags given as a single string, e.g. "heist;exploit"
+TAG_SEPARATOR = ";"
+
+
+def split_tags(tags):
+    """
+    Return tags given as a list or as a single separated string as a list.
+    Raises ValueError if they are neither
+    """
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        return [tag.strip() for tag in tags.split(TAG_SEPARATOR) if tag.strip()]
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise ValueError(f"tags must be a string or a list of strings, not {tags!r}")
+
+    return list(tags)
+
+
+def parse_delta_address(addr, version, position):
+    """
+    Return the 20-byte key of an address of a delta. 'position' names the entry in errors
+    """
+    key = parse_address(addr) if isinstance(addr, str) else None
+    if key is None:
+        raise ValueError(f"Invalid address in delta {version}, {position}: {addr!r}")
+
+    return key
+
+
+def get_entry_hash(key, tags):
+    """
+    Hash a 20-byte address together with its tags. Tags are sorted and joined by newlines
+    """
+    data = key + "\n".join(sorted(tags)).encode()
+    return int.from_bytes(blake2b(data, digest_size=ENTRY_HASH_SIZE).digest(), "big")
+
+
+class AddressDelta:
+    """
+    Changes that take an address store from 'base_version' to 'version'. 'changes' maps
+    20-byte addresses to their new frozenset of tags, or to None if they are removed.
+    'content_hash', if set, is the content hash of the store once the delta is applied
+    """
+
+    __slots__ = ("version", "base_version", "changes", "content_hash")
+
+    def __init__(self, version, base_version, changes, content_hash=None):
+        self.version = version
+        self.base_version = base_version
+        self.changes = changes
+        self.content_hash = content_hash
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Parse a delta from a dict such as:
+        {"version": 2, "base_version": 1, "add": [{"address": "0x...", "tags": ["heist"]}],
+         "remove": ["0x..."], "hash": "..."}
+        Raises ValueError if it isn't a valid delta
+        """
+        try:
+            version = int(data["version"])
+            base_version = int(data.get("base_version", version - 1))
+            content_hash = data.get("hash")
+            if content_hash is not None:
+                content_hash = int(content_hash, 16)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid delta: {e!r}")
+
+        if base_version >= version:
+            raise ValueError(f"Invalid delta: version {version} doesn't follow {base_version}")
+
+        remove = data.get("remove", [])
+        add = data.get("add", [])
+        if not isinstance(remove, list) or not isinstance(add, list):
+            raise ValueError(f"Invalid delta {version}: 'add' and 'remove' must be lists")
+
+        changes = {}
+        for index, addr in enumerate(remove):
+            changes[parse_delta_address(addr, version, f"remove[{index}]")] = None
+
+        for index, entry in enumerate(add):
+            position = f"add[{index}]"
+            if not isinstance(entry, dict):
+                raise ValueError(f"Invalid entry in delta {version}, {position}: {entry!r}")
+
+            key = parse_delta_address(entry.get("address"), version, position)
+            try:
+                tags = split_tags(entry.get("tags"))
+            except ValueError as e:
+                raise ValueError(f"Invalid tags in delta {version}, {position}: {e}")
+            changes[key] = frozenset(tags)
+
+        return cls(version, base_version, changes, content_hash)
+
+    @classmethod
+    def between(cls, old_store, new_store, version, base_version=None):
+        """
+        Return the delta that takes 'old_store' to 'new_store', e.g. to publish the changes
+        between two exports of a feed
+        """
+        changes = {
+            key: tags for key, tags in new_store.items() if old_store.lookup_set(key) != tags
+        }
+        for key, _ in old_store.items():
+            if new_store.lookup_set(key) is None:
+                changes[key] = None
+
+        if base_version is None:
+            base_version = version - 1
+
+        return cls(version, base_version, changes, new_store.get_content_hash())
+
+    def to_dict(self):
+        data = {
+            "version": self.version,
+            "base_version": self.base_version,
+            "add": [
+                {"address": "0x" + key.hex(), "tags": sorted(tags)}
+                for key, tags in self.changes.items()
+                if tags is not None
+            ],
+            "remove": ["0x" + key.hex() for key, tags in self.changes.items() if tags is None],
+        }
+        if self.content_hash is not None:
+            data["hash"] = f"{self.content_hash:032x}"
+
+        return data
+
+
+class AddressStore:
+    """
+    Deduplicated set of tagged addresses. Entries are keyed on the 20-byte address value, so
+    membership checks are a single hash lookup no matter how many addresses are stored.
+    Deltas are applied in place, and the store keeps its version and a content hash so that
+    copies of it can check they hold the same entries
+    """
+
+    def __init__(self):
+        # 20-byte address -> frozenset of tags
+        self._entries = {}
+        # Most addresses share the same handful of tag combinations, so keep one copy of each
+        self._tag_sets = {}
+        # Version of the last delta applied, 0 for a store built from a feed
+        self.version = 0
+        # Sum of the entry hashes, only computed once it is first asked for and then kept up
+        # to date as entries change
+        self._hash = None
+
+    @classmethod
+    def from_addresses(cls, addrs, tags=()):
+        """
+        Build a store from an iterable of address strings that all share the same tags
+        """
+        store = cls()
+        for addr in addrs:
+            store.add(addr, tags)
+
+        return store
+
+    def _intern_tags(self, tags):
+        tag_set = frozenset(tags)
+        return self._tag_sets.setdefault(tag_set, tag_set)
+
+    def add(self, addr, tags=()):
+        """
+        Add an address to the store. Adding an address that is already present merges the
+        new tags into the existing ones.
+        Raises ValueError if the address is not valid
+        """
+        key = parse_address(addr)
+        if key is None:
+            raise ValueError(f"Invalid address: {addr!r}")
+
+        existing = self._entries.get(key)
+        if existing is not None:
+            tags = existing.union(tags)
+
+        self._set(key, self._intern_tags(tags))
+
+    def remove(self, addr):
+        """
+        Remove an address from the store. Returns False if it wasn't stored
+        """
+        key = parse_address(addr)
+        if key not in self._entries:
+            return False
+
+        self._set(key, None)
+        return True
+
+    def _set(self, key, tags):
+        """
+        Set the tags of a 20-byte key, or remove it if 'tags' is None, keeping the content
+        hash up to date
+        """
+        if self._hash is not None:
+            self._hash = self._get_hash_change(self._hash, key, tags)
+
+        if tags is None:
+            self._entries.pop(key, None)
+        else:
+            self._entries[key] = tags
+
+    def _get_hash_change(self, content_hash, key, tags):
+        existing = self._entries.get(key)
+        if existing is not None:
+            content_hash -= get_entry_hash(key, existing)
+        if tags is not None:
+            content_hash += get_entry_hash(key, tags)
+
+        return content_hash % HASH_MODULUS
+
+    def get_content_hash(self):
+        """
+        Return the content hash of the store as an int. Two stores with the same addresses
+        and tags have the same hash, whatever order they were built in
+        """
+        if self._hash is None:
+            self._hash = (
+                sum(get_entry_hash(key, tags) for key, tags in self._entries.items())
+                % HASH_MODULUS
+            )
+
+        return self._hash
+
+    @property
+    def content_hash(self):
+        return f"{self.get_content_hash():032x}"
+
+    def apply_delta(self, delta):
+        """
+        Apply a delta to the store in place. An address that is added takes the tags given in
+        the delta, replacing any it had. Returns False if the store already has the delta's
+        version. Raises ValueError, leaving the store unchanged, if the delta was made against
+        another version or the content hash after applying it wouldn't match the delta's
+        """
+        if delta.version <= self.version:
+            return False
+
+        if delta.base_version != self.version:
+            raise ValueError(
+                f"Delta from version {delta.base_version} to {delta.version} doesn't apply to "
+                f"version {self.version}"
+            )
+
+        if delta.content_hash is not None:
+            # Check the hash the delta would give before changing anything
+            content_hash = self.get_content_hash()
+            for key, tags in delta.changes.items():
+                content_hash = self._get_hash_change(content_hash, key, tags)
+
+            if content_hash != delta.content_hash:
+                raise ValueError(
+                    f"Content hash after delta {delta.version} would be {content_hash:032x}, "
+                    f"expected {delta.content_hash:032x}"
+                )
+
+        for key, tags in delta.changes.items():
+            self._set(key, None if tags is None else self._intern_tags(tags))
+        self.version = delta.version
+
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def items(self):
+        """
+        Return the stored (20-byte address, frozenset of tags) pairs
+        """
+        return self._entries.items()
+
+    def __contains__(self, addr):
+        return parse_address(addr) in self._entries
+
+    def lookup_set(self, key):
+        """
+        Return the frozenset of tags for a 20-byte key, or None if it is not stored
+        """
+        return self._entries.get(key)
+
+    def lookup(self, key):
+        """
+        Return a sorted list of the tags for a 20-byte key, or None if it is not stored
+        """
+        tags = self._entries.get(key)
+        if tags is None:
+            return None
+
+        return sorted(tags)
+
+    def get_tags(self, addr):
+        """
+        Return a sorted list of the tags for an address, or None if the address is not stored
+        """
+        return self.lookup(parse_address(addr))
+
+    def match(self, addresses):
+        """
+        Check every address in a single pass and return a dict of the ones that are in the
+        store, mapped to their sorted tags. Order follows the order of 'addresses'
+        """
+        # Addresses are parsed each time rather than kept in a table of normalized addresses.
+        # Most of the addresses of a transaction are only checked once, and a table miss costs
+        # more than parsing
+        return self.match_keys({addr: parse_address(addr) for addr in addresses})
+
+    def match_keys(self, address_keys):
+        """
+        Same as 'match', for a dict of addresses already parsed into their 20-byte keys
+        """
+        entries = self._entries
+        matches = {}
+        for addr, key in address_keys.items():
+            tags = entries.get(key)
+            if tags is not None:
+                matches[addr] = sorted(tags)
+
+        return matches
@@ -0,0 +1,164 @@
+import pytest
+
+from address_store import AddressDelta, AddressStore
+
+
+ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+OTHER_ADDR = "0x905315602ed9a854e325f692ff82f58799beab57"
+
+
+def test_store_deduplicates():
+    """
+    Loading the same address more than once should only store it once and merge its tags
+    """
+    store = AddressStore.from_addresses([ADDR, ADDR.upper().replace("0X", "0x")], ["heist"])
+    store.add(ADDR, ["exploit"])
+
+    assert len(store) == 1
+    assert ADDR in store
+    assert OTHER_ADDR not in store
+    assert store.get_tags(ADDR) == ["exploit", "heist"]
+    assert store.get_tags(OTHER_ADDR) is None
+
+
+def test_store_rejects_invalid_address():
+    """
+    Adding something that isn't an address should raise a ValueError
+    """
+    store = AddressStore()
+
+    with pytest.raises(ValueError):
+        store.add("0x1234")
+
+
+def test_store_match():
+    """
+    match() should return only the stored addresses, in the order they were given
+    """
+    store = AddressStore()
+    store.add(ADDR, ["heist"])
+    store.add(OTHER_ADDR, ["exploit"])
+
+    matches = store.match([OTHER_ADDR, "0x000000000000000000000000000000000000dead", ADDR, None])
+
+    assert list(matches) == [OTHER_ADDR, ADDR]
+    assert matches[ADDR] == ["heist"]
+    assert matches[OTHER_ADDR] == ["exploit"]
+
+
+def gen_delta(version, add=(), remove=(), content_hash=None):
+    data = {
+        "version": version,
+        "add": [{"address": addr, "tags": tags} for addr, tags in add],
+        "remove": list(remove),
+    }
+    if content_hash is not None:
+        data["hash"] = content_hash
+
+    return AddressDelta.from_dict(data)
+
+
+def test_content_hash():
+    """
+    Stores with the same entries should have the same hash whatever order they were built in,
+    and the hash should follow adds and removes
+    """
+    store = AddressStore()
+    store.add(ADDR, ["heist"])
+    store.add(OTHER_ADDR, ["exploit"])
+    content_hash = store.content_hash
+
+    other_store = AddressStore()
+    other_store.add(OTHER_ADDR, ["exploit"])
+    assert other_store.content_hash != content_hash
+    other_store.add(ADDR, ["heist"])
+    assert other_store.content_hash == content_hash
+
+    assert other_store.remove(OTHER_ADDR)
+    assert not other_store.remove(OTHER_ADDR)
+    assert other_store.content_hash == AddressStore.from_addresses([ADDR], ["heist"]).content_hash
+
+
+def test_apply_delta():
+    """
+    A delta should replace the tags of the addresses it adds, remove the others and move the
+    store to its version. Applying it again should do nothing
+    """
+    store = AddressStore.from_addresses([ADDR], ["heist"])
+    expected = AddressStore.from_addresses([OTHER_ADDR], ["exploit"])
+    delta = gen_delta(1, add=[(OTHER_ADDR, ["exploit"])], remove=[ADDR])
+
+    assert store.apply_delta(delta)
+    assert store.version == 1
+    assert ADDR not in store
+    assert store.get_tags(OTHER_ADDR) == ["exploit"]
+    assert store.content_hash == expected.content_hash
+    assert not store.apply_delta(delta)
+
+
+def test_apply_invalid_delta():
+    """
+    A delta made against another version, or whose hash doesn't match, should leave the
+    store unchanged
+    """
+    store = AddressStore.from_addresses([ADDR], ["heist"])
+    content_hash = store.content_hash
+
+    with pytest.raises(ValueError, match="doesn't apply"):
+        store.apply_delta(gen_delta(2, remove=[ADDR]))
+
+    with pytest.raises(ValueError, match="Content hash"):
+        store.apply_delta(gen_delta(1, remove=[ADDR], content_hash="f" * 32))
+
+    assert store.version == 0
+    assert store.content_hash == content_hash
+    assert ADDR in store
+
+    with pytest.raises(ValueError):
+        gen_delta(1, remove=["0x1234"])
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        ({"version": 1, "add": ["0x1234"]}, r"add\[0\]"),
+        ({"version": 1, "add": [{"address": 12}]}, r"add\[0\]"),
+        ({"version": 1, "remove": [ADDR, None]}, r"remove\[1\]"),
+        ({"version": 1, "add": [{"address": ADDR, "tags": 3}]}, "Invalid tags"),
+        ({"version": 1, "add": {"address": ADDR}}, "must be lists"),
+    ],
+)
+def test_parse_invalid_delta(data, error):
+    """
+    Malformed entries should be reported as invalid deltas, naming the entry
+    """
+    with pytest.raises(ValueError, match=error):
+        AddressDelta.from_dict(data)
+
+
+def test_delta_tags_string():
+    """
+    Tags given as a single string should be split like the tags of a feed
+    """
+    delta = AddressDelta.from_dict({"version": 1, "add": [{"address": ADDR, "tags": "heist"}]})
+    assert list(delta.changes.values()) == [frozenset(["heist"])]
+
+
+def test_delta_between_stores():
+    """
+    The delta between two stores should turn the first into the second, and survive being
+    written out and read back
+    """
+    old_store = AddressStore()
+    old_store.add(ADDR, ["heist"])
+    old_store.add(OTHER_ADDR, ["exploit"])
+    new_store = AddressStore()
+    new_store.add(ADDR, ["heist", "phish"])
+
+    delta = AddressDelta.from_dict(AddressDelta.between(old_store, new_store, 1).to_dict())
+
+    assert len(delta.changes) == 2
+    assert old_store.apply_delta(delta)
+    assert old_store.get_tags(ADDR) == ["heist", "phish"]
+    assert OTHER_ADDR not in old_store
+    assert old_store.content_hash == new_store.content_hash
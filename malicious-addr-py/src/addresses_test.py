@@ -0,0 +1,27 @@
+import pytest
+
+from addresses import parse_address
+
+
+ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+
+
+def test_parse_address():
+    """
+    Any hex form of the same address should parse to the same 20-byte value
+    """
+    key = parse_address(ADDR)
+
+    assert key == bytes.fromhex(ADDR[2:])
+    assert parse_address(ADDR.upper().replace("0X", "0x")) == key
+    assert parse_address(ADDR[2:]) == key
+
+
+@pytest.mark.parametrize(
+    "addr", [None, "", "0x", "0x1234", ADDR + "00", "0x" + "zz" * 20, ADDR[:-2] + "  "]
+)
+def test_parse_invalid_address(addr):
+    """
+    Strings that aren't 20-byte hex values are not addresses
+    """
+    assert parse_address(addr) is None
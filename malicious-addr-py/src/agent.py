@@ -1,46 +1,347 @@
+import json
+import os
+from collections import deque
+
 from forta_agent import Finding, FindingType, FindingSeverity
 
-from src import malicious_addrs
+from src import malicious_addrs, metrics, slow_capture
+from src.address_store import AddressStore
+from src.event_view import EventView, get_event_views
+from src.feed_loader import FeedReloader, load_feed
+from src.finding_filter import build_finding_filter, filter_batch_findings, filter_findings
+from src.mmap_index import open_index
+from src.prefilter import PrefilteredStore
+
+# Indexed, deduplicated copy of the malicious address list. This is replaced as a whole
+# when the external feed changes, never modified in place
+MALICIOUS_ADDRS = None
+FEED_RELOADER = None
+# Deltas read from the delta log that are yet to be applied to the address store
+PENDING_DELTAS = deque()
+# Groups the findings raised for the same addresses during a burst, None if disabled
+FINDING_FILTER = None
+
+
+def build_malicious_addrs(
+    feed_path=None, feed_format=None, prefilter_fp_rate=None, content_hash=False
+):
+    """
+    Build a new address store from the built-in list plus the external feed, if one is given.
+    If a false positive rate is given the store is put behind a Bloom filter. If
+    'content_hash' is set the content hash is computed up front, while the store is built in
+    the background, rather than by the first delta that is applied to it
+    """
+    store = AddressStore.from_addresses(malicious_addrs.addrs, malicious_addrs.tags)
+    if feed_path:
+        load_feed(feed_path, feed_format, store)
+
+    if content_hash:
+        store.get_content_hash()
+
+    if prefilter_fp_rate:
+        store = PrefilteredStore.build(store, prefilter_fp_rate)
+
+    return store
+
+
+def set_malicious_addrs(store):
+    """
+    Swap in a new address store. Rebinding the global is atomic, so a transaction that is
+    being handled keeps using the store it started with
+    """
+    global MALICIOUS_ADDRS
+    MALICIOUS_ADDRS = store
+
+
+def queue_deltas(deltas):
+    """
+    Queue deltas read from the delta log. They are applied by the agent between transactions
+    """
+    PENDING_DELTAS.extend(deltas)
+
+
+def apply_pending_deltas():
+    """
+    Apply the queued deltas to the address store in place. This runs on the agent's thread
+    before a transaction is handled, so a transaction is always checked against a single
+    version of the store. Deltas the store already has, e.g. because it was rebuilt with
+    them, are skipped. If a delta doesn't apply the store is rebuilt from the feed instead
+    """
+    store = MALICIOUS_ADDRS
+    while PENDING_DELTAS:
+        delta = PENDING_DELTAS.popleft()
+        try:
+            store.apply_delta(delta)
+        except ValueError as e:
+            PENDING_DELTAS.clear()
+            if FEED_RELOADER is not None:
+                FEED_RELOADER.request_rebuild(e)
+            return
+
+
+def is_versioned_store(store):
+    """
+    Return True if an address store, or the store behind its Bloom filter, takes deltas and
+    has a version. Index files don't
+    """
+    return hasattr(getattr(store, "store", store), "apply_delta")
+
+
+def get_store_version():
+    """
+    Return the version and content hash of the address store, for replicas to check that
+    they are in sync, or None if the store isn't versioned (an index file)
+    """
+    store = MALICIOUS_ADDRS
+    if not is_versioned_store(store):
+        return None
+
+    return {"version": store.version, "content_hash": store.content_hash}
+
+
+def load_config():
+    """
+    Load the configuration values from config/agent-settings.json, build the address store
+    and start watching the external feed or index file if one is configured
+    """
+    global FEED_RELOADER
+    global FINDING_FILTER
+
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    config_file = os.path.join(dirname, "config", "agent-settings.json")
+
+    with open(config_file, "r") as f:
+        data = json.loads(f.read())
+
+    metrics.configure(data.get("metrics"), "malicious_addr")
+    slow_capture.configure(data.get("slow_capture"))
+    metrics.add_collector(get_store_gauges)
+
+    FINDING_FILTER = build_finding_filter(data.get("finding_filter"))
+    metrics.add_collector(get_filter_gauges)
+
+    index_path = data.get("index_path")
+    feed_path = data.get("feed_path")
+    feed_format = data.get("feed_format")
+    delta_path = data.get("delta_path")
+    prefilter_fp_rate = data.get("prefilter_fp_rate")
+
+    if FEED_RELOADER is not None:
+        FEED_RELOADER.stop()
+        FEED_RELOADER = None
+    PENDING_DELTAS.clear()
+
+    # A prebuilt index file takes priority over the feed, and is reopened when it is rebuilt.
+    # Its Bloom filter, if any, is set when the index is built. Index files are read-only, so
+    # the delta log only applies to feeds
+    if index_path:
+        source_path, build_store = index_path, open_index
+        delta_path = None
+    elif feed_path:
+        source_path = feed_path
+        build_store = lambda path: build_malicious_addrs(
+            path, feed_format, prefilter_fp_rate, content_hash=bool(delta_path)
+        )
+    else:
+        set_malicious_addrs(build_malicious_addrs(prefilter_fp_rate=prefilter_fp_rate))
+        return
+
+    # Load the source once up front so the first transaction already sees it, then keep
+    # rebuilding it in the background whenever the file changes
+    FEED_RELOADER = FeedReloader(
+        source_path,
+        build_store,
+        set_malicious_addrs,
+        data.get("feed_refresh_seconds", 60),
+        delta_path=delta_path or None,
+        on_deltas=queue_deltas,
+    )
+    if not FEED_RELOADER.check():
+        raise FEED_RELOADER.last_error
+
+    FEED_RELOADER.start()
+
+
+def get_prefilter_stats():
+    """
+    Return the size and false positive statistics of the Bloom filter in front of the
+    malicious address lookups, or None if no filter is used
+    """
+    store = MALICIOUS_ADDRS
+    if not isinstance(store, PrefilteredStore):
+        return None
+
+    return store.get_stats()
 
 
-def handle_transaction(transaction_event):
+def get_store_gauges():
+    """
+    Return the size of the address store, and the Bloom filter statistics if a filter is
+    used, as gauges for the metrics snapshot
+    """
+    store = MALICIOUS_ADDRS
+    if store is None:
+        return {}
+
+    gauges = {"address_store_entries": len(store)}
+    if is_versioned_store(store):
+        gauges["address_store_version"] = store.version
+    prefilter_stats = get_prefilter_stats()
+    if prefilter_stats is not None:
+        for name in ("checks", "rejected", "false_positives", "observed_fp_rate"):
+            gauges[f"prefilter_{name}"] = prefilter_stats[name]
+
+    return gauges
+
+
+def get_filter_gauges():
+    """
+    Return the finding filter's gauges for the metrics snapshot, if a filter is used
+    """
+    if FINDING_FILTER is None:
+        return {}
+
+    return FINDING_FILTER.get_gauges()
+
+
+def is_stateful():
+    """
+    Return True if the findings for a transaction can depend on the transactions before it,
+    e.g. with the finding filter on. Such transactions must be handed to the agent in order
+    and by a single process, so the replay doesn't split them between workers
+    """
+    return FINDING_FILTER is not None
+
+
+def flush_findings():
+    """
+    Return the findings the agent still holds back, e.g. before it is stopped: the summaries
+    of the finding filter's groups whose window hasn't passed yet
+    """
+    if FINDING_FILTER is None:
+        return []
+
+    return FINDING_FILTER.flush()
+
+
+def create_alert(transaction_event, matches):
+    """
+    Return an alert for the malicious addresses, and their tags, found in a transaction
+    """
+    return Finding(
+        {
+            "name": "Malicious Address Detected",
+            "description": "Malicious address is involved with a transaction",
+            "alert_id": "AE-MALICIOUS-ADDR",
+            "type": FindingType.Suspicious,
+            "severity": FindingSeverity.Medium,
+            "metadata": {
+                "from": transaction_event.transaction.from_,
+                "to": transaction_event.transaction.to,
+                "amount": transaction_event.transaction.value,
+                "malicious_addresses": list(matches),
+                "malicious_address_tags": matches,
+            },
+        }
+    )
+
+
+def check_transaction(event_view):
     """
     Check to see if the malicious address was involved with a transaction.
     Return an empty list if the malicious address is not involved and does not
     trigger an alert
     """
-    addresses = transaction_event.addresses
+    transaction_event = event_view.transaction_event
+    # Every address involved in the transaction is checked exactly once, all against the
+    # same store even if a new one is swapped in meanwhile
+    address_keys = event_view.address_keys
+    if metrics.ENABLED:
+        metrics.increment("transactions")
+        metrics.increment("addresses_checked", len(address_keys))
+        matches = metrics.timed("match", MALICIOUS_ADDRS.match_keys, address_keys)
+    else:
+        matches = MALICIOUS_ADDRS.match_keys(address_keys)
 
     # If no malicious addresses are involved in the transaction, no alert should be raised
-    for addr in addresses:
-        if addr in malicious_addrs.addrs:
-            break
-    else:
+    if not matches:
         return []
 
-    alerts = []
-    bad_addrs = []
     # If the malicious address is involved with the transaction send an alert
-    for addr in addresses:
-        if addr in malicious_addrs.addrs:
-            bad_addrs.append(addr)
+    if metrics.ENABLED:
+        metrics.increment("findings")
+        return [metrics.timed("finding", create_alert, transaction_event, matches)]
+
+    return [create_alert(transaction_event, matches)]
+
+
+@slow_capture.captured
+def handle_transaction(transaction_event, event_view=None):
+    """
+    Entry point for a transaction. 'event_view' is the decoded view of the event, if the
+    caller shares one between several detectors
+    """
+    if PENDING_DELTAS:
+        apply_pending_deltas()
+
+    findings = check_transaction(event_view or EventView(transaction_event))
+    if FINDING_FILTER is None:
+        return findings
+
+    return filter_findings(FINDING_FILTER, transaction_event, findings)
+
+
+@slow_capture.captured
+def handle_transaction_batch(transaction_events, event_views=None):
+    """
+    Check a batch of transactions, e.g. every transaction in a block, at once. Returns the
+    same alerts, in the same order, as calling handle_transaction on each transaction.
+    'event_views' are the decoded views of the events, if the caller shares them between
+    several detectors
+    """
+    if PENDING_DELTAS:
+        apply_pending_deltas()
+
+    # Addresses such as routers and tokens show up in many transactions of a block, so
+    # every distinct address in the batch is looked up only once
+    batch_address_keys = {}
+    for event_view in get_event_views(transaction_events, event_views):
+        batch_address_keys.update(event_view.address_keys)
+
+    if metrics.ENABLED:
+        metrics.increment("transactions", len(transaction_events))
+        metrics.increment("addresses_checked", len(batch_address_keys))
+        matches = metrics.timed("match", MALICIOUS_ADDRS.match_keys, batch_address_keys)
     else:
-        if bad_addrs:
-            alert = Finding(
-                {
-                    "name": "Malicious Address Detected",
-                    "description": "Malicious address is involved with a transaction",
-                    "alert_id": "AE-MALICIOUS-ADDR",
-                    "type": FindingType.Suspicious,
-                    "severity": FindingSeverity.Medium,
-                    "metadata": {
-                        "from": transaction_event.transaction.from_,
-                        "to": transaction_event.transaction.to,
-                        "amount": transaction_event.transaction.value,
-                        "malicious_addresses": bad_addrs,
-                    },
-                }
-            )
+        matches = MALICIOUS_ADDRS.match_keys(batch_address_keys)
+
+    if not matches:
+        if FINDING_FILTER is None:
+            return []
+        return filter_batch_findings(
+            FINDING_FILTER, transaction_events, [[] for _ in transaction_events]
+        )
+
+    alerts = []
+    tx_alerts = []
+    for transaction_event in transaction_events:
+        tx_matches = {
+            addr: matches[addr] for addr in transaction_event.addresses if addr in matches
+        }
+        if tx_matches:
+            alert = create_alert(transaction_event, tx_matches)
             alerts.append(alert)
+            tx_alerts.append([alert])
+        else:
+            tx_alerts.append([])
+
+    if metrics.ENABLED:
+        metrics.increment("findings", len(alerts))
+
+    if FINDING_FILTER is None:
+        return alerts
+
+    return filter_batch_findings(FINDING_FILTER, transaction_events, tx_alerts)
+
 
-    return alerts
+load_config()
@@ -2,7 +2,10 @@ import pytest
 
 from forta_agent import Finding, FindingSeverity, FindingType, create_transaction_event
 
-from agent import handle_transaction
+import agent
+from agent import handle_transaction, handle_transaction_batch
+from address_store import AddressDelta, AddressStore
+from mmap_index import open_index, write_index
 import malicious_addrs
 
 
@@ -117,3 +120,232 @@ def test_malicious_addr(alert, mal_addr):
 
     # Check all the properties on the alert
     check_alerts(alert, finding)
+
+
+def test_malicious_addr_mixed_case(mal_addr):
+    """
+    Addresses are compared on their value, so a checksummed or uppercase address
+    should still trigger an alert
+    """
+    upper_addr = "0x" + mal_addr[2:].upper()
+    tx_event = create_transaction_event({"addresses": [upper_addr]})
+
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 1
+    assert findings[0].metadata["malicious_addresses"] == [upper_addr]
+
+
+def test_malicious_addr_tags(mal_addr):
+    """
+    The alert should carry the tags of each malicious address that was found
+    """
+    tx_event = create_transaction_event(
+        {"addresses": [mal_addr, "0x000000000000000000000000000000000000dead"]}
+    )
+
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 1
+    assert findings[0].metadata["malicious_addresses"] == [mal_addr]
+    # The built-in list doesn't say which category each address falls in
+    assert findings[0].metadata["malicious_address_tags"] == {mal_addr: []}
+
+
+def test_swap_malicious_addrs():
+    """
+    A newly loaded address store should be used by the next transaction
+    """
+    new_addr = "0x000000000000000000000000000000000000dead"
+    tx_event = create_transaction_event({"addresses": [new_addr]})
+    assert len(handle_transaction(tx_event)) == 0
+
+    previous = agent.MALICIOUS_ADDRS
+    agent.set_malicious_addrs(AddressStore.from_addresses([new_addr], ["heist"]))
+    try:
+        findings = handle_transaction(tx_event)
+    finally:
+        agent.set_malicious_addrs(previous)
+
+    assert len(findings) == 1
+    assert findings[0].metadata["malicious_address_tags"] == {new_addr: ["heist"]}
+
+
+def test_transaction_batch(mal_addr):
+    """
+    Checking a batch of transactions should give the same alerts as checking them one by one
+    """
+    other_addr = malicious_addrs.addrs[1]
+    clean_addr = "0x000000000000000000000000000000000000dead"
+    tx_events = [
+        create_transaction_event({"addresses": [clean_addr]}),
+        create_transaction_event({"transaction": {"from": mal_addr}, "addresses": [mal_addr]}),
+        create_transaction_event({}),
+        create_transaction_event({"addresses": {other_addr: True, clean_addr: True, mal_addr: True}}),
+        create_transaction_event({"addresses": [clean_addr]}),
+    ]
+
+    expected = [finding for tx_event in tx_events for finding in handle_transaction(tx_event)]
+    findings = handle_transaction_batch(tx_events)
+
+    assert len(findings) == 2
+    assert [finding.toJson() for finding in findings] == [
+        finding.toJson() for finding in expected
+    ]
+    assert handle_transaction_batch([]) == []
+
+
+def test_metrics(mal_addr):
+    """
+    With instrumentation on, the agent should count transactions, addresses and findings
+    and time the lookup of the addresses
+    """
+    agent.metrics.configure({"enabled": True})
+    try:
+        handle_transaction(create_transaction_event({"addresses": [mal_addr]}))
+        handle_transaction(create_transaction_event({"addresses": {"0x1": True, "0x2": True}}))
+        snapshot = agent.metrics.get_snapshot()
+    finally:
+        agent.metrics.configure({"enabled": False})
+
+    assert snapshot["counters"] == {"transactions": 2, "addresses_checked": 3, "findings": 1}
+    assert snapshot["timings"]["match"]["count"] == 2
+    assert snapshot["timings"]["finding"]["count"] == 1
+    assert snapshot["gauges"]["address_store_entries"] == len(agent.MALICIOUS_ADDRS)
+
+
+def test_metrics_over_index(mal_addr, monkeypatch, tmp_path):
+    """
+    The store gauges should be collected from an index file behind a Bloom filter, which
+    isn't versioned
+    """
+    path = str(tmp_path / "addresses.idx")
+    write_index(AddressStore.from_addresses([mal_addr], ["heist"]), path, bloom_fp_rate=0.01)
+    monkeypatch.setattr(agent, "MALICIOUS_ADDRS", open_index(path))
+
+    agent.metrics.configure({"enabled": True})
+    try:
+        handle_transaction(create_transaction_event({"addresses": [mal_addr]}))
+        snapshot = agent.metrics.get_snapshot()
+    finally:
+        agent.metrics.configure({"enabled": False})
+
+    assert isinstance(agent.MALICIOUS_ADDRS, agent.PrefilteredStore)
+    assert snapshot["gauges"]["address_store_entries"] == 1
+    assert snapshot["gauges"]["prefilter_checks"] == 1
+    assert "address_store_version" not in snapshot["gauges"]
+    assert agent.get_store_version() is None
+
+
+def test_finding_filter(mal_addr, monkeypatch):
+    """
+    With the finding filter on, a burst of transactions from the same malicious address
+    should raise one alert, then a summary with the count once the window has passed
+    """
+    finding_filter = agent.build_finding_filter(
+        {"enabled": True, "size": 10, "key_fields": {"AE-MALICIOUS-ADDR": ["malicious_addresses"]}}
+    )
+    monkeypatch.setattr(agent, "FINDING_FILTER", finding_filter)
+
+    findings = []
+    for block_number in range(100, 105):
+        tx_event = create_transaction_event(
+            {"addresses": [mal_addr], "block": {"number": block_number}}
+        )
+        findings.extend(handle_transaction(tx_event))
+    assert [finding.alert_id for finding in findings] == ["AE-MALICIOUS-ADDR"]
+
+    # A later block with no findings closes the window
+    findings = handle_transaction_batch(
+        [create_transaction_event({"addresses": ["0x1"], "block": {"number": 110}})]
+    )
+    assert len(findings) == 1
+    assert findings[0].alert_id == "AE-MALICIOUS-ADDR-SUMMARY"
+    assert findings[0].metadata["malicious_addresses"] == [mal_addr]
+    assert findings[0].metadata["count"] == 5
+
+
+def test_finding_filter_batch_across_blocks(mal_addr, monkeypatch):
+    """
+    With the finding filter on, a batch spanning several blocks should give the same alerts
+    as its transactions one at a time
+    """
+    settings = {"enabled": True, "size": 10, "key_fields": {"AE-MALICIOUS-ADDR": ["from"]}}
+    tx_events = [
+        create_transaction_event(
+            {"transaction": {"from": mal_addr}, "addresses": [mal_addr], "block": {"number": n}}
+        )
+        for n in (100, 101, 120)
+    ]
+
+    monkeypatch.setattr(agent, "FINDING_FILTER", agent.build_finding_filter(settings))
+    expected = [finding for tx_event in tx_events for finding in handle_transaction(tx_event)]
+    monkeypatch.setattr(agent, "FINDING_FILTER", agent.build_finding_filter(settings))
+    findings = handle_transaction_batch(tx_events)
+
+    assert [finding.alert_id for finding in findings] == [
+        "AE-MALICIOUS-ADDR",
+        "AE-MALICIOUS-ADDR-SUMMARY",
+        "AE-MALICIOUS-ADDR",
+    ]
+    assert [finding.toJson() for finding in findings] == [
+        finding.toJson() for finding in expected
+    ]
+
+
+def test_delta_updates(mal_addr, monkeypatch):
+    """
+    Queued deltas should be applied to the store before the next transaction is checked, and
+    a delta that doesn't apply should leave the store as it was
+    """
+    store = AddressStore.from_addresses(malicious_addrs.addrs, malicious_addrs.tags)
+    monkeypatch.setattr(agent, "MALICIOUS_ADDRS", store)
+    new_addr = "0x000000000000000000000000000000000000dead"
+    tx_event = create_transaction_event({"addresses": [mal_addr, new_addr]})
+
+    agent.queue_deltas(
+        [
+            AddressDelta.from_dict(
+                {
+                    "version": 1,
+                    "add": [{"address": new_addr, "tags": ["phish"]}],
+                    "remove": [mal_addr],
+                }
+            ),
+            AddressDelta.from_dict({"version": 3, "base_version": 2, "remove": [new_addr]}),
+        ]
+    )
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 1
+    assert findings[0].metadata["malicious_address_tags"] == {new_addr: ["phish"]}
+    assert agent.get_store_version() == {"version": 1, "content_hash": store.content_hash}
+    assert not agent.PENDING_DELTAS
+
+
+def test_slow_capture(mal_addr, monkeypatch, tmp_path):
+    """
+    A captured slow call should replay from its fixture to the same alerts, with the time
+    spent in each stage
+    """
+    monkeypatch.setattr(agent.metrics, "ENABLED", True)
+    monkeypatch.setattr(
+        agent.slow_capture, "CAPTURE", agent.slow_capture.SlowCallCapture(str(tmp_path), 0)
+    )
+    clean_addr = "0x000000000000000000000000000000000000dead"
+    tx_events = [
+        create_transaction_event({"addresses": {clean_addr: True}}),
+        create_transaction_event({"transaction": {"from": mal_addr}, "addresses": [mal_addr]}),
+    ]
+
+    findings = handle_transaction_batch(tx_events)
+
+    path = agent.slow_capture.CAPTURE.get_fixture_path(0)
+    captured_events, slow_call = agent.slow_capture.load_fixture(path)
+    assert slow_call["entry"] == "handle_transaction_batch"
+    assert slow_call["events"] == 2
+    assert "match" in slow_call["stages_ms"]
+
+    monkeypatch.setattr(agent.slow_capture, "CAPTURE", None)
+    replayed = handle_transaction_batch(captured_events)
+    assert [finding.toJson() for finding in replayed] == [finding.toJson() for finding in findings]
@@ -0,0 +1,96 @@
+import math
+
+# Mask for the lower 64 bits of the key, used as the first of the two base hashes
+HASH_MASK = (1 << 64) - 1
+
+
+def get_optimal_size(capacity, fp_rate):
+    """
+    Return the number of bits and hash functions that give the requested false positive
+    rate for a filter holding 'capacity' keys
+    """
+    if not 0 < fp_rate < 1:
+        raise ValueError(f"False positive rate must be between 0 and 1, got {fp_rate}")
+
+    capacity = max(capacity, 1)
+    num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+    # Round up to a whole number of bytes
+    num_bits = (num_bits + 7) // 8 * 8
+    num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+
+    return num_bits, num_hashes
+
+
+class BloomFilter:
+    """
+    Bloom filter over 20-byte address keys. Addresses are already the output of keccak, so
+    the key itself is used as the hash instead of hashing it again. The bit array can be any
+    writable or read-only buffer, such as a slice of a memory-mapped file
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        if num_bits <= 0 or num_bits % 8:
+            raise ValueError(f"Number of bits must be a positive multiple of 8, got {num_bits}")
+
+        if bits is None:
+            bits = bytearray(num_bits // 8)
+        elif len(bits) * 8 != num_bits:
+            raise ValueError("Size of the bit array does not match the number of bits")
+
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits
+        # Number of keys added to the filter
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate):
+        """
+        Create an empty filter sized for 'capacity' keys at the given false positive rate
+        """
+        return cls(*get_optimal_size(capacity, fp_rate))
+
+    def add(self, key):
+        # Double hashing: bit i is at h1 + i * h2, both taken straight from the key
+        value = int.from_bytes(key, "big")
+        position = value & HASH_MASK
+        step = (value >> 64) | 1
+        num_bits = self.num_bits
+        bits = self.bits
+        for _ in range(self.num_hashes):
+            bit = position % num_bits
+            bits[bit >> 3] |= 1 << (bit & 7)
+            position += step
+
+        self.count += 1
+
+    def __contains__(self, key):
+        value = int.from_bytes(key, "big")
+        position = value & HASH_MASK
+        step = (value >> 64) | 1
+        num_bits = self.num_bits
+        bits = self.bits
+        for _ in range(self.num_hashes):
+            bit = position % num_bits
+            if not bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+            position += step
+
+        return True
+
+    def get_stats(self):
+        """
+        Return the size of the filter and its false positive rate. The estimated rate is
+        based on how many bits are actually set, so it reflects the filter's real contents
+        """
+        set_bits = bin(int.from_bytes(self.bits, "big")).count("1")
+        fill_ratio = set_bits / self.num_bits
+
+        return {
+            "num_bits": self.num_bits,
+            "size_bytes": self.num_bits // 8,
+            "num_hashes": self.num_hashes,
+            "count": self.count,
+            "fill_ratio": fill_ratio,
+            "estimated_fp_rate": fill_ratio ** self.num_hashes,
+        }
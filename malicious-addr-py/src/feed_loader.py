@@ -0,0 +1,271 @@
+import csv
+import json
+import os
+import threading
+
+from src.address_store import AddressDelta, AddressStore, split_tags
+from src.addresses import parse_address
+
+FEED_FORMATS = ("csv", "jsonl", "hex")
+
+
+def get_feed_format(path, feed_format=None):
+    """
+    Return the format of a feed file. If no format is given it is picked from the file
+    extension, and anything that isn't .csv or .jsonl is read as newline-delimited hex
+    """
+    if feed_format:
+        if feed_format not in FEED_FORMATS:
+            raise ValueError(f"Unknown feed format: {feed_format!r}")
+        return feed_format
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+
+    return "hex"
+
+
+def _read_csv(f):
+    """
+    CSV feeds must have a header with an 'address' column and may have a 'tags' column
+    """
+    reader = csv.DictReader(f)
+    if not reader.fieldnames or "address" not in reader.fieldnames:
+        raise ValueError("CSV feed must have an 'address' column")
+
+    for row in reader:
+        yield reader.line_num, (row["address"] or "").strip(), row.get("tags")
+
+
+def _read_jsonl(f):
+    """
+    JSONL feeds hold one object per line with an 'address' key and an optional 'tags' list
+    """
+    for line_num, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{f.name}:{line_num}: invalid JSON: {e}")
+        if not isinstance(entry, dict):
+            raise ValueError(f"{f.name}:{line_num}: JSONL feed lines must be objects")
+
+        yield line_num, entry.get("address"), entry.get("tags")
+
+
+def _read_hex(f):
+    """
+    Hex feeds hold one address per line. Blank lines and '#' comments are ignored
+    """
+    for line_num, line in enumerate(f, 1):
+        line = line.split("#", 1)[0].strip()
+        if line:
+            yield line_num, line, None
+
+
+FEED_READERS = {"csv": _read_csv, "jsonl": _read_jsonl, "hex": _read_hex}
+
+
+def read_feed(path, feed_format=None):
+    """
+    Stream (address, tags) pairs out of a feed file one line at a time so that large feeds
+    never need to be held in memory as a whole.
+    Raises ValueError if the feed contains an invalid address or tags
+    """
+    reader = FEED_READERS[get_feed_format(path, feed_format)]
+
+    with open(path, "r", newline="") as f:
+        for line_num, addr, tags in reader(f):
+            if not isinstance(addr, str) or parse_address(addr) is None:
+                raise ValueError(f"{path}:{line_num}: invalid address {addr!r}")
+            try:
+                tags = split_tags(tags)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_num}: {e}")
+            yield addr, tags
+
+
+def load_feed(path, feed_format=None, store=None):
+    """
+    Add every entry of a feed file to an address store. A new store is created if one is
+    not given. Returns the store
+    """
+    if store is None:
+        store = AddressStore()
+
+    for addr, tags in read_feed(path, feed_format):
+        store.add(addr, tags)
+
+    return store
+
+
+def read_valid_deltas(path, offset=0):
+    """
+    Read the deltas appended to a delta log, one JSON object per line, from byte 'offset', up
+    to the first invalid one. A last line that is still being written, without its newline,
+    is left for the next read. Returns the deltas, the offset to read from next, i.e. the
+    start of the invalid line if there is one, and a ValueError for it, or None
+    """
+    deltas = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+
+            stripped = line.strip()
+            if stripped:
+                try:
+                    deltas.append(AddressDelta.from_dict(json.loads(stripped)))
+                except ValueError as e:
+                    return deltas, offset, ValueError(f"{path}: delta at byte {offset}: {e}")
+            offset += len(line)
+
+    return deltas, offset, None
+
+
+def read_deltas(path, offset=0):
+    """
+    Read the deltas appended to a delta log like read_valid_deltas. Returns the deltas and
+    the offset to read from next.
+    Raises ValueError if a delta is invalid
+    """
+    deltas, offset, error = read_valid_deltas(path, offset)
+    if error is not None:
+        raise error
+
+    return deltas, offset
+
+
+class FeedReloader:
+    """
+    Watches a feed file and rebuilds the address store whenever the file changes.
+    The new store is built completely on a background thread and only then handed to
+    'on_update', so lookups keep using the previous store until the new one is ready.
+
+    If a delta log is given, deltas appended to it are handed to 'on_deltas' to be applied
+    to the current store, without rebuilding it. When the feed is rebuilt the whole log is
+    applied to the new store first, so a log that is truncated when the feed is republished
+    starts over from the new feed.
+    A delta that is invalid or doesn't apply can't be fixed by rebuilding again, so the store
+    is kept at the version before it, with the error in 'last_error', and no more deltas are
+    read until the feed file or the log is replaced
+    """
+
+    def __init__(self, path, build_store, on_update, interval=60, delta_path=None, on_deltas=None):
+        self.path = path
+        self.build_store = build_store
+        self.on_update = on_update
+        self.interval = interval
+        self.delta_path = delta_path
+        self.on_deltas = on_deltas
+        self.last_error = None
+        self._last_stat = None
+        # Byte offset of the delta log read so far, and the error of the delta the log is
+        # stuck at, if any
+        self._delta_offset = 0
+        self._delta_error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _get_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _get_delta_size(self):
+        # The log may not have been written yet
+        try:
+            return os.stat(self.delta_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _apply_delta_log(self, store):
+        """
+        Apply the delta log to a newly built store, up to the first delta that is invalid or
+        doesn't apply. Returns the offset of the log read so far and the error, or None
+        """
+        deltas, delta_offset, error = read_valid_deltas(self.delta_path)
+        for delta in deltas:
+            try:
+                store.apply_delta(delta)
+            except ValueError as e:
+                return delta_offset, e
+
+        return delta_offset, error
+
+    def request_rebuild(self, error=None):
+        """
+        Rebuild the store from the feed on the next check, e.g. after a delta failed to apply
+        """
+        self._last_stat = None
+        if error is not None:
+            self.last_error = error
+
+    def check(self):
+        """
+        Rebuild the store if the feed file changed since the last check, or else read the
+        deltas appended to the delta log. Returns True if a new store was handed to
+        'on_update' or new deltas to 'on_deltas'
+        """
+        try:
+            stat = self._get_stat()
+            delta_size = self._get_delta_size() if self.delta_path else 0
+            if stat == self._last_stat and delta_size >= self._delta_offset:
+                if delta_size == self._delta_offset or self._delta_error is not None:
+                    return False
+
+                deltas, delta_offset, error = read_valid_deltas(
+                    self.delta_path, self._delta_offset
+                )
+                self._delta_offset = delta_offset
+                self._delta_error = self.last_error = error
+                if deltas:
+                    self.on_deltas(deltas)
+                return bool(deltas)
+
+            store = self.build_store(self.path)
+            delta_offset, delta_error = 0, None
+            if delta_size:
+                delta_offset, delta_error = self._apply_delta_log(store)
+        except (OSError, ValueError) as e:
+            # Keep serving the previous store if the feed is missing or broken
+            self.last_error = e
+            return False
+
+        self._last_stat = stat
+        self._delta_offset = delta_offset
+        self._delta_error = self.last_error = delta_error
+        self.on_update(store)
+        return True
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """
+        Start polling the feed file on a daemon thread
+        """
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="feed-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and wait for the background thread to finish
+        """
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,249 @@
+import json
+
+import pytest
+
+from feed_loader import FeedReloader, get_feed_format, load_feed, read_deltas
+
+
+ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+OTHER_ADDR = "0x905315602ed9a854e325f692ff82f58799beab57"
+
+
+@pytest.fixture
+def csv_feed(tmp_path):
+    feed = tmp_path / "feed.csv"
+    feed.write_text(f"address,tags\n{ADDR},heist;exploit\n{OTHER_ADDR},\n{ADDR.upper()[2:]},phish\n")
+    return feed
+
+
+@pytest.fixture
+def jsonl_feed(tmp_path):
+    feed = tmp_path / "feed.jsonl"
+    lines = [
+        json.dumps({"address": ADDR, "tags": ["heist"]}),
+        "",
+        json.dumps({"address": OTHER_ADDR}),
+    ]
+    feed.write_text("\n".join(lines) + "\n")
+    return feed
+
+
+@pytest.fixture
+def hex_feed(tmp_path):
+    feed = tmp_path / "feed.txt"
+    feed.write_text(f"# exported feed\n{ADDR}\n\n{OTHER_ADDR}  # trailing comment\n{ADDR}\n")
+    return feed
+
+
+def test_feed_format_from_extension():
+    """
+    The feed format should be picked from the file extension unless it is given
+    """
+    assert get_feed_format("feed.csv") == "csv"
+    assert get_feed_format("feed.JSONL") == "jsonl"
+    assert get_feed_format("feed.txt") == "hex"
+    assert get_feed_format("feed.txt", "csv") == "csv"
+
+    with pytest.raises(ValueError):
+        get_feed_format("feed.txt", "xml")
+
+
+def test_load_csv_feed(csv_feed):
+    """
+    CSV feeds are deduplicated and their tags merged
+    """
+    store = load_feed(str(csv_feed))
+
+    assert len(store) == 2
+    assert store.get_tags(ADDR) == ["exploit", "heist", "phish"]
+    assert store.get_tags(OTHER_ADDR) == []
+
+
+def test_load_jsonl_feed(jsonl_feed):
+    store = load_feed(str(jsonl_feed))
+
+    assert len(store) == 2
+    assert store.get_tags(ADDR) == ["heist"]
+
+
+def test_load_hex_feed(hex_feed):
+    store = load_feed(str(hex_feed))
+
+    assert len(store) == 2
+    assert ADDR in store
+    assert OTHER_ADDR in store
+
+
+def test_load_invalid_feed(tmp_path):
+    """
+    An invalid address should fail the whole load and report the line it is on
+    """
+    feed = tmp_path / "feed.txt"
+    feed.write_text(f"{ADDR}\n0x1234\n")
+
+    with pytest.raises(ValueError, match=":2:"):
+        load_feed(str(feed))
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        '"0x1234"',
+        "[1, 2]",
+        "{not json",
+        '{"address": 123}',
+        '{"address": "%s", "tags": 5}' % ADDR,
+        '{"address": "%s", "tags": [1]}' % ADDR,
+    ],
+)
+def test_load_invalid_jsonl_feed(tmp_path, line):
+    """
+    A JSONL line that isn't an object, or whose address or tags have the wrong type, should
+    fail the load like an invalid address, so the reloader keeps the previous store
+    """
+    feed = tmp_path / "feed.jsonl"
+    feed.write_text(json.dumps({"address": ADDR}) + "\n" + line + "\n")
+
+    with pytest.raises(ValueError, match=":2:"):
+        load_feed(str(feed))
+
+    stores = []
+    reloader = FeedReloader(str(feed), load_feed, stores.append)
+    assert not reloader.check()
+    assert isinstance(reloader.last_error, ValueError)
+
+
+def test_reloader_swaps_on_change(hex_feed):
+    """
+    The reloader should only build a new store when the feed file changes, and should keep
+    the previous store if the new feed is broken
+    """
+    stores = []
+    reloader = FeedReloader(str(hex_feed), load_feed, stores.append)
+
+    assert reloader.check()
+    assert not reloader.check()
+    assert len(stores) == 1
+    assert len(stores[0]) == 2
+
+    hex_feed.write_text(f"{ADDR}\n")
+    assert reloader.check()
+    assert len(stores) == 2
+    assert OTHER_ADDR not in stores[1]
+
+    hex_feed.write_text("not an address\n")
+    assert not reloader.check()
+    assert isinstance(reloader.last_error, ValueError)
+    assert len(stores) == 2
+
+
+def test_read_deltas(tmp_path):
+    """
+    Deltas should be read from an offset, leaving a line that is still being written
+    """
+    delta_log = tmp_path / "deltas.jsonl"
+    delta_log.write_text(
+        json.dumps({"version": 1, "remove": [ADDR]})
+        + "\n\n"
+        + json.dumps({"version": 2, "add": [{"address": ADDR}]})
+    )
+
+    deltas, offset = read_deltas(str(delta_log))
+    assert [delta.version for delta in deltas] == [1]
+
+    with open(delta_log, "a") as f:
+        f.write("\n")
+    deltas, offset = read_deltas(str(delta_log), offset)
+    assert [delta.version for delta in deltas] == [2]
+    assert read_deltas(str(delta_log), offset) == ([], offset)
+
+
+def test_reloader_reads_deltas(hex_feed, tmp_path):
+    """
+    Deltas appended to the log should be handed over without rebuilding the store, and a
+    truncated log should rebuild the store from the feed
+    """
+    delta_log = tmp_path / "deltas.jsonl"
+    stores = []
+    deltas = []
+    reloader = FeedReloader(
+        str(hex_feed), load_feed, stores.append, delta_path=str(delta_log), on_deltas=deltas.extend
+    )
+
+    assert reloader.check()
+    assert not reloader.check()
+
+    delta_log.write_text(json.dumps({"version": 1, "remove": [ADDR]}) + "\n")
+    assert reloader.check()
+    assert len(stores) == 1
+    assert [delta.version for delta in deltas] == [1]
+    assert stores[0].apply_delta(deltas[0])
+    assert ADDR not in stores[0]
+
+    # A truncated log starts over from the feed, and is applied to the new store
+    delta = {"version": 1, "remove": [OTHER_ADDR]}
+    delta_log.write_text(json.dumps(delta, separators=(",", ":")) + "\n")
+    assert reloader.check()
+    assert len(stores) == 2
+    assert stores[1].version == 1
+    assert ADDR in stores[1]
+    assert OTHER_ADDR not in stores[1]
+
+
+def test_reloader_stops_at_bad_delta(hex_feed, tmp_path):
+    """
+    A delta that doesn't apply should leave the rebuilt store at the version before it,
+    without rebuilding the store again on every check, until the log is replaced
+    """
+    delta_log = tmp_path / "deltas.jsonl"
+    delta_log.write_text(
+        json.dumps({"version": 1, "remove": [ADDR]})
+        + "\n"
+        + json.dumps({"version": 3, "base_version": 2, "remove": [OTHER_ADDR]})
+        + "\n"
+    )
+    stores = []
+    deltas = []
+    reloader = FeedReloader(
+        str(hex_feed), load_feed, stores.append, delta_path=str(delta_log), on_deltas=deltas.extend
+    )
+
+    assert reloader.check()
+    assert stores[0].version == 1
+    assert OTHER_ADDR in stores[0]
+    assert isinstance(reloader.last_error, ValueError)
+
+    # Neither the same log nor deltas appended to it rebuild the store again
+    reloader.request_rebuild(reloader.last_error)
+    assert reloader.check()
+    with open(delta_log, "a") as f:
+        f.write(json.dumps({"version": 4, "base_version": 3, "remove": [ADDR]}) + "\n")
+    assert not reloader.check()
+    assert not reloader.check()
+    assert len(stores) == 2
+    assert deltas == []
+
+    # A log replaced with valid deltas is applied in full
+    delta_log.write_text(json.dumps({"version": 1, "remove": [OTHER_ADDR]}) + "\n")
+    assert reloader.check()
+    assert stores[2].version == 1
+    assert reloader.last_error is None
+
+
+def test_reloader_reads_deltas_before_invalid_line(hex_feed, tmp_path):
+    """
+    The deltas before an invalid line of the log should still be handed over
+    """
+    delta_log = tmp_path / "deltas.jsonl"
+    stores = []
+    deltas = []
+    reloader = FeedReloader(
+        str(hex_feed), load_feed, stores.append, delta_path=str(delta_log), on_deltas=deltas.extend
+    )
+    assert reloader.check()
+
+    delta_log.write_text(json.dumps({"version": 1, "remove": [ADDR]}) + "\n[1]\n")
+    assert reloader.check()
+    assert [delta.version for delta in deltas] == [1]
+    assert "deltas.jsonl: delta at byte" in str(reloader.last_error)
+    assert not reloader.check()
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+
+from forta_agent import Finding
+
+from src.windows import WINDOW_TYPES, get_window_position
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "type": "blocks",
+    "size": 100,
+    "max_keys": 100000,
+    "key_fields": {},
+}
+
+# Layout of the list kept for each group: the finding that opened it, the position it was
+# opened at, the position of its latest finding and the number of findings held back since
+FIRST_FINDING = 0
+START = 1
+LAST = 2
+SUPPRESSED = 3
+
+
+def get_group_key(finding, key_fields):
+    """
+    Return the key findings are grouped on: the alert id and the value of each key field in
+    the metadata. Lists and dicts, e.g. of addresses, are grouped regardless of order
+    """
+    metadata = finding.metadata or {}
+
+    values = []
+    for field in key_fields:
+        value = metadata.get(field)
+        if isinstance(value, (list, tuple, dict)):
+            value = tuple(sorted(value))
+        values.append(value)
+
+    return (finding.alert_id, tuple(values))
+
+
+def create_summary(group, key_fields, window):
+    """
+    Return a finding that summarizes the findings held back in a group
+    """
+    first_finding = group[FIRST_FINDING]
+    suppressed = group[SUPPRESSED]
+    metadata = first_finding.metadata or {}
+
+    summary_metadata = {field: metadata.get(field) for field in key_fields}
+    summary_metadata.update(
+        {
+            "count": suppressed + 1,
+            "suppressed": suppressed,
+            "window_start": group[START],
+            "window_end": group[LAST],
+            "window": window,
+        }
+    )
+
+    return Finding(
+        {
+            "name": first_finding.name,
+            "description": f"{suppressed} more {first_finding.alert_id} findings within {window}",
+            "alert_id": f"{first_finding.alert_id}-SUMMARY",
+            "type": first_finding.type,
+            "severity": first_finding.severity,
+            "protocol": first_finding.protocol,
+            "everest_id": first_finding.everest_id,
+            "metadata": summary_metadata,
+        }
+    )
+
+
+class FindingFilter:
+    """
+    Groups findings by alert id and key metadata over a window of blocks or seconds. The
+    first finding of a group is passed through, the rest are held back and counted, and a
+    summary finding with the count is emitted once the group's window has passed. Only alert
+    ids with key fields are grouped, others are passed through as they are.
+    Memory is bounded: past 'max_keys' groups the oldest ones are closed early
+    """
+
+    def __init__(self, size, key_fields, max_keys=100000, window_type="blocks"):
+        if size <= 0:
+            raise ValueError(f"Window size must be positive, got {size}")
+        if window_type not in WINDOW_TYPES:
+            raise ValueError(f"Unknown finding filter window type: {window_type}")
+
+        self.size = size
+        self.window_type = window_type
+        self.window = f"{size} {window_type}"
+        # Alert id -> names of the metadata fields its findings are grouped on
+        self.key_fields = {alert_id: tuple(fields) for alert_id, fields in key_fields.items()}
+        self.max_keys = max_keys
+        # Group key -> list laid out as described above, oldest first. Groups are never moved,
+        # so the ones whose window has passed are always at the front
+        self._groups = OrderedDict()
+        # Number of findings held back, and of groups closed early to stay under 'max_keys'
+        self.suppressed = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._groups)
+
+    def _close(self, key, group, summaries):
+        del self._groups[key]
+        if group[SUPPRESSED]:
+            summaries.append(create_summary(group, self.key_fields[key[0]], self.window))
+
+    def _expire(self, position, summaries):
+        """
+        Close the groups opened a whole window before 'position'
+        """
+        oldest = position - self.size
+        groups = self._groups
+        while groups:
+            key = next(iter(groups))
+            group = groups[key]
+            if group[START] > oldest:
+                break
+            self._close(key, group, summaries)
+
+    def filter(self, findings, position):
+        """
+        Return the findings to emit for a transaction at 'position': the summaries of the
+        groups whose window has passed, followed by the findings that aren't held back.
+        Findings without a position can't be placed in a window and are passed through.
+        Positions must not go backwards
+        """
+        if position is None:
+            return findings
+
+        summaries = []
+        if self._groups:
+            self._expire(position, summaries)
+
+        if not findings:
+            return summaries
+
+        passed = []
+        groups = self._groups
+        for finding in findings:
+            key_fields = self.key_fields.get(finding.alert_id)
+            if key_fields is None:
+                passed.append(finding)
+                continue
+
+            key = get_group_key(finding, key_fields)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [finding, position, position, 0]
+                passed.append(finding)
+                continue
+
+            group[LAST] = position
+            group[SUPPRESSED] += 1
+            self.suppressed += 1
+
+        while len(groups) > self.max_keys:
+            key = next(iter(groups))
+            self._close(key, groups[key], summaries)
+            self.evicted += 1
+
+        return summaries + passed
+
+    def flush(self):
+        """
+        Close every group, e.g. on shutdown, and return the summaries of those that held
+        back findings
+        """
+        summaries = []
+        while self._groups:
+            key = next(iter(self._groups))
+            self._close(key, self._groups[key], summaries)
+
+        return summaries
+
+    def get_gauges(self):
+        """
+        Return the number of open groups, findings held back and groups closed early, as
+        gauges for the metrics snapshot
+        """
+        return {
+            "finding_filter_groups": len(self._groups),
+            "finding_filter_suppressed": self.suppressed,
+            "finding_filter_evicted": self.evicted,
+        }
+
+
+def build_finding_filter(settings):
+    """
+    Return a finding filter built from the "finding_filter" section of the agent settings,
+    or None if it is disabled
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+
+    return FindingFilter(
+        settings["size"], settings["key_fields"], settings["max_keys"], settings["type"]
+    )
+
+
+def filter_findings(finding_filter, transaction_event, findings):
+    """
+    Pass the findings of a transaction through the filter, if there is one
+    """
+    if finding_filter is None:
+        return findings
+
+    position = get_window_position(transaction_event, finding_filter.window_type)
+    return finding_filter.filter(findings, position)
+
+
+def filter_batch_findings(finding_filter, transaction_events, findings):
+    """
+    Pass the findings of a batch of transactions through the filter, if there is one.
+    'findings' holds the list of findings of each transaction, and each list is filtered at
+    the position of its own transaction, so a batch gives the same findings as its
+    transactions one at a time, even if it spans several blocks
+    """
+    if finding_filter is None:
+        return [finding for tx_findings in findings for finding in tx_findings]
+
+    filtered = []
+    for transaction_event, tx_findings in zip(transaction_events, findings):
+        filtered.extend(filter_findings(finding_filter, transaction_event, tx_findings))
+
+    return filtered
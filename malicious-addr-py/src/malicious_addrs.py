@@ -1,6 +1,11 @@
 # Addresses that have been tagged 'heist' or 'exploit' by etherscan
-# Note that addresses are lowercase
+# Duplicate entries are removed when the list is loaded into the agent's address store
 # Updated: 9/9/2021
+
+# Tags attached to every address in this list. The list doesn't record which category each
+# address was tagged with, so none is attached. Feeds can tag their addresses with one
+tags = []
+
 addrs = [
     "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c",
     "0x905315602ed9a854e325f692ff82f58799beab57",
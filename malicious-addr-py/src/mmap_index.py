@@ -0,0 +1,256 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from src import malicious_addrs
+from src.address_store import AddressStore
+from src.addresses import ADDRESS_LENGTH, parse_address
+from src.bloom_filter import BloomFilter
+from src.feed_loader import load_feed
+from src.prefilter import PrefilteredStore
+
+# File layout, all integers little-endian:
+#   - header (see HEADER below)
+#   - sorted 20-byte address records
+#   - one uint16 tag set id per record
+#   - optional Bloom filter bits
+#   - JSON list of tag sets, indexed by tag set id
+MAGIC = b"AEADDRIX"
+VERSION = 1
+# magic, version, reserved, record count, bloom bits, bloom hashes, tag table offset, tag table length
+HEADER = struct.Struct("<8sHHQQIQQ")
+TAG_ID = struct.Struct("<H")
+MAX_TAG_SETS = 1 << 16
+
+
+def write_index(store, path, bloom_fp_rate=None):
+    """
+    Write the entries of an address store to an index file. The file is written next to
+    'path' and then renamed over it, so processes that have the old index mapped keep a
+    consistent view until they reopen it
+    """
+    entries = sorted(store.items())
+
+    tag_set_ids = {}
+    tag_ids = array("H")
+    for _, tags in entries:
+        tag_id = tag_set_ids.setdefault(tags, len(tag_set_ids))
+        if tag_id >= MAX_TAG_SETS:
+            raise ValueError(f"Index can hold at most {MAX_TAG_SETS} distinct tag sets")
+        tag_ids.append(tag_id)
+
+    if sys.byteorder == "big":
+        tag_ids.byteswap()
+
+    bloom = None
+    if bloom_fp_rate:
+        bloom = BloomFilter.for_capacity(len(entries), bloom_fp_rate)
+        for key, _ in entries:
+            bloom.add(key)
+
+    tag_table = json.dumps([sorted(tags) for tags in tag_set_ids]).encode()
+    tag_table_offset = HEADER.size + len(entries) * (ADDRESS_LENGTH + TAG_ID.size)
+    if bloom is not None:
+        tag_table_offset += len(bloom.bits)
+
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        0,
+        len(entries),
+        bloom.num_bits if bloom is not None else 0,
+        bloom.num_hashes if bloom is not None else 0,
+        tag_table_offset,
+        len(tag_table),
+    )
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(key for key, _ in entries))
+        f.write(tag_ids.tobytes())
+        if bloom is not None:
+            f.write(bloom.bits)
+        f.write(tag_table)
+
+    os.replace(tmp_path, path)
+
+
+class MmapAddressIndex:
+    """
+    Read-only address index backed by a memory-mapped file written by write_index().
+    Lookups binary search the sorted records. Nothing is copied out of the file except the
+    small tag table, so opening the index is instant and processes that map the same file
+    share its pages. Use open_index() to also put the Bloom filter stored in the file in
+    front of the lookups
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._load()
+        except (ValueError, struct.error):
+            self._mm.close()
+            raise
+
+    def _load(self):
+        mm = self._mm
+        if len(mm) < HEADER.size:
+            raise ValueError("Index file is too small")
+
+        (
+            magic,
+            version,
+            _,
+            count,
+            bloom_bits,
+            bloom_hashes,
+            tag_table_offset,
+            tag_table_length,
+        ) = HEADER.unpack_from(mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not an address index file or unsupported version")
+
+        self._count = count
+        self._records_offset = HEADER.size
+        self._tag_ids_offset = self._records_offset + count * ADDRESS_LENGTH
+        bloom_offset = self._tag_ids_offset + count * TAG_ID.size
+
+        if tag_table_offset + tag_table_length != len(mm):
+            raise ValueError("Index file is truncated")
+
+        self.bloom = None
+        if bloom_bits:
+            bits = memoryview(mm)[bloom_offset:bloom_offset + bloom_bits // 8]
+            self.bloom = BloomFilter(bloom_bits, bloom_hashes, bits, count)
+
+        tag_table = json.loads(mm[tag_table_offset:tag_table_offset + tag_table_length])
+        self._tag_sets = [tuple(tags) for tags in tag_table]
+
+    def close(self):
+        """
+        Unmap the index file. The index can't be used afterwards
+        """
+        if self.bloom is not None:
+            self.bloom.bits.release()
+            self.bloom = None
+        self._mm.close()
+
+    def __len__(self):
+        return self._count
+
+    def _find(self, key):
+        """
+        Return the record number of a 20-byte key, or -1 if it is not in the index
+        """
+        if key is None:
+            return -1
+
+        mm = self._mm
+        base = self._records_offset
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            offset = base + mid * ADDRESS_LENGTH
+            record = mm[offset:offset + ADDRESS_LENGTH]
+            if record < key:
+                low = mid + 1
+            elif record > key:
+                high = mid
+            else:
+                return mid
+
+        return -1
+
+    def _get_tags(self, index):
+        tag_id = TAG_ID.unpack_from(self._mm, self._tag_ids_offset + index * TAG_ID.size)[0]
+        return list(self._tag_sets[tag_id])
+
+    def lookup(self, key):
+        """
+        Return a sorted list of the tags for a 20-byte key, or None if it is not stored
+        """
+        index = self._find(key)
+        if index < 0:
+            return None
+
+        return self._get_tags(index)
+
+    def __contains__(self, addr):
+        return self._find(parse_address(addr)) >= 0
+
+    def get_tags(self, addr):
+        """
+        Return a sorted list of the tags for an address, or None if the address is not stored
+        """
+        return self.lookup(parse_address(addr))
+
+    def match(self, addresses):
+        """
+        Check every address in a single pass and return a dict of the ones that are in the
+        index, mapped to their sorted tags. Order follows the order of 'addresses'
+        """
+        return self.match_keys({addr: parse_address(addr) for addr in addresses})
+
+    def match_keys(self, address_keys):
+        """
+        Same as 'match', for a dict of addresses already parsed into their 20-byte keys
+        """
+        matches = {}
+        for addr, key in address_keys.items():
+            index = self._find(key)
+            if index >= 0:
+                matches[addr] = self._get_tags(index)
+
+        return matches
+
+
+def open_index(path):
+    """
+    Open an index file, behind its Bloom filter if the file has one
+    """
+    index = MmapAddressIndex(path)
+    if index.bloom is None:
+        return index
+
+    return PrefilteredStore(index, index.bloom)
+
+
+def main(argv=None):
+    """
+    Build an index file from the built-in malicious address list and any number of feeds
+    """
+    parser = argparse.ArgumentParser(description="Build a memory-mapped malicious address index")
+    parser.add_argument("output", help="path of the index file to write")
+    parser.add_argument("feeds", nargs="*", help="feed files to add to the index")
+    parser.add_argument("--feed-format", help="format of the feed files (csv, jsonl or hex)")
+    parser.add_argument(
+        "--bloom-fp-rate",
+        type=float,
+        help="add a Bloom filter with this false positive rate in front of the index",
+    )
+    parser.add_argument(
+        "--no-builtin",
+        action="store_true",
+        help="don't include the built-in list from malicious_addrs.py",
+    )
+    args = parser.parse_args(argv)
+
+    store = AddressStore()
+    if not args.no_builtin:
+        store = AddressStore.from_addresses(malicious_addrs.addrs, malicious_addrs.tags)
+    for feed in args.feeds:
+        load_feed(feed, args.feed_format, store)
+
+    write_index(store, args.output, args.bloom_fp_rate)
+    print(f"Wrote {len(store)} addresses to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import pytest
+
+from address_store import AddressStore
+from mmap_index import MmapAddressIndex, main, write_index
+import malicious_addrs
+
+
+ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+OTHER_ADDR = "0x905315602ed9a854e325f692ff82f58799beab57"
+CLEAN_ADDR = "0x000000000000000000000000000000000000dead"
+
+
+@pytest.fixture
+def store():
+    store = AddressStore()
+    store.add(ADDR, ["heist"])
+    store.add(OTHER_ADDR, ["exploit", "heist"])
+    for addr in malicious_addrs.addrs:
+        store.add(addr, malicious_addrs.tags)
+
+    return store
+
+
+@pytest.mark.parametrize("bloom_fp_rate", [None, 0.01])
+def test_index_matches_store(tmp_path, store, bloom_fp_rate):
+    """
+    The index should give the same answers as the store it was written from
+    """
+    path = str(tmp_path / "addrs.idx")
+    write_index(store, path, bloom_fp_rate)
+    index = MmapAddressIndex(path)
+
+    assert len(index) == len(store)
+    assert (index.bloom is not None) == bool(bloom_fp_rate)
+    for key, tags in store.items():
+        addr = "0x" + key.hex()
+        assert addr in index
+        assert index.get_tags(addr) == sorted(tags)
+
+    assert CLEAN_ADDR not in index
+    assert index.get_tags(CLEAN_ADDR) is None
+    upper_addr = OTHER_ADDR.upper().replace("0X", "0x")
+    assert index.match([CLEAN_ADDR, upper_addr, "0x1234"]) == {
+        upper_addr: store.get_tags(OTHER_ADDR)
+    }
+
+    index.close()
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / "addrs.idx")
+    write_index(AddressStore(), path, 0.01)
+    index = MmapAddressIndex(path)
+
+    assert len(index) == 0
+    assert ADDR not in index
+
+
+def test_invalid_index(tmp_path):
+    """
+    Opening a file that isn't an index should raise a ValueError
+    """
+    path = tmp_path / "addrs.idx"
+    path.write_bytes(b"not an index file" * 4)
+
+    with pytest.raises(ValueError):
+        MmapAddressIndex(str(path))
+
+
+def test_build_index_from_feeds(tmp_path):
+    """
+    The command line entry point should combine the built-in list with the given feeds
+    """
+    feed = tmp_path / "feed.txt"
+    feed.write_text(f"{CLEAN_ADDR}\n")
+    path = str(tmp_path / "addrs.idx")
+
+    main([path, str(feed), "--bloom-fp-rate", "0.001"])
+    index = MmapAddressIndex(path)
+
+    assert CLEAN_ADDR in index
+    assert malicious_addrs.addrs[0] in index
+    assert len(index) == len(set(malicious_addrs.addrs)) + 1
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+
+from src import malicious_addrs
+from src.address_store import AddressStore
+from src.addresses import parse_address
+from src.bloom_filter import BloomFilter
+from src.feed_loader import load_feed
+
+
+class PrefilteredStore:
+    """
+    Puts a Bloom filter in front of an address store or index. Almost every address the agent
+    sees is clean, and the filter rejects those without touching the store. Only addresses
+    that pass the filter are looked up exactly, so false positives never raise alerts
+    """
+
+    def __init__(self, store, bloom):
+        self.store = store
+        self.bloom = bloom
+        # Addresses checked, addresses the filter rejected, and addresses that passed the
+        # filter but were not in the store
+        self.checks = 0
+        self.rejected = 0
+        self.false_positives = 0
+
+    @classmethod
+    def build(cls, store, fp_rate):
+        """
+        Build a filter sized for the store at the given false positive rate
+        """
+        bloom = BloomFilter.for_capacity(len(store), fp_rate)
+        for key, _ in store.items():
+            bloom.add(key)
+
+        return cls(store, bloom)
+
+    def __len__(self):
+        return len(self.store)
+
+    def items(self):
+        return self.store.items()
+
+    @property
+    def version(self):
+        return self.store.version
+
+    @property
+    def content_hash(self):
+        return self.store.content_hash
+
+    def apply_delta(self, delta):
+        """
+        Apply a delta to the store and add the new addresses to the filter. Removed addresses
+        can't be cleared from the filter, so they are left to the exact lookup until the
+        filter is rebuilt with the next full load
+        """
+        if not self.store.apply_delta(delta):
+            return False
+
+        for key, tags in delta.changes.items():
+            if tags is not None:
+                self.bloom.add(key)
+
+        return True
+
+    def lookup(self, key):
+        """
+        Return a sorted list of the tags for a 20-byte key, or None if it is not stored
+        """
+        if key is None:
+            return None
+
+        self.checks += 1
+        if key not in self.bloom:
+            self.rejected += 1
+            return None
+
+        tags = self.store.lookup(key)
+        if tags is None:
+            self.false_positives += 1
+
+        return tags
+
+    def __contains__(self, addr):
+        return self.lookup(parse_address(addr)) is not None
+
+    def get_tags(self, addr):
+        """
+        Return a sorted list of the tags for an address, or None if the address is not stored
+        """
+        return self.lookup(parse_address(addr))
+
+    def match(self, addresses):
+        """
+        Check every address in a single pass and return a dict of the ones that are in the
+        store, mapped to their sorted tags. Order follows the order of 'addresses'
+        """
+        return self.match_keys({addr: parse_address(addr) for addr in addresses})
+
+    def match_keys(self, address_keys):
+        """
+        Same as 'match', for a dict of addresses already parsed into their 20-byte keys
+        """
+        lookup = self.lookup
+        matches = {}
+        for addr, key in address_keys.items():
+            tags = lookup(key)
+            if tags is not None:
+                matches[addr] = tags
+
+        return matches
+
+    def get_stats(self):
+        """
+        Return the size of the filter, its estimated false positive rate and the false
+        positive rate actually observed on the addresses checked so far
+        """
+        stats = self.bloom.get_stats()
+        negatives = self.rejected + self.false_positives
+        stats.update(
+            {
+                "entries": len(self.store),
+                "checks": self.checks,
+                "rejected": self.rejected,
+                "false_positives": self.false_positives,
+                "observed_fp_rate": self.false_positives / negatives if negatives else 0.0,
+            }
+        )
+
+        return stats
+
+
+def main(argv=None):
+    """
+    Build a filter for the built-in list and any number of feeds, check it against random
+    addresses and print its statistics, to help pick a false positive rate for a feed
+    """
+    parser = argparse.ArgumentParser(description="Size a Bloom filter for a malicious address feed")
+    parser.add_argument("feeds", nargs="*", help="feed files to add to the filter")
+    parser.add_argument("--feed-format", help="format of the feed files (csv, jsonl or hex)")
+    parser.add_argument("--fp-rate", type=float, default=0.001, help="target false positive rate")
+    parser.add_argument(
+        "--samples", type=int, default=100000, help="number of random addresses to check"
+    )
+    args = parser.parse_args(argv)
+
+    store = AddressStore.from_addresses(malicious_addrs.addrs, malicious_addrs.tags)
+    for feed in args.feeds:
+        load_feed(feed, args.feed_format, store)
+
+    prefiltered = PrefilteredStore.build(store, args.fp_rate)
+    for _ in range(args.samples):
+        prefiltered.lookup(os.urandom(20))
+
+    print(json.dumps(prefiltered.get_stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
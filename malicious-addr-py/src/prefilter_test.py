@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from address_store import AddressStore
+from bloom_filter import BloomFilter, get_optimal_size
+from mmap_index import open_index, write_index
+from prefilter import PrefilteredStore
+
+
+ADDR = "0x9f26ae5cd245bfeeb5926d61497550f79d9c6c1c"
+CLEAN_ADDR = "0x000000000000000000000000000000000000dead"
+
+
+@pytest.fixture
+def store():
+    """
+    A store with a few thousand random addresses plus one known one
+    """
+    store = AddressStore()
+    store.add(ADDR, ["heist"])
+    for _ in range(5000):
+        store.add("0x" + os.urandom(20).hex(), ["exploit"])
+
+    return store
+
+
+def test_optimal_size():
+    """
+    Lower false positive rates need more bits and more hash functions
+    """
+    bits_1, hashes_1 = get_optimal_size(1000, 0.01)
+    bits_2, hashes_2 = get_optimal_size(1000, 0.0001)
+
+    assert bits_1 % 8 == 0
+    assert bits_2 > bits_1
+    assert hashes_2 > hashes_1
+
+    with pytest.raises(ValueError):
+        get_optimal_size(1000, 1)
+
+
+def test_bloom_filter_has_no_false_negatives(store):
+    bloom = BloomFilter.for_capacity(len(store), 0.01)
+    for key, _ in store.items():
+        bloom.add(key)
+
+    assert all(key in bloom for key, _ in store.items())
+    assert bloom.get_stats()["count"] == len(store)
+
+
+def test_prefilter_matches_store(store):
+    """
+    The prefilter should only change how fast lookups are, never their result
+    """
+    prefiltered = PrefilteredStore.build(store, 0.01)
+
+    assert len(prefiltered) == len(store)
+    assert ADDR in prefiltered
+    assert CLEAN_ADDR not in prefiltered
+    assert prefiltered.get_tags(ADDR) == ["heist"]
+    assert prefiltered.match([CLEAN_ADDR, ADDR, "0x1234"]) == {ADDR: ["heist"]}
+
+
+def test_prefilter_stats(store):
+    """
+    The observed false positive rate should be close to the configured one
+    """
+    fp_rate = 0.01
+    prefiltered = PrefilteredStore.build(store, fp_rate)
+    for _ in range(20000):
+        prefiltered.lookup(os.urandom(20))
+
+    stats = prefiltered.get_stats()
+
+    assert stats["entries"] == len(store)
+    assert stats["checks"] == 20000
+    assert stats["rejected"] + stats["false_positives"] == 20000
+    assert stats["size_bytes"] * 8 == stats["num_bits"]
+    assert 0 < stats["fill_ratio"] < 1
+    assert stats["estimated_fp_rate"] < fp_rate * 2
+    assert stats["observed_fp_rate"] < fp_rate * 2
+
+
+def test_index_prefilter(tmp_path, store):
+    """
+    Opening an index that was built with a Bloom filter should put the filter in front of it
+    """
+    path = str(tmp_path / "addrs.idx")
+    write_index(store, path, 0.01)
+    index = open_index(path)
+
+    assert ADDR in index
+    assert CLEAN_ADDR not in index
+    assert index.get_stats()["count"] == len(store)
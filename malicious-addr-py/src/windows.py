@@ -0,0 +1,15 @@
+# Units a window of transactions can be measured in, by the finding filter and swap window
+WINDOW_TYPES = ("blocks", "seconds")
+
+
+def get_window_position(transaction_event, window_type):
+    """
+    Return where a transaction falls in a window: its block number or its block timestamp.
+    Returns None if the event doesn't have it
+    """
+    block = transaction_event.block
+    position = block.number if window_type == "blocks" else block.timestamp
+    if isinstance(position, str):
+        return int(position, 0)
+
+    return position
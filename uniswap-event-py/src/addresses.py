@@ -0,0 +1,78 @@
+from functools import lru_cache
+
+# Number of bytes in an Ethereum address
+ADDRESS_LENGTH = 20
+
+# Most distinct address strings kept normalized at once. The same routers, tokens and senders
+# show up in transaction after transaction, so a hot address is only ever parsed once
+INTERN_SIZE = 1 << 16
+
+
+def parse_address(addr):
+    """
+    Convert a hex address string into its 20-byte value so that differences in case or
+    in the '0x' prefix don't matter when comparing addresses.
+    Return None if the string is not a valid address
+    """
+    if not addr:
+        return None
+
+    if addr[:2] in ("0x", "0X"):
+        addr = addr[2:]
+
+    if len(addr) != ADDRESS_LENGTH * 2:
+        return None
+
+    try:
+        key = bytes.fromhex(addr)
+    except ValueError:
+        return None
+
+    # bytes.fromhex skips whitespace, so e.g. 38 hex digits and 2 spaces decode to 19 bytes
+    if len(key) != ADDRESS_LENGTH:
+        return None
+
+    return key
+
+
+@lru_cache(maxsize=INTERN_SIZE)
+def normalize_address(addr):
+    """
+    Return the 20-byte key of an address in any hex form, or None if it is not valid.
+    Keys are kept in a bounded LRU table, so an address seen again is a single lookup and
+    returns the same bytes object. Use parse_address to load long lists of addresses that are
+    each seen once, so they don't push the hot ones out of the table
+    """
+    return parse_address(addr)
+
+
+def to_hex_address(key):
+    """
+    Return the '0x' prefixed lowercase hex form of a 20-byte key
+    """
+    return "0x" + key.hex()
+
+
+@lru_cache(maxsize=INTERN_SIZE)
+def to_checksum_address(addr):
+    """
+    Return the EIP-55 checksummed form of an address. This needs a keccak hash, so it is only
+    meant for the addresses that are emitted, e.g. in a finding
+    """
+    # web3 is only needed for keccak, once per address
+    from web3 import Web3
+
+    return Web3.toChecksumAddress(to_hex_address(normalize_address(addr)))
+
+
+def get_address_gauges():
+    """
+    Return the size of the address table and its hits and misses, as gauges for the metrics
+    snapshot
+    """
+    info = normalize_address.cache_info()
+    return {
+        "address_table_entries": info.currsize,
+        "address_table_hits": info.hits,
+        "address_table_misses": info.misses,
+    }
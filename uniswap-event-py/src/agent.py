@@ -1,36 +1,49 @@
-import binascii
 import json
 import os
 
-from web3 import logs, Web3
-
 from forta_agent import Finding, FindingType, FindingSeverity
 
-UNISWAP_V2_ROUTER_ADDR = None
-ETHER_THRESHOLD = None
+from src import metrics, slow_capture
+from src.addresses import get_address_gauges
+from src.event_view import EventView, get_event_views
+from src.finding_filter import build_finding_filter, filter_batch_findings, filter_findings
+from src.router_profiles import build_router_index, find_router_profile, get_router_profiles
+from src.swap_window import SwapWindow
+from src.web3_receipt import Web3Receipt
+from src.weth_events import EVENT_LAYOUTS
+from src.windows import WINDOW_TYPES, get_window_position
+
+# Profiles of the routers to watch, and the index that maps each router address to them
+ROUTER_PROFILES = None
+ROUTER_INDEX = None
 EVEREST_ID = None
-CONTRACT_INST = None
-
+# Logs bloom bits of each event's topic hash
+EVENT_BLOOM_MASKS = None
+# Whether the swap windows count blocks or seconds
+WINDOW_TYPE = None
+# Groups the findings raised for the same sender during a burst, None if disabled
+FINDING_FILTER = None
 
-class AttrDict(dict):
-    """
-    Allows a dictionary to act as a class object and attributes can be retrieved with
-    the . "dot" notation or the "['']" square bracket notation. This is a very useful helper
-    class since web3 typically uses square bracket notation and forta-agent uses dot syntax
-    """
+# Each word in the log data is 32 bytes, 64 hex characters
+WORD_LENGTH = 64
+# An address is stored in the last 20 bytes, 40 hex characters, of a topic
+ADDRESS_LENGTH = 40
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.__dict__ = self
+# A logs bloom is 2048 bits, '0x' followed by 512 hex characters
+BLOOM_HEX_LENGTH = 2 + 512
 
 
 def load_config():
     """
-    Load the configuration values from config/agent-settings.json
+    Load the configuration values from config/agent-settings.json and compute the logs bloom
+    bits of the configured routers, so the first transaction costs the same as any other
     """
-    global UNISWAP_V2_ROUTER_ADDR
-    global ETHER_THRESHOLD
+    global ROUTER_PROFILES
+    global ROUTER_INDEX
     global EVEREST_ID
+    global EVENT_BLOOM_MASKS
+    global WINDOW_TYPE
+    global FINDING_FILTER
 
     dirname = os.path.dirname(os.path.abspath(__file__))
     config_file = os.path.join(dirname, "config", "agent-settings.json")
@@ -38,44 +51,205 @@ def load_config():
     with open(config_file, "r") as f:
         data = json.loads(f.read())
 
-    UNISWAP_V2_ROUTER_ADDR = Web3.toChecksumAddress(data["uniswap_v2_router_addr"])
-    ETHER_THRESHOLD = data["ether_threshold_wei"]
     EVEREST_ID = data["everest_id"]
 
+    profiles = get_router_profiles(data)
+    ROUTER_INDEX = build_router_index(profiles)
+    ROUTER_PROFILES = profiles
+
+    EVENT_BLOOM_MASKS = [
+        get_bloom_mask(bytes.fromhex(topic[2:])) for topic in get_event_layouts()
+    ]
+    for profile in profiles:
+        profile.bloom_mask = get_profile_bloom_mask(profile)
+
+    metrics.configure(data.get("metrics"), "uniswap_event")
+    slow_capture.configure(data.get("slow_capture"))
+    metrics.add_collector(get_window_gauges)
+
+    FINDING_FILTER = build_finding_filter(data.get("finding_filter"))
+    metrics.add_collector(get_filter_gauges)
+    metrics.add_collector(get_address_gauges)
+
+    window = data.get("swap_window", {})
+    if window.get("enabled"):
+        WINDOW_TYPE = window.get("type", "blocks")
+        if WINDOW_TYPE not in WINDOW_TYPES:
+            raise ValueError(f"Unknown swap window type: {WINDOW_TYPE}")
+
+        # Each router has its own window, since amounts of different wrapped native tokens
+        # can't be added up
+        for profile in profiles:
+            profile.window = SwapWindow(
+                window["size"], profile.threshold_wei, window.get("max_senders", 500000)
+            )
+
+
+def get_window_gauges():
+    """
+    Return the number of senders tracked by the swap windows of all routers, and the number
+    dropped to stay under their limit, as gauges for the metrics snapshot
+    """
+    windows = [profile.window for profile in ROUTER_PROFILES or [] if profile.window is not None]
+    if not windows:
+        return {}
+
+    return {
+        "window_senders": sum(len(window) for window in windows),
+        "window_evicted": sum(window.evicted for window in windows),
+    }
+
+
+def get_filter_gauges():
+    """
+    Return the finding filter's gauges for the metrics snapshot, if a filter is used
+    """
+    if FINDING_FILTER is None:
+        return {}
+
+    return FINDING_FILTER.get_gauges()
+
+
+def is_stateful():
+    """
+    Return True if the findings for a transaction can depend on the transactions before it,
+    e.g. with the finding filter on. Such transactions must be handed to the agent in order
+    and by a single process, so the replay doesn't split them between workers
+    """
+    windows = [profile.window for profile in ROUTER_PROFILES or [] if profile.window is not None]
+    return FINDING_FILTER is not None or bool(windows)
+
+
+def flush_findings():
+    """
+    Return the findings the agent still holds back, e.g. before it is stopped: the summaries
+    of the finding filter's groups whose window hasn't passed yet
+    """
+    if FINDING_FILTER is None:
+        return []
+
+    return FINDING_FILTER.flush()
+
+
+def get_event_layouts():
+    """
+    Return the table that maps the topic hash of each WETH event checked to its name and to
+    where each of its arguments is stored. The table is compiled from weth_abi.json ahead of
+    time by src/compile_abi.py, so nothing has to be hashed or parsed when the agent starts
+    """
+    return EVENT_LAYOUTS
+
+
+def decode_log_args(log, arg_layout):
+    """
+    Decode the arguments of a log straight from its topics and data.
+    Returns None if the log doesn't hold all of the arguments
+    """
+    args = {}
+    for name, arg_type, indexed, index in arg_layout:
+        if indexed:
+            if len(log.topics) <= index:
+                return None
+            word = log.topics[index][2:]
+        else:
+            start = 2 + index * WORD_LENGTH
+            word = log.data[start:start + WORD_LENGTH]
+
+        if len(word) != WORD_LENGTH:
+            return None
+
+        if arg_type == "address":
+            args[name] = "0x" + word[-ADDRESS_LENGTH:].lower()
+        else:
+            args[name] = int(word, 16)
+
+    return args
+
+
+def decode_weth_events(logs_by_topic, weth_addr):
+    """
+    Decode the Deposit and Withdrawal events emitted by the WETH contract. 'logs_by_topic'
+    is the log index of the event view, so only the logs of these two events are looked at.
+    Returns a dict that maps each event name to a list of decoded arguments, in the order
+    they were emitted, with addresses in lowercase
+    """
+    # Each log is only compared with a single address, which costs less as a lowercase string
+    # than as a lookup in the address table when log addresses aren't seen again
+    events = {}
+    for topic, (event_name, arg_layout) in get_event_layouts().items():
+        decoded = events[event_name] = []
+        for log in logs_by_topic.get(topic, ()):
+            if not log.address or log.address.lower() != weth_addr:
+                continue
+
+            args = decode_log_args(log, arg_layout)
+            if args is not None:
+                decoded.append(args)
+            elif metrics.ENABLED:
+                metrics.increment("decode_failures")
 
-def get_contract_abi():
+    return events
+
+
+def get_bloom_mask(item):
+    """
+    Return the bits an item (an address or a topic, as bytes) sets in a logs bloom, as an
+    integer. Each of the first three pairs of bytes of the item's keccak hash picks one of
+    the 2048 bits
+    """
+    from web3 import Web3
+
+    item_hash = bytes(Web3.keccak(item))
+
+    mask = 0
+    for i in (0, 2, 4):
+        mask |= 1 << (int.from_bytes(item_hash[i:i + 2], "big") & 2047)
+
+    return mask
+
+
+def get_profile_bloom_mask(profile):
     """
-    Given the address of a smart contract, return the abi provided by etherscan as a string
+    Return the bloom bits that must all be set for a receipt to hold an event from the
+    router's wrapped native token about the router: the token address and the router
+    address as a topic
     """
-    # ABI was retrieved from:
-    #   - https://etherscan.io/address/0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2#code
-    with open("weth_abi.json", "r") as f:
-        abi = json.loads(f.read())
+    router_topic = bytes(12) + bytes.fromhex(profile.router_addr[2:])
+    token_mask = get_bloom_mask(bytes.fromhex(profile.wrapped_native_addr[2:]))
 
-    return abi
+    return token_mask | get_bloom_mask(router_topic)
 
 
-def get_contract_instance():
+def bloom_may_have_weth_events(logs_bloom, profiles=None):
     """
-    Get an instance of the contract by using the ABI saved in 'router_abi.json`
-    This will allow us to encode and decode function parameters
+    Check the logs bloom of a receipt to see whether it can hold a Deposit or Withdrawal
+    event about one of the given routers, by default all of them. False means it definitely
+    doesn't. A missing or malformed bloom can't rule anything out, so True is returned
     """
-    global CONTRACT_INST
-    if CONTRACT_INST:
-        return CONTRACT_INST
+    if not logs_bloom or len(logs_bloom) != BLOOM_HEX_LENGTH:
+        return True
+
+    bloom = int(logs_bloom, 16)
+    for event_mask in EVENT_BLOOM_MASKS:
+        if bloom & event_mask == event_mask:
+            break
+    else:
+        return False
+
+    for profile in ROUTER_PROFILES if profiles is None else profiles:
+        if bloom & profile.bloom_mask == profile.bloom_mask:
+            return True
 
-    abi = get_contract_abi()
-    w3 = Web3()
-    CONTRACT_INST = w3.eth.contract(abi=abi)
-    return CONTRACT_INST
+    return False
 
 
-def create_alert(to_addr, from_addr, amount_wad):
+def create_alert(to_addr, from_addr, amount_wad, profile):
     """
     Return an alert with a metadata field that contains
         - to address
         - from address
         - amount in wad format
+        - name of the router profile
     """
     return Finding(
         {
@@ -84,154 +258,214 @@ def create_alert(to_addr, from_addr, amount_wad):
             "alert_id": "AE-UNISWAP-LARGESWAP-EVENT",
             "type": FindingType.Suspicious,
             "severity": FindingSeverity.Low,
-            "metadata": {"from": from_addr, "to": to_addr, "amount": amount_wad},
+            "metadata": {
+                "from": from_addr,
+                "to": to_addr,
+                "amount": amount_wad,
+                "router": profile.name,
+            },
             "everest_id": EVEREST_ID,
         }
     )
 
 
-def handle_transaction(transaction_event):
+def create_window_alert(to_addr, from_addr, amount_wad, total_wad, profile):
     """
-    Entry point for a transaction
+    Return an alert for a swap that brings the total swapped by its sender within the window
+    over the threshold
     """
-    input_data = transaction_event.transaction.data
-    if not input_data:
-        return []
-
-    # Ensure the 'to' field exists (will be a None on contract creation) and that it matches
-    # the UNISWAP_V2_ROUTER_ADDR
-    if (
-        transaction_event.transaction.to
-        and Web3.toChecksumAddress(transaction_event.transaction.to)
-        != UNISWAP_V2_ROUTER_ADDR
-    ):
-        return []
-
-    contract_inst = get_contract_instance()
-
-    attr_logs = []
-    for log in transaction_event.receipt.logs:
-        # Need to convert the hexadecimal string to binary data for web3
-        # Ensure the '0x' is stripped off the beginning of the string before converting
-        # Example:
-        #   - Convert '0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822'
-        #     to b'\xd7\x8a\xd9_\xa4l\x99KeQ\xd0\xda\x85\xfc\'_\xe6\x13\xce7e\x7f\xb8\xd5\xe3\xd10\x84\x01Y\xd8"'
-        new_topics = []
-        for topic in log.topics:
-            new_topics.append(binascii.unhexlify(topic[2:]))
-        """
-        from types.py inside web3 python module
-
-        class LogReceipt(TypedDict):
-            address: ChecksumAddress
-            blockHash: HexBytes
-            blockNumber: BlockNumber
-            data: HexStr
-            logIndex: int
-            payload: HexBytes
-            removed: bool
-            topic: HexBytes
-            topics: Sequence[HexBytes]
-            transactionHash: HexBytes
-            transactionIndex: int
-        """
-        temp_dict = AttrDict(
-            {
-                "address": Web3.toChecksumAddress(log.address),
-                "blockHash": log.block_hash,
-                "blockNumber": log.block_number,
-                "data": log.data,
-                "logIndex": log.log_index,
-                "payload": transaction_event.transaction.data,
-                "removed": log.removed,
-                "topic": new_topics[0],
-                "topics": new_topics,
-                "transactionHash": log.transaction_hash,
-                "transactionIndex": log.transaction_index,
-            }
-        )
-        attr_logs.append(temp_dict)
-
-    """
-    from types.py inside web3 python module
-
-    TxReceipt = TypedDict("TxReceipt", {
-	"blockHash": HexBytes,
-	"blockNumber": BlockNumber,
-	"contractAddress": Optional[ChecksumAddress],
-	"cumulativeGasUsed": int,
-	"effectiveGasPrice": int,
-	"gasUsed": Wei,
-	"from": ChecksumAddress,
-	"logs": List[LogReceipt],
-	"logsBloom": HexBytes,
-	"root": HexStr,
-	"status": int,
-	"to": ChecksumAddress,
-	"transactionHash": HexBytes,
-	"transactionIndex": int,
-    })
-    """
-    tx_receipt = AttrDict(
+    return Finding(
         {
-            "blockHash": transaction_event.receipt.block_hash,
-            "blockNumber": transaction_event.receipt.block_number,
-            "contractAddress": transaction_event.receipt.contract_address,
-            "cumulativeGasUsed": transaction_event.receipt.cumulative_gas_used,
-            "effectiveGasPrice": 0,
-            "gasUsed": transaction_event.receipt.gas_used,
-            "from": transaction_event.transaction.from_,
-            "logs": attr_logs,
-            "logsBloom": transaction_event.receipt.logs_bloom,
-            "root": transaction_event.receipt.root,
-            "status": transaction_event.receipt.status,
-            "to": transaction_event.transaction.to,
-            "transactionHash": transaction_event.receipt.transaction_hash,
-            "transactionIndex": transaction_event.receipt.transaction_index,
+            "name": "Uniswap V2 swap volume detector",
+            "description": "Large swap volume on Uniswap V2 detected",
+            "alert_id": "AE-UNISWAP-LARGESWAP-EVENT-WINDOW",
+            "type": FindingType.Suspicious,
+            "severity": FindingSeverity.Low,
+            "metadata": {
+                "from": from_addr,
+                "to": to_addr,
+                "amount": amount_wad,
+                "total_amount": total_wad,
+                "window": f"{profile.window.size} {WINDOW_TYPE}",
+                "router": profile.name,
+            },
+            "everest_id": EVEREST_ID,
         }
     )
 
-    deposit_logs = contract_inst.events.Deposit().processReceipt(
-        tx_receipt, errors=logs.DISCARD
-    )
-    withdrawal_logs = contract_inst.events.Withdrawal().processReceipt(
-        tx_receipt, errors=logs.DISCARD
-    )
 
-    # If no Deposit or Withdrawal events occurred, don't raise any alerts
-    if not deposit_logs and not withdrawal_logs:
-        return []
+def add_to_window(event_view, amount_wad, profile):
+    """
+    Add a swap under the threshold to its sender's total on the router, to catch a large swap
+    split into many small ones. Returns an alert if the total crossed the threshold,
+    otherwise None
+    """
+    if profile.window is None:
+        return None
+
+    sender = event_view.from_key
+    if sender is None:
+        return None
+
+    transaction_event = event_view.transaction_event
+    position = get_window_position(transaction_event, WINDOW_TYPE)
+    if position is None:
+        return None
+
+    total_wad = profile.window.add(sender, amount_wad, position)
+    if total_wad is None:
+        return None
+
+    transaction = event_view.transaction
+    return create_window_alert(transaction.to, transaction.from_, amount_wad, total_wad, profile)
+
+
+def build_web3_receipt(transaction_event):
+    """
+    Return the receipt of a transaction in the format web3 expects, e.g. for
+    processReceipt(). This is not needed to check for large swaps, which decodes the
+    logs directly. The fields of the receipt and its logs are only converted when they
+    are read
+    """
+    return Web3Receipt(transaction_event)
+
+
+def create_swap_alerts(event_view, events, profile):
+    """
+    Return alerts for the decoded Deposit and Withdrawal events of a transaction that move
+    more than the router's threshold to or from the router, or that bring the total moved by
+    the sender within the window over the threshold
+    """
+    router_addr = profile.router_addr
+    threshold_wei = profile.threshold_wei
+    transaction = event_view.transaction
 
     alerts = []
-    # Record any Deposit events that are sent to the Uniswap V2 Router address
-    # that are above the threshold
-    for event in deposit_logs:
-        if event["args"]["dst"] == UNISWAP_V2_ROUTER_ADDR:
-            if event["args"]["wad"] < ETHER_THRESHOLD:
+    # Record any Deposit events that are sent to the router address that are above the
+    # threshold
+    for event in events["Deposit"]:
+        if event["dst"] == router_addr:
+            if event["wad"] < threshold_wei:
+                if metrics.ENABLED:
+                    metrics.increment("rejected_below_threshold")
+                alert = add_to_window(event_view, event["wad"], profile)
+                if alert is not None:
+                    alerts.append(alert)
                 continue
 
-            alert = create_alert(
-                transaction_event.transaction.to,
-                transaction_event.transaction.from_,
-                event["args"]["wad"],
-            )
+            alert = create_alert(transaction.to, transaction.from_, event["wad"], profile)
             alerts.append(alert)
 
-    # Record any Withdrawal events that are sent from the Uniswap V2 Router address
-    # that are above the threshold
-    for event in withdrawal_logs:
-        if event["args"]["src"] == UNISWAP_V2_ROUTER_ADDR:
-            if event["args"]["wad"] < ETHER_THRESHOLD:
+    # Record any Withdrawal events that are sent from the router address that are above the
+    # threshold
+    for event in events["Withdrawal"]:
+        if event["src"] == router_addr:
+            if event["wad"] < threshold_wei:
+                if metrics.ENABLED:
+                    metrics.increment("rejected_below_threshold")
+                alert = add_to_window(event_view, event["wad"], profile)
+                if alert is not None:
+                    alerts.append(alert)
                 continue
 
-            alert = create_alert(
-                transaction_event.transaction.to,
-                transaction_event.transaction.from_,
-                event["args"]["wad"],
-            )
+            alert = create_alert(transaction.to, transaction.from_, event["wad"], profile)
             alerts.append(alert)
 
     return alerts
 
 
+def find_large_swaps(event_view, router_index):
+    """
+    Return alerts for the large swaps in a transaction sent to one of the routers in
+    'router_index'
+    """
+    if metrics.ENABLED:
+        metrics.increment("transactions")
+
+    transaction_event = event_view.transaction_event
+    input_data = event_view.transaction.data
+    if not input_data:
+        if metrics.ENABLED:
+            metrics.increment("rejected_no_calldata")
+        return []
+
+    # Ensure the 'to' field exists and that it is one of the routers on this chain. This is a
+    # single lookup however many routers are watched. A contract creation has no 'to' and
+    # calls no router, so its logs aren't decoded, even if its constructor wraps ETH
+    to_key = event_view.to_key
+    profile = None
+    if to_key is not None:
+        profile = find_router_profile(router_index, to_key, transaction_event.network)
+    if profile is None:
+        if metrics.ENABLED:
+            metrics.increment("rejected_not_router")
+        return []
+
+    # Most router transactions can be ruled out from the logs bloom without reading any logs
+    if not bloom_may_have_weth_events(transaction_event.receipt.logs_bloom, (profile,)):
+        if metrics.ENABLED:
+            metrics.increment("rejected_bloom")
+        return []
+
+    token_addr = profile.wrapped_native_addr
+    if metrics.ENABLED:
+        events = metrics.timed(
+            "decode", decode_weth_events, event_view.logs_by_topic, token_addr
+        )
+    else:
+        events = decode_weth_events(event_view.logs_by_topic, token_addr)
+
+    # If no Deposit or Withdrawal events occurred, don't raise any alerts
+    if not events["Deposit"] and not events["Withdrawal"]:
+        if metrics.ENABLED:
+            metrics.increment("rejected_no_events")
+        return []
+
+    if not metrics.ENABLED:
+        return create_swap_alerts(event_view, events, profile)
+
+    alerts = metrics.timed("finding", create_swap_alerts, event_view, events, profile)
+    metrics.increment("findings", len(alerts))
+    return alerts
+
+
+@slow_capture.captured
+def handle_transaction(transaction_event, event_view=None):
+    """
+    Entry point for a transaction. 'event_view' is the decoded view of the event, if the
+    caller shares one between several detectors
+    """
+    findings = find_large_swaps(event_view or EventView(transaction_event), ROUTER_INDEX)
+    if FINDING_FILTER is None:
+        return findings
+
+    return filter_findings(FINDING_FILTER, transaction_event, findings)
+
+
+@slow_capture.captured
+def handle_transaction_batch(transaction_events, logs_bloom=None, event_views=None):
+    """
+    Entry point for a batch of transactions, e.g. every transaction in a block. Returns the
+    same alerts, in the same order, as calling handle_transaction on each transaction.
+    If the logs bloom of the whole block is given and it rules out events about any of the
+    routers, none of the transactions are looked at. 'event_views' are the decoded views of
+    the events, if the caller shares them between several detectors
+    """
+    # The alerts of each transaction
+    tx_alerts = []
+    if logs_bloom and not bloom_may_have_weth_events(logs_bloom):
+        if metrics.ENABLED:
+            metrics.increment("transactions", len(transaction_events))
+            metrics.increment("rejected_bloom", len(transaction_events))
+        if FINDING_FILTER is None:
+            return []
+        tx_alerts = [[] for _ in transaction_events]
+    else:
+        router_index = ROUTER_INDEX
+        for event_view in get_event_views(transaction_events, event_views):
+            tx_alerts.append(find_large_swaps(event_view, router_index))
+
+    return filter_batch_findings(FINDING_FILTER, transaction_events, tx_alerts)
+
+
 load_config()
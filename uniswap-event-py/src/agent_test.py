@@ -2,10 +2,21 @@ import json
 import os
 
 import pytest
-from web3 import Web3
+from web3 import logs, Web3
 
 from forta_agent import Finding, FindingSeverity, FindingType, create_transaction_event
-from agent import handle_transaction, AttrDict
+
+import agent
+from agent import (
+    handle_transaction,
+    handle_transaction_batch,
+    bloom_may_have_weth_events,
+    build_web3_receipt,
+    decode_weth_events,
+    get_bloom_mask,
+)
+from compile_abi import get_contract_abi
+from event_view import EventView
 
 
 BURN_ADDR = "0x000000000000000000000000000000000000dEaD"
@@ -68,35 +79,41 @@ def gen_tx_data(value="0", from_=BURN_ADDR, to=BURN_ADDR, data="0x"):
     return {"transaction": transaction_data}
 
 
-def gen_tx_receipt(event=None):
+def gen_logs_bloom(events):
     """
-    Generate a transaction receipt to be used in creating a mock transaction
+    Generate the logs bloom of a receipt that holds the given events
     """
-    logs = []
-    if event == "deposit":
-        logs.append(gen_log_receipt("deposit"))
+    bloom = 0
+    for event in events:
+        log = gen_log_receipt(event)
+        for item in [log["address"]] + log["topics"]:
+            bloom |= get_bloom_mask(bytes.fromhex(item[2:]))
 
-    elif event == "withdrawal":
-        logs.append(gen_log_receipt("withdrawal"))
+    return "0x" + bloom.to_bytes(256, "big").hex()
 
-    elif event == "swap":
-        logs.append(gen_log_receipt("swap"))
 
-    temp_dict = AttrDict(
-        {
-            "status": True,
-            "root": "",
-            "cumulative_gas_used": 0,
-            "gas_used": 0,
-            "logs_bloom": "0x0",
-            "logs": logs,
-            "contract_address": None,
-            "block_hash": "0x0",
-            "block_number": 1,
-        }
-    )
+def gen_tx_receipt(event=None, events=None, logs_bloom="0x0"):
+    """
+    Generate a transaction receipt to be used in creating a mock transaction
+    """
+    if events is None:
+        events = [event] if event else []
+
+    logs = [gen_log_receipt(event) for event in events]
+
+    temp_dict = {
+        "status": True,
+        "root": "",
+        "cumulative_gas_used": 0,
+        "gas_used": 0,
+        "logs_bloom": logs_bloom,
+        "logs": logs,
+        "contract_address": None,
+        "block_hash": "0x0",
+        "block_number": 1,
+    }
 
-    return AttrDict({"receipt": temp_dict})
+    return {"receipt": temp_dict}
 
 
 def gen_log_receipt(event):
@@ -152,13 +169,13 @@ def gen_log_receipt(event):
     }
 
     if event == "deposit":
-        return AttrDict(deposit_event)
+        return deposit_event
     elif event == "withdrawal":
-        return AttrDict(withdrawal_event)
+        return withdrawal_event
     elif event == "swap":
-        return AttrDict(swap_event)
+        return swap_event
 
-    return AttrDict({})
+    return {}
 
 
 def test_transaction_normal(uniswap_v2_router_addr):
@@ -207,3 +224,325 @@ def test_transaction_withdraw_event(alert, uniswap_v2_router_addr):
 
     assert len(findings) == 1
     check_alerts(alert, findings[0])
+
+
+def test_transaction_contract_creation():
+    """
+    Mock a contract creation, which has no 'to' address, that emits a Deposit event
+    This should not raise an alert, since no router was called
+    """
+    tx_dict = gen_tx_data(to=None, data="0x6080")
+    tx_dict.update(gen_tx_receipt(event="deposit"))
+
+    tx_event = create_transaction_event(tx_dict)
+
+    assert handle_transaction(tx_event) == []
+    assert handle_transaction_batch([tx_event]) == []
+
+
+@pytest.fixture
+def weth_addr():
+    """
+    Load the configurable WETH address.
+    """
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    config_file = os.path.join(dirname, "config", "agent-settings.json")
+
+    with open(config_file, "r") as f:
+        data = json.loads(f.read())
+
+    return data["weth_addr"]
+
+
+def test_decode_matches_process_receipt(uniswap_v2_router_addr, weth_addr):
+    """
+    Decoding the logs directly should give the same events as web3's processReceipt
+    """
+    tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+    tx_dict.update(gen_tx_receipt(events=["swap", "withdrawal", "deposit", "withdrawal"]))
+    tx_event = create_transaction_event(tx_dict)
+
+    events = decode_weth_events(EventView(tx_event).logs_by_topic, weth_addr)
+
+    contract_inst = Web3().eth.contract(abi=get_contract_abi())
+    tx_receipt = build_web3_receipt(tx_event)
+    for event_name, arg_name in (("Deposit", "dst"), ("Withdrawal", "src")):
+        expected = contract_inst.events[event_name]().processReceipt(
+            tx_receipt, errors=logs.DISCARD
+        )
+
+        assert len(events[event_name]) == len(expected)
+        for decoded, event in zip(events[event_name], expected):
+            assert decoded["wad"] == event["args"]["wad"]
+            assert decoded[arg_name] == event["args"][arg_name].lower()
+
+
+def test_transaction_deposit_other_contract(uniswap_v2_router_addr):
+    """
+    Mock a transaction with a Deposit event that was not emitted by the WETH contract
+    This should not raise an alert
+    """
+    tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+    tx_dict.update(gen_tx_receipt(event="deposit"))
+    tx_dict["receipt"]["logs"][0]["address"] = BURN_ADDR
+
+    tx_event = create_transaction_event(tx_dict)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 0
+
+
+def test_transaction_truncated_event(uniswap_v2_router_addr):
+    """
+    Mock a transaction with a Withdrawal event that is missing its data
+    This should not raise an alert
+    """
+    tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+    tx_dict.update(gen_tx_receipt(event="withdrawal"))
+    tx_dict["receipt"]["logs"][0]["data"] = "0x"
+
+    tx_event = create_transaction_event(tx_dict)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 0
+
+
+def test_transaction_multiple_events(uniswap_v2_router_addr):
+    """
+    Mock a transaction that emits both a Deposit and a Withdrawal event
+    This will raise an alert for each of them, deposits first
+    """
+    tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+    tx_dict.update(gen_tx_receipt(events=["withdrawal", "swap", "deposit"]))
+
+    tx_event = create_transaction_event(tx_dict)
+    findings = handle_transaction(tx_event)
+
+    assert [finding.metadata["amount"] for finding in findings] == [
+        0x5623309CAFE37C00,
+        0x7375695A9E01CA7A,
+    ]
+
+
+def test_bloom_prescreen():
+    """
+    The logs bloom should only rule out receipts that can't hold a WETH event
+    """
+    assert bloom_may_have_weth_events(gen_logs_bloom(["deposit"]))
+    assert bloom_may_have_weth_events(gen_logs_bloom(["swap", "withdrawal"]))
+    assert not bloom_may_have_weth_events(gen_logs_bloom(["swap"]))
+    assert not bloom_may_have_weth_events("0x" + "00" * 256)
+
+    # A missing or malformed bloom can't rule anything out
+    assert bloom_may_have_weth_events(None)
+    assert bloom_may_have_weth_events("0x0")
+
+
+def test_transaction_deposit_event_with_bloom(alert, uniswap_v2_router_addr):
+    """
+    Mock a transaction that emits a Deposit event and has a matching logs bloom
+    This will raise an alert
+    """
+    tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+    tx_dict.update(gen_tx_receipt(event="deposit", logs_bloom=gen_logs_bloom(["deposit"])))
+
+    tx_event = create_transaction_event(tx_dict)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 1
+    check_alerts(alert, findings[0])
+
+
+def test_transaction_rejected_by_bloom(uniswap_v2_router_addr):
+    """
+    Mock a transaction whose logs bloom rules out WETH events. The logs should not be
+    read at all, so the Deposit log is never seen
+    This should not raise an alert
+    """
+    tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+    tx_dict.update(gen_tx_receipt(event="deposit", logs_bloom=gen_logs_bloom(["swap"])))
+
+    tx_event = create_transaction_event(tx_dict)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 0
+
+
+def test_transaction_batch(uniswap_v2_router_addr):
+    """
+    Checking a batch of transactions should give the same alerts as checking them one by one
+    """
+    receipts = [
+        gen_tx_receipt(),
+        gen_tx_receipt(event="deposit"),
+        gen_tx_receipt(events=["swap", "withdrawal"], logs_bloom=gen_logs_bloom(["swap", "withdrawal"])),
+        gen_tx_receipt(event="deposit", logs_bloom=gen_logs_bloom(["swap"])),
+        gen_tx_receipt(events=["deposit", "withdrawal"]),
+    ]
+    tx_events = []
+    for receipt in receipts:
+        tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+        tx_dict.update(receipt)
+        tx_events.append(create_transaction_event(tx_dict))
+
+    # A transaction with a Deposit event that was not sent to the router
+    tx_dict = gen_tx_data()
+    tx_dict.update(gen_tx_receipt(event="deposit"))
+    tx_events.append(create_transaction_event(tx_dict))
+
+    expected = [finding for tx_event in tx_events for finding in handle_transaction(tx_event)]
+    findings = handle_transaction_batch(tx_events)
+
+    assert len(findings) == 4
+    assert [finding.toJson() for finding in findings] == [
+        finding.toJson() for finding in expected
+    ]
+
+    # The block's logs bloom covers every transaction in it
+    block_bloom = gen_logs_bloom(["swap", "withdrawal", "deposit"])
+    assert len(handle_transaction_batch(tx_events, block_bloom)) == 4
+    assert handle_transaction_batch(tx_events, gen_logs_bloom(["swap"])) == []
+
+
+def test_metrics(uniswap_v2_router_addr):
+    """
+    With instrumentation on, the agent should count the transactions rejected by each
+    filter, the logs it failed to decode and its findings
+    """
+    receipts = [
+        gen_tx_receipt(),
+        gen_tx_receipt(event="deposit"),
+        gen_tx_receipt(event="deposit", logs_bloom=gen_logs_bloom(["swap"])),
+    ]
+    tx_dicts = []
+    for receipt in receipts:
+        tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+        tx_dict.update(receipt)
+        tx_dicts.append(tx_dict)
+
+    # A truncated Withdrawal event, and a transaction that was not sent to the router
+    tx_dicts.append(gen_tx_data(to=uniswap_v2_router_addr))
+    tx_dicts[-1].update(gen_tx_receipt(event="withdrawal"))
+    tx_dicts[-1]["receipt"]["logs"][0]["data"] = "0x"
+    tx_dicts.append(gen_tx_data())
+
+    agent.metrics.configure({"enabled": True})
+    try:
+        for tx_dict in tx_dicts:
+            handle_transaction(create_transaction_event(tx_dict))
+        snapshot = agent.metrics.get_snapshot()
+    finally:
+        agent.metrics.configure({"enabled": False})
+
+    assert snapshot["counters"] == {
+        "transactions": 5,
+        "rejected_no_events": 2,
+        "findings": 1,
+        "rejected_bloom": 1,
+        "decode_failures": 1,
+        "rejected_not_router": 1,
+    }
+    assert snapshot["timings"]["decode"]["count"] == 3
+    assert snapshot["timings"]["finding"]["count"] == 1
+
+
+def test_transaction_split_swaps(uniswap_v2_router_addr, monkeypatch):
+    """
+    Mock several transactions from the same address, each moving less than the threshold
+    This should raise a single alert once their total crosses the threshold
+    """
+    threshold = Web3.toWei("20", "ether")
+    profile = agent.ROUTER_PROFILES[0]
+    monkeypatch.setattr(profile, "threshold_wei", threshold)
+    monkeypatch.setattr(profile, "window", agent.SwapWindow(100, threshold))
+    monkeypatch.setattr(agent, "WINDOW_TYPE", "blocks")
+
+    findings = []
+    for block_number, event in enumerate(["deposit", "withdrawal", "deposit", "withdrawal"], 1000):
+        tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+        tx_dict.update(gen_tx_receipt(event=event))
+        tx_dict["transaction"]["from"] = BURN_ADDR
+        tx_dict["block"] = {"number": block_number}
+        findings.extend(handle_transaction(create_transaction_event(tx_dict)))
+
+    assert len(findings) == 1
+    assert findings[0].alert_id == "AE-UNISWAP-LARGESWAP-EVENT-WINDOW"
+    assert findings[0].metadata["total_amount"] == 2 * 0x5623309CAFE37C00 + 0x7375695A9E01CA7A
+
+
+def test_transaction_router_profiles(alert, uniswap_v2_router_addr, monkeypatch):
+    """
+    Mock the same router deployed on Goerli with its own wrapped native token
+    Each chain should only alert on the events of its own token
+    """
+    goerli_token_addr = "0xb4fbf271143f4fbf7b91a5ded31805e42b2208d6"
+    profiles = agent.get_router_profiles(
+        {
+            "uniswap_v2_router_addr": uniswap_v2_router_addr,
+            "weth_addr": "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2",
+            "ether_threshold_wei": 5000000000000000000,
+            "chain_id": 1,
+            "routers": [
+                {
+                    "name": "uniswap-v2-goerli",
+                    "router_addr": uniswap_v2_router_addr,
+                    "wrapped_native_addr": goerli_token_addr,
+                    "chain_id": 5,
+                }
+            ],
+        }
+    )
+    monkeypatch.setattr(agent, "ROUTER_INDEX", agent.build_router_index(profiles))
+
+    goerli_log = {**gen_log_receipt("deposit"), "address": goerli_token_addr}
+
+    def find(network, log):
+        tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+        tx_dict.update(gen_tx_receipt())
+        tx_dict["receipt"]["logs"] = [log]
+        tx_dict["network"] = network
+        return handle_transaction(create_transaction_event(tx_dict))
+
+    findings = find(1, gen_log_receipt("deposit"))
+    assert len(findings) == 1
+    check_alerts(alert, findings[0])
+    assert findings[0].metadata["router"] == "uniswap-v2"
+
+    findings = find(5, goerli_log)
+    assert len(findings) == 1
+    assert findings[0].metadata["router"] == "uniswap-v2-goerli"
+
+    assert find(5, gen_log_receipt("deposit")) == []
+    assert find(1, goerli_log) == []
+    # No profile covers the router on Rinkeby
+    assert find(4, gen_log_receipt("deposit")) == []
+
+
+def test_finding_filter(uniswap_v2_router_addr, monkeypatch):
+    """
+    With the finding filter on, a burst of large swaps from the same address should raise
+    one alert, then a summary with the count once the window has passed
+    """
+    key_fields = {"AE-UNISWAP-LARGESWAP-EVENT": ["from", "router"]}
+    finding_filter = agent.build_finding_filter(
+        {"enabled": True, "size": 10, "key_fields": key_fields}
+    )
+    monkeypatch.setattr(agent, "FINDING_FILTER", finding_filter)
+
+    findings = []
+    for block_number in range(1000, 1004):
+        tx_dict = gen_tx_data(to=uniswap_v2_router_addr)
+        tx_dict.update(gen_tx_receipt(event="withdrawal"))
+        tx_dict["transaction"]["from"] = BURN_ADDR
+        tx_dict["block"] = {"number": block_number}
+        findings.extend(handle_transaction(create_transaction_event(tx_dict)))
+    assert [finding.alert_id for finding in findings] == ["AE-UNISWAP-LARGESWAP-EVENT"]
+
+    # A later block without swaps closes the window
+    findings = handle_transaction_batch(
+        [create_transaction_event({"block": {"number": 1010}})], logs_bloom="0x" + "0" * 512
+    )
+    assert len(findings) == 1
+    assert findings[0].alert_id == "AE-UNISWAP-LARGESWAP-EVENT-SUMMARY"
+    assert findings[0].metadata["router"] == "uniswap-v2"
+    assert findings[0].metadata["count"] == 4
@@ -0,0 +1,101 @@
+import json
+import os
+
+from web3 import Web3
+
+# Module the compiled event table is written to, imported by the agent
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weth_events.py")
+
+# WETH events that are checked for large swaps
+WETH_EVENTS = ("Deposit", "Withdrawal")
+
+HEADER = '''"""
+WETH events checked by the agent, compiled from weth_abi.json by src/compile_abi.py.
+Do not edit, run `npm run build:abi` instead
+"""
+
+# Topic hash -> (event name, arguments). Each argument is (name, type, indexed, position),
+# where position is the index of the topic for indexed arguments and the index of the word
+# in the log data for the others
+'''
+
+
+def get_contract_abi():
+    """
+    Return the WETH ABI saved in 'weth_abi.json' as a list
+    """
+    # The saved ABI is a JSON string, as returned by etherscan
+    with open("weth_abi.json", "r") as f:
+        return json.loads(json.loads(f.read()))
+
+
+def get_event_topic(event_abi):
+    """
+    Return the topic hash of an event in the ABI as a hex string
+    """
+    arg_types = ",".join(arg["type"] for arg in event_abi["inputs"])
+    signature = f"{event_abi['name']}({arg_types})"
+
+    return "0x" + bytes(Web3.keccak(text=signature)).hex()
+
+
+def get_arg_layout(event_abi):
+    """
+    Return where each argument of an event is stored. Indexed arguments are stored in the
+    topics after the topic hash, and the others in order in the log data
+    """
+    arg_layout = []
+    topic_index = 1
+    data_index = 0
+    for arg in event_abi["inputs"]:
+        if arg["indexed"]:
+            arg_layout.append((arg["name"], arg["type"], True, topic_index))
+            topic_index += 1
+        else:
+            arg_layout.append((arg["name"], arg["type"], False, data_index))
+            data_index += 1
+
+    return tuple(arg_layout)
+
+
+def compile_event_layouts(abi):
+    """
+    Build the table of the events in WETH_EVENTS, keyed on topic hash
+    """
+    layouts = {}
+    for event_abi in abi:
+        if event_abi.get("type") != "event" or event_abi["name"] not in WETH_EVENTS:
+            continue
+
+        layouts[get_event_topic(event_abi)] = (event_abi["name"], get_arg_layout(event_abi))
+
+    return layouts
+
+
+def render_module(abi):
+    """
+    Return the source of the compiled module
+    """
+    lines = [HEADER, "EVENT_LAYOUTS = {\n"]
+    for topic, (name, arg_layout) in sorted(compile_event_layouts(abi).items()):
+        lines.append(f'    "{topic}": (\n')
+        lines.append(f'        "{name}",\n')
+        lines.append("        (\n")
+        for arg_name, arg_type, indexed, index in arg_layout:
+            lines.append(f'            ("{arg_name}", "{arg_type}", {indexed}, {index}),\n')
+        lines.append("        ),\n")
+        lines.append("    ),\n")
+    lines.append("}\n")
+
+    return "".join(lines)
+
+
+def main():
+    with open(OUTPUT_PATH, "w") as f:
+        f.write(render_module(get_contract_abi()))
+
+    print(f"Wrote {OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from web3 import Web3
+
+from compile_abi import OUTPUT_PATH, get_contract_abi, render_module
+from weth_events import EVENT_LAYOUTS
+
+
+def test_compiled_module_is_up_to_date():
+    """
+    weth_events.py should match what the build step generates from weth_abi.json.
+    If this fails run `npm run build:abi`
+    """
+    with open(OUTPUT_PATH, "r") as f:
+        compiled = f.read()
+
+    assert compiled == render_module(get_contract_abi())
+
+
+def test_compiled_layouts_match_abi():
+    """
+    Every compiled topic hash should belong to the event of the same name, with the same
+    arguments in the same order
+    """
+    contract = Web3().eth.contract(abi=get_contract_abi())
+
+    assert sorted(name for name, _ in EVENT_LAYOUTS.values()) == ["Deposit", "Withdrawal"]
+    for topic, (name, arg_layout) in EVENT_LAYOUTS.items():
+        event_abi = getattr(contract.events, name)._get_event_abi()
+        assert [arg["name"] for arg in event_abi["inputs"]] == [arg[0] for arg in arg_layout]
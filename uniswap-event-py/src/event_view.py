@@ -0,0 +1,123 @@
+from src.addresses import normalize_address, parse_address
+
+# Marks a field that hasn't been decoded yet, since None is a valid value
+UNSET = object()
+
+
+class EventView:
+    """
+    The fields of a transaction event that detectors look at, decoded once and shared by
+    every detector the event is handed to: the method id, the 20-byte keys of the addresses,
+    the calldata as bytes and an index of the logs by event topic. Each field is decoded the
+    first time it is read, so a field no detector reads costs nothing
+    """
+
+    __slots__ = (
+        "transaction_event",
+        "transaction",
+        "_selector",
+        "_to_key",
+        "_from_key",
+        "_address_keys",
+        "_calldata",
+        "_logs_by_topic",
+    )
+
+    def __init__(self, transaction_event):
+        self.transaction_event = transaction_event
+        self.transaction = transaction_event.transaction
+        self._selector = UNSET
+        self._to_key = UNSET
+        self._from_key = UNSET
+        self._address_keys = None
+        self._calldata = UNSET
+        self._logs_by_topic = None
+
+    @property
+    def selector(self):
+        """
+        The '0x' prefixed method id of the calldata, or None if the calldata is too short
+        """
+        if self._selector is UNSET:
+            data = self.transaction.data
+            self._selector = data[:10] if data and len(data) >= 10 else None
+
+        return self._selector
+
+    @property
+    def to_key(self):
+        """
+        The 20-byte key of the 'to' address, or None on contract creation. Routers and tokens
+        are seen again and again, so this goes through the table of normalized addresses
+        """
+        if self._to_key is UNSET:
+            to_addr = self.transaction.to
+            self._to_key = normalize_address(to_addr) if to_addr else None
+
+        return self._to_key
+
+    @property
+    def from_key(self):
+        """
+        The 20-byte key of the sender, or None if the event has none
+        """
+        if self._from_key is UNSET:
+            from_addr = self.transaction.from_
+            self._from_key = normalize_address(from_addr) if from_addr else None
+
+        return self._from_key
+
+    @property
+    def address_keys(self):
+        """
+        Dict of every address involved in the transaction, as given, to its 20-byte key or
+        None if it isn't valid. Most of these are only seen once, so they are parsed without
+        the table of normalized addresses
+        """
+        if self._address_keys is None:
+            self._address_keys = {
+                addr: parse_address(addr) for addr in self.transaction_event.addresses
+            }
+
+        return self._address_keys
+
+    @property
+    def calldata(self):
+        """
+        The calldata as a bytes buffer, including the method id, or None if it is missing or
+        isn't valid hex
+        """
+        if self._calldata is UNSET:
+            data = self.transaction.data
+            try:
+                self._calldata = bytes.fromhex(data[2:]) if data else None
+            except ValueError:
+                self._calldata = None
+
+        return self._calldata
+
+    @property
+    def logs_by_topic(self):
+        """
+        Dict of the lowercase first topic of each log, i.e. its event signature hash, to the
+        logs that have it, in the order they were emitted. Logs without topics are left out
+        """
+        if self._logs_by_topic is None:
+            logs_by_topic = {}
+            for log in self.transaction_event.receipt.logs:
+                if log.topics:
+                    logs_by_topic.setdefault(log.topics[0].lower(), []).append(log)
+            self._logs_by_topic = logs_by_topic
+
+        return self._logs_by_topic
+
+
+def get_event_views(transaction_events, event_views=None):
+    """
+    Return the views of a batch of transaction events: 'event_views' if the caller, e.g. a
+    host running several detectors, already built them, otherwise new ones
+    """
+    if event_views is not None:
+        return event_views
+
+    return [EventView(transaction_event) for transaction_event in transaction_events]
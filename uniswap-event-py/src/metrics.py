@@ -0,0 +1,263 @@
+import json
+import os
+import re
+import threading
+import time
+
+# Instrumentation is off unless enabled in the agent settings. The agent only checks this
+# flag on its hot path, so nothing else is done per transaction while it is off
+ENABLED = False
+# True while ENABLED was only turned on by a slow call capture, for its stage timings, rather
+# than by the settings
+TIMING_ONLY = False
+
+# Counter name -> value
+COUNTERS = {}
+# Stage name -> [number of calls, total nanoseconds, slowest call in nanoseconds]
+TIMINGS = {}
+# Functions called when a snapshot is taken, each returning a dict of gauge name -> value
+COLLECTORS = []
+# Stage name -> nanoseconds spent in the current agent call, while a slow call capture is
+# timing one, otherwise None
+CALL_TIMINGS = None
+
+EXPORTER = None
+
+EXPORT_FORMATS = ("prometheus", "json")
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "export_path": "",
+    "export_format": "prometheus",
+    "export_interval_seconds": 60,
+    "prefix": "forta_agent",
+}
+
+# Characters that are not allowed in a Prometheus metric name
+INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def increment(name, value=1):
+    """
+    Add to a counter
+    """
+    COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def record_time(stage, elapsed_ns):
+    """
+    Record how long one call of a stage took
+    """
+    if CALL_TIMINGS is not None:
+        CALL_TIMINGS[stage] = CALL_TIMINGS.get(stage, 0) + elapsed_ns
+
+    timing = TIMINGS.get(stage)
+    if timing is None:
+        TIMINGS[stage] = [1, elapsed_ns, elapsed_ns]
+        return
+
+    timing[0] += 1
+    timing[1] += elapsed_ns
+    if elapsed_ns > timing[2]:
+        timing[2] = elapsed_ns
+
+
+def timed(stage, func, *args):
+    """
+    Call a function and record how long it took as one call of a stage
+    """
+    start = time.perf_counter_ns()
+    result = func(*args)
+    record_time(stage, time.perf_counter_ns() - start)
+
+    return result
+
+
+def add_collector(collector):
+    """
+    Register a function that returns gauges to include in every snapshot
+    """
+    if collector not in COLLECTORS:
+        COLLECTORS.append(collector)
+
+
+def reset():
+    """
+    Clear all counters and timings
+    """
+    COUNTERS.clear()
+    TIMINGS.clear()
+
+
+def get_snapshot(errors=None):
+    """
+    Return the current counters, stage timings and gauges as a dict. A gauge collector that
+    raises is left out, and its error appended to 'errors' if given
+    """
+    # Copy the dicts first, the agent may be updating them on another thread
+    counters = dict(COUNTERS)
+    timings = {}
+    for stage, (count, total_ns, max_ns) in dict(TIMINGS).items():
+        timings[stage] = {
+            "count": count,
+            "total_seconds": total_ns / 1e9,
+            "avg_seconds": total_ns / count / 1e9,
+            "max_seconds": max_ns / 1e9,
+        }
+
+    gauges = {}
+    for collector in COLLECTORS:
+        try:
+            gauges.update(collector() or {})
+        except Exception as e:
+            if errors is not None:
+                errors.append(e)
+
+    return {"timestamp": time.time(), "counters": counters, "timings": timings, "gauges": gauges}
+
+
+def get_metric_name(prefix, name):
+    return INVALID_NAME_CHARS.sub("_", f"{prefix}_{name}")
+
+
+def format_prometheus(snapshot, prefix):
+    """
+    Format a snapshot in the Prometheus text exposition format
+    """
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = get_metric_name(prefix, name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+
+    if snapshot["timings"]:
+        metric = get_metric_name(prefix, "stage_seconds")
+        lines.append(f"# TYPE {metric} summary")
+        for stage, timing in sorted(snapshot["timings"].items()):
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {timing["total_seconds"]:.9f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {timing["count"]}')
+
+        metric = get_metric_name(prefix, "stage_max_seconds")
+        lines.append(f"# TYPE {metric} gauge")
+        for stage, timing in sorted(snapshot["timings"].items()):
+            lines.append(f'{metric}{{stage="{stage}"}} {timing["max_seconds"]:.9f}')
+
+    for name, value in sorted(snapshot["gauges"].items()):
+        metric = get_metric_name(prefix, name)
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def format_snapshot(snapshot, export_format, prefix):
+    if export_format == "json":
+        return json.dumps(snapshot, indent=2, sort_keys=True) + "\n"
+
+    return format_prometheus(snapshot, prefix)
+
+
+def write_snapshot(path, export_format, prefix):
+    """
+    Write a snapshot to a file. The file is written next to 'path' and then renamed over it,
+    so a collector reading it never sees a partial snapshot. Returns the errors of the gauge
+    collectors that were left out
+    """
+    errors = []
+    snapshot = get_snapshot(errors)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(format_snapshot(snapshot, export_format, prefix))
+
+    os.replace(tmp_path, path)
+    return errors
+
+
+class MetricsExporter:
+    """
+    Writes a metrics snapshot to a file at a fixed interval on a background thread, e.g. for
+    the node exporter's textfile collector
+    """
+
+    def __init__(self, path, export_format="prometheus", prefix="forta_agent", interval=60):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown metrics export format: {export_format}")
+
+        self.path = path
+        self.export_format = export_format
+        self.prefix = prefix
+        self.interval = interval
+        self.last_error = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def export(self):
+        """
+        Write a snapshot now. Returns False if the file could not be written. A gauge
+        collector that fails is left out of the snapshot, with its error in 'last_error', so
+        the exporter thread keeps going whatever a collector does
+        """
+        try:
+            errors = write_snapshot(self.path, self.export_format, self.prefix)
+        except Exception as e:
+            self.last_error = e
+            return False
+
+        self.last_error = errors[-1] if errors else None
+        return True
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.export()
+
+    def start(self):
+        """
+        Start exporting on a daemon thread
+        """
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop exporting, write a last snapshot and wait for the background thread to finish
+        """
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        self.export()
+
+
+def configure(settings, default_prefix="forta_agent"):
+    """
+    Enable or disable instrumentation from the "metrics" section of the agent settings, and
+    start exporting snapshots if an export path is set
+    """
+    global ENABLED
+    global TIMING_ONLY
+    global EXPORTER
+
+    settings = {**DEFAULT_SETTINGS, "prefix": default_prefix, **(settings or {})}
+
+    if EXPORTER is not None:
+        EXPORTER.stop()
+        EXPORTER = None
+
+    reset()
+    ENABLED = bool(settings["enabled"])
+    TIMING_ONLY = False
+    if not ENABLED or not settings["export_path"]:
+        return
+
+    EXPORTER = MetricsExporter(
+        settings["export_path"],
+        settings["export_format"],
+        settings["prefix"],
+        settings["export_interval_seconds"],
+    )
+    EXPORTER.start()
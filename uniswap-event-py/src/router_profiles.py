@@ -0,0 +1,105 @@
+from src.addresses import parse_address
+
+
+class RouterProfile:
+    """
+    A router to watch, with the wrapped native token it deposits into and withdraws from
+    (WETH on Ethereum, WBNB, WMATIC, ...) and the amount that counts as a large swap.
+    A profile with a chain id only applies to transactions on that chain
+    """
+
+    __slots__ = (
+        "name",
+        "router_addr",
+        "router_key",
+        "wrapped_native_addr",
+        "wrapped_native_key",
+        "threshold_wei",
+        "chain_id",
+        "bloom_mask",
+        "window",
+    )
+
+    def __init__(self, name, router_addr, wrapped_native_addr, threshold_wei, chain_id=None):
+        self.name = name
+        # Addresses are kept in lowercase, the same as the addresses decoded from the logs,
+        # and as 20-byte keys to compare with the addresses of transactions and logs
+        self.router_addr = router_addr.lower()
+        self.router_key = parse_address(router_addr)
+        self.wrapped_native_addr = wrapped_native_addr.lower()
+        self.wrapped_native_key = parse_address(wrapped_native_addr)
+        if self.router_key is None or self.wrapped_native_key is None:
+            raise ValueError(f"Router profile {name} has an invalid address")
+        self.threshold_wei = threshold_wei
+        self.chain_id = chain_id
+        # Logs bloom bits of the wrapped native token and of the router as a topic, set by
+        # the agent when the profile is loaded
+        self.bloom_mask = 0
+        # Rolling per-sender totals of the swaps under the threshold, None if disabled
+        self.window = None
+
+
+def get_router_profiles(data):
+    """
+    Return the router profiles in the agent settings: the router set by the top-level keys,
+    followed by each entry of "routers"
+    """
+    profiles = [
+        RouterProfile(
+            "uniswap-v2",
+            data["uniswap_v2_router_addr"],
+            data["weth_addr"],
+            data["ether_threshold_wei"],
+            data.get("chain_id"),
+        )
+    ]
+
+    for entry in data.get("routers", []):
+        profiles.append(
+            RouterProfile(
+                entry["name"],
+                entry["router_addr"],
+                entry["wrapped_native_addr"],
+                entry.get("threshold_wei", data["ether_threshold_wei"]),
+                entry.get("chain_id"),
+            )
+        )
+
+    return profiles
+
+
+def build_router_index(profiles):
+    """
+    Build an index that maps the 20-byte key of each router address to its profiles, keyed
+    on chain id, or on None for a profile that applies to every chain. Forks are often
+    deployed at the same address on several chains, each with its own wrapped native token.
+    Raises ValueError if two profiles cover the same router on the same chain
+    """
+    index = {}
+    for profile in profiles:
+        chain_profiles = index.setdefault(profile.router_key, {})
+        if profile.chain_id in chain_profiles:
+            raise ValueError(
+                f"Router {profile.router_addr} is configured twice for chain {profile.chain_id}"
+            )
+
+        chain_profiles[profile.chain_id] = profile
+
+    return index
+
+
+def find_router_profile(index, router_key, chain_id):
+    """
+    Return the profile for the 20-byte key of a router address on a chain, or None if the
+    address is not a configured router. Addresses that aren't routers, which is almost all of
+    them, cost a single lookup
+    """
+    chain_profiles = index.get(router_key)
+    if chain_profiles is None:
+        return None
+
+    profile = chain_profiles.get(chain_id)
+    if profile is None:
+        profile = chain_profiles.get(None)
+
+    return profile
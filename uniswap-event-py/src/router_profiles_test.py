@@ -0,0 +1,38 @@
+import pytest
+
+from addresses import normalize_address
+from router_profiles import RouterProfile, build_router_index, find_router_profile
+
+ROUTER_ADDR = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+OTHER_ROUTER_ADDR = "0xd9e1cE17f2641f24aE83637ab66a2cca9C378B9F"
+WETH_ADDR = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+
+
+def test_find_router_profile():
+    """
+    A profile for a chain should take precedence over one that applies to every chain
+    """
+    default = RouterProfile("default", ROUTER_ADDR, WETH_ADDR, 5)
+    goerli = RouterProfile("goerli", ROUTER_ADDR, WETH_ADDR, 1, chain_id=5)
+    other = RouterProfile("other", OTHER_ROUTER_ADDR, WETH_ADDR, 5, chain_id=1)
+    index = build_router_index([default, goerli, other])
+
+    router_key = normalize_address(ROUTER_ADDR.lower())
+    assert default.router_addr == ROUTER_ADDR.lower()
+    assert find_router_profile(index, router_key, 1) is default
+    assert find_router_profile(index, router_key, 5) is goerli
+    assert find_router_profile(index, normalize_address(OTHER_ROUTER_ADDR), 1) is other
+    assert find_router_profile(index, normalize_address(OTHER_ROUTER_ADDR), 5) is None
+    assert find_router_profile(index, normalize_address(WETH_ADDR), 1) is None
+
+
+def test_build_router_index_duplicate():
+    """
+    Two profiles for the same router on the same chain should be rejected
+    """
+    profiles = [
+        RouterProfile("first", ROUTER_ADDR, WETH_ADDR, 5, chain_id=1),
+        RouterProfile("second", ROUTER_ADDR.lower(), WETH_ADDR, 5, chain_id=1),
+    ]
+    with pytest.raises(ValueError):
+        build_router_index(profiles)
@@ -0,0 +1,300 @@
+import argparse
+import cProfile
+import functools
+import json
+import os
+import pstats
+import time
+from enum import Enum
+
+from src import metrics
+
+# Captures are off unless enabled in the agent settings. The agent only checks this on its
+# hot path, so nothing else is done per call while it is off
+CAPTURE = None
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "path": "slow-fixtures",
+    "budget_ms": 50,
+    "max_fixtures": 100,
+}
+
+FIXTURE_PREFIX = "slow-"
+FIXTURE_SUFFIX = ".jsonl"
+
+
+def to_fixture_value(value):
+    """
+    Convert a value read from a forta-agent event back into the form it is created from
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return [to_fixture_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_fixture_value(item) for key, item in value.items()}
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if hasattr(value, "__dict__"):
+        # forta-agent reads 'from' into the from_ attribute, and accepts every other field
+        # under the name of its attribute
+        return {
+            "from" if key == "from_" else key: to_fixture_value(item)
+            for key, item in vars(value).items()
+        }
+
+    return value
+
+
+def to_fixture(transaction_event):
+    """
+    Return a transaction event as a dict in the format accepted by create_transaction_event,
+    i.e. one line of a replay fixture
+    """
+    return to_fixture_value(transaction_event)
+
+
+def read_fixture(path):
+    """
+    Return the events of a fixture file as dicts, and the timings of the call they were
+    captured from
+    """
+    with open(path, "r") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+
+    slow_call = events[0].get("slow_call", {}) if events else {}
+    return events, slow_call
+
+
+def load_fixture(path):
+    """
+    Return the events of a fixture file as transaction events, ready to be handed to the
+    entry point they were captured from, and the timings of that call
+    """
+    from forta_agent import create_transaction_event
+
+    events, slow_call = read_fixture(path)
+    return [create_transaction_event(event) for event in events], slow_call
+
+
+class SlowCallCapture:
+    """
+    Writes the events of the agent calls that take longer than a latency budget, with the
+    time spent in each stage, to a ring of at most 'max_fixtures' fixture files. Each file
+    is a replay fixture, one event per line, and its first event also holds the timings
+    """
+
+    def __init__(self, path, budget_ms=50, max_fixtures=100):
+        if max_fixtures < 1:
+            raise ValueError("max_fixtures must be at least 1")
+
+        self.path = path
+        self.budget_ns = int(budget_ms * 1e6)
+        self.max_fixtures = max_fixtures
+        self.captured = 0
+        self.last_error = None
+        self._next_slot = self._find_next_slot()
+
+    def get_fixture_path(self, slot):
+        return os.path.join(self.path, f"{FIXTURE_PREFIX}{slot:04d}{FIXTURE_SUFFIX}")
+
+    def _find_next_slot(self):
+        """
+        Carry on after the newest fixture left by an earlier run, so it is the last to be
+        overwritten
+        """
+        newest_slot = None
+        newest_mtime = None
+        for slot in range(self.max_fixtures):
+            try:
+                mtime = os.stat(self.get_fixture_path(slot)).st_mtime
+            except OSError:
+                continue
+            if newest_mtime is None or mtime > newest_mtime:
+                newest_slot, newest_mtime = slot, mtime
+
+        return 0 if newest_slot is None else (newest_slot + 1) % self.max_fixtures
+
+    def call(self, func, transaction_events, *args, **kwargs):
+        """
+        Call an agent entry point and capture its events if it took longer than the budget
+        """
+        call_timings = {}
+        metrics.CALL_TIMINGS = call_timings
+        start = time.perf_counter_ns()
+        try:
+            return func(transaction_events, *args, **kwargs)
+        finally:
+            elapsed_ns = time.perf_counter_ns() - start
+            metrics.CALL_TIMINGS = None
+            if elapsed_ns > self.budget_ns:
+                self.capture(func.__name__, transaction_events, elapsed_ns, call_timings)
+
+    def capture(self, entry, transaction_events, elapsed_ns, call_timings):
+        """
+        Write the events of a slow call to the next fixture file of the ring. Returns False
+        if the file could not be written
+        """
+        if not isinstance(transaction_events, list):
+            transaction_events = [transaction_events]
+
+        lines = [to_fixture(transaction_event) for transaction_event in transaction_events]
+        if lines:
+            lines[0]["slow_call"] = {
+                "entry": entry,
+                "captured_at": time.time(),
+                "elapsed_ms": elapsed_ns / 1e6,
+                "budget_ms": self.budget_ns / 1e6,
+                "events": len(lines),
+                "stages_ms": {stage: ns / 1e6 for stage, ns in call_timings.items()},
+            }
+
+        path = self.get_fixture_path(self._next_slot)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                f.writelines(json.dumps(line) + "\n" for line in lines)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            self.last_error = e
+            return False
+
+        self.last_error = None
+        self.captured += 1
+        self._next_slot = (self._next_slot + 1) % self.max_fixtures
+        return True
+
+
+def captured(func):
+    """
+    Wrap an agent entry point, handle_transaction or handle_transaction_batch, so that its
+    slow calls are captured while captures are enabled
+    """
+    if func.__code__.co_argcount > 1:
+
+        @functools.wraps(func)
+        def wrapper(transaction_events, *args, **kwargs):
+            if CAPTURE is None:
+                return func(transaction_events, *args, **kwargs)
+
+            return CAPTURE.call(func, transaction_events, *args, **kwargs)
+
+        return wrapper
+
+    # Packing *args and **kwargs costs about 100ns a call even while captures are off, so
+    # entry points that only take the events get a wrapper that doesn't
+    @functools.wraps(func)
+    def wrapper(transaction_events):
+        if CAPTURE is None:
+            return func(transaction_events)
+
+        return CAPTURE.call(func, transaction_events)
+
+    return wrapper
+
+
+def get_capture_gauges():
+    if CAPTURE is None:
+        return {}
+
+    return {"slow_calls_captured": CAPTURE.captured}
+
+
+def enable_stage_timing():
+    """
+    Turn metrics on if they are off, as the agents only time their stages while they are on.
+    Counters are kept as well but are only exported if the metrics settings say so
+    """
+    if not metrics.ENABLED:
+        metrics.ENABLED = True
+        metrics.TIMING_ONLY = True
+
+
+def disable_stage_timing():
+    """
+    Turn metrics back off if they were only turned on by enable_stage_timing
+    """
+    if metrics.TIMING_ONLY:
+        metrics.ENABLED = False
+        metrics.TIMING_ONLY = False
+
+
+def configure(settings):
+    """
+    Enable or disable captures from the "slow_capture" section of the agent settings. Called
+    after metrics.configure, as captures turn metrics on for their stage timings
+    """
+    global CAPTURE
+
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+
+    CAPTURE = None
+    disable_stage_timing()
+    if settings["enabled"] and settings["path"]:
+        CAPTURE = SlowCallCapture(
+            settings["path"], settings["budget_ms"], settings["max_fixtures"]
+        )
+        enable_stage_timing()
+
+    metrics.add_collector(get_capture_gauges)
+
+
+def profile_fixture(agent, path, repeat=1, sort="cumulative", limit=30):
+    """
+    Run the events of a fixture through the entry point they were captured from under the
+    profiler and print the time spent in each stage and the functions that took the most time
+    """
+    transaction_events, slow_call = load_fixture(path)
+    entry_name = slow_call.get("entry", "handle_transaction_batch")
+    entry = getattr(agent, entry_name)
+
+    call_timings = {}
+    enable_stage_timing()
+    metrics.CALL_TIMINGS = call_timings
+    profiler = cProfile.Profile()
+    try:
+        for _ in range(repeat):
+            if entry_name == "handle_transaction":
+                for transaction_event in transaction_events:
+                    profiler.runcall(entry, transaction_event)
+            else:
+                profiler.runcall(entry, transaction_events)
+    finally:
+        metrics.CALL_TIMINGS = None
+        disable_stage_timing()
+
+    print(f"{path}: {len(transaction_events)} events, captured at {slow_call.get('elapsed_ms')}ms")
+    if call_timings:
+        stages = ", ".join(
+            f"{stage} {ns / 1e6 / repeat:.3f}ms" for stage, ns in call_timings.items()
+        )
+        print(f"stages per run: {stages}")
+    pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
+
+    return call_timings
+
+
+def main(argv=None):
+    """
+    Profile the agent on fixtures captured from slow calls
+    """
+    parser = argparse.ArgumentParser(description="Profile the agent on captured slow calls")
+    parser.add_argument("fixtures", nargs="+", help="fixture files written by the capture")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="times to run each fixture")
+    parser.add_argument("--sort", default="cumulative", help="pstats sort key")
+    parser.add_argument("--limit", type=int, default=30, help="number of functions to print")
+    args = parser.parse_args(argv)
+
+    from src import agent, slow_capture
+
+    # The fixtures are slow calls already, don't capture them again. Run with -m this module
+    # is __main__, so the capture is turned off where the agent's entry points look for it
+    slow_capture.CAPTURE = None
+    for path in args.fixtures:
+        profile_fixture(agent, path, args.repeat, args.sort, args.limit)
+
+
+if __name__ == "__main__":
+    main()
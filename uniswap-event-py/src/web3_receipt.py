@@ -0,0 +1,236 @@
+import binascii
+from collections.abc import Mapping
+
+from src.addresses import to_checksum_address
+
+
+class Web3Log(Mapping):
+    """
+    A log in the format web3 expects, e.g. for processReceipt(), read from a forta-agent log.
+    Fields can be retrieved with the . "dot" notation, as forta-agent does, or the "['']"
+    square bracket notation, as web3 does. Each field is only converted when it is first
+    read, and the object holds no more than the log it wraps
+
+    from types.py inside web3 python module
+
+    class LogReceipt(TypedDict):
+        address: ChecksumAddress
+        blockHash: HexBytes
+        blockNumber: BlockNumber
+        data: HexStr
+        logIndex: int
+        payload: HexBytes
+        removed: bool
+        topic: HexBytes
+        topics: Sequence[HexBytes]
+        transactionHash: HexBytes
+        transactionIndex: int
+    """
+
+    __slots__ = ("_log", "_payload", "_topics")
+
+    FIELDS = (
+        "address",
+        "blockHash",
+        "blockNumber",
+        "data",
+        "logIndex",
+        "payload",
+        "removed",
+        "topic",
+        "topics",
+        "transactionHash",
+        "transactionIndex",
+    )
+
+    def __init__(self, log, payload):
+        self._log = log
+        self._payload = payload
+        self._topics = None
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    @property
+    def address(self):
+        return to_checksum_address(self._log.address)
+
+    @property
+    def blockHash(self):
+        return self._log.block_hash
+
+    @property
+    def blockNumber(self):
+        return self._log.block_number
+
+    @property
+    def data(self):
+        return self._log.data
+
+    @property
+    def logIndex(self):
+        return self._log.log_index
+
+    @property
+    def payload(self):
+        return self._payload
+
+    @property
+    def removed(self):
+        return self._log.removed
+
+    @property
+    def topic(self):
+        return self.topics[0]
+
+    @property
+    def topics(self):
+        # Need to convert the hexadecimal strings to binary data for web3
+        # Ensure the '0x' is stripped off the beginning of the string before converting
+        # Example:
+        #   - Convert '0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822'
+        #     to b'\xd7\x8a\xd9_\xa4l\x99KeQ\xd0\xda\x85\xfc\'_\xe6\x13\xce7e\x7f\xb8\xd5\xe3\xd10\x84\x01Y\xd8"'
+        if self._topics is None:
+            self._topics = [binascii.unhexlify(topic[2:]) for topic in self._log.topics]
+
+        return self._topics
+
+    @property
+    def transactionHash(self):
+        return self._log.transaction_hash
+
+    @property
+    def transactionIndex(self):
+        return self._log.transaction_index
+
+
+class Web3Receipt(Mapping):
+    """
+    The receipt of a transaction in the format web3 expects, read from a forta-agent
+    transaction event in the same way as Web3Log. The logs are only wrapped when they are
+    first read
+
+    from types.py inside web3 python module
+
+    TxReceipt = TypedDict("TxReceipt", {
+        "blockHash": HexBytes,
+        "blockNumber": BlockNumber,
+        "contractAddress": Optional[ChecksumAddress],
+        "cumulativeGasUsed": int,
+        "effectiveGasPrice": int,
+        "gasUsed": Wei,
+        "from": ChecksumAddress,
+        "logs": List[LogReceipt],
+        "logsBloom": HexBytes,
+        "root": HexStr,
+        "status": int,
+        "to": ChecksumAddress,
+        "transactionHash": HexBytes,
+        "transactionIndex": int,
+    })
+    """
+
+    __slots__ = ("_transaction_event", "_logs")
+
+    FIELDS = (
+        "blockHash",
+        "blockNumber",
+        "contractAddress",
+        "cumulativeGasUsed",
+        "effectiveGasPrice",
+        "gasUsed",
+        "from",
+        "logs",
+        "logsBloom",
+        "root",
+        "status",
+        "to",
+        "transactionHash",
+        "transactionIndex",
+    )
+
+    def __init__(self, transaction_event):
+        self._transaction_event = transaction_event
+        self._logs = None
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+
+        # 'from' is a keyword, so it is the from_ attribute as in forta-agent
+        return getattr(self, "from_" if key == "from" else key)
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    @property
+    def blockHash(self):
+        return self._transaction_event.receipt.block_hash
+
+    @property
+    def blockNumber(self):
+        return self._transaction_event.receipt.block_number
+
+    @property
+    def contractAddress(self):
+        return self._transaction_event.receipt.contract_address
+
+    @property
+    def cumulativeGasUsed(self):
+        return self._transaction_event.receipt.cumulative_gas_used
+
+    @property
+    def effectiveGasPrice(self):
+        return 0
+
+    @property
+    def gasUsed(self):
+        return self._transaction_event.receipt.gas_used
+
+    @property
+    def from_(self):
+        return self._transaction_event.transaction.from_
+
+    @property
+    def logs(self):
+        if self._logs is None:
+            payload = self._transaction_event.transaction.data
+            self._logs = [Web3Log(log, payload) for log in self._transaction_event.receipt.logs]
+
+        return self._logs
+
+    @property
+    def logsBloom(self):
+        return self._transaction_event.receipt.logs_bloom
+
+    @property
+    def root(self):
+        return self._transaction_event.receipt.root
+
+    @property
+    def status(self):
+        return self._transaction_event.receipt.status
+
+    @property
+    def to(self):
+        return self._transaction_event.transaction.to
+
+    @property
+    def transactionHash(self):
+        return self._transaction_event.receipt.transaction_hash
+
+    @property
+    def transactionIndex(self):
+        return self._transaction_event.receipt.transaction_index
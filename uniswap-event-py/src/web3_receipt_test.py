@@ -0,0 +1,75 @@
+import pytest
+
+from forta_agent import create_transaction_event
+
+from web3_receipt import Web3Log, Web3Receipt
+
+ROUTER_ADDR = "0x7a250d5630b4cf539739df2c5dacb4c659f2488d"
+WETH_ADDR = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+DEPOSIT_TOPIC = "0xe1fffcc4923d04b559f4d29a8bfc6cda04eb5b0d3c460751c2402c5c5cc9109c"
+ROUTER_TOPIC = "0x0000000000000000000000007a250d5630b4cf539739df2c5dacb4c659f2488d"
+
+
+def gen_tx_event():
+    """
+    Generate a transaction event with a single WETH Deposit log
+    """
+    return create_transaction_event(
+        {
+            "transaction": {"from": "0xa", "to": ROUTER_ADDR, "data": "0x7ff36ab5"},
+            "receipt": {
+                "blockNumber": 7,
+                "logs": [
+                    {
+                        "address": WETH_ADDR,
+                        "topics": [DEPOSIT_TOPIC, ROUTER_TOPIC],
+                        "data": "0x" + "00" * 31 + "05",
+                        "logIndex": 3,
+                    }
+                ],
+            },
+        }
+    )
+
+
+def test_receipt_fields():
+    """
+    Fields should be read with either notation, the same as from the transaction event
+    """
+    receipt = Web3Receipt(gen_tx_event())
+
+    assert receipt["blockNumber"] == receipt.blockNumber == 7
+    assert receipt["from"] == receipt.from_ == "0xa"
+    assert receipt["to"] == ROUTER_ADDR
+    assert receipt["effectiveGasPrice"] == 0
+    assert list(receipt) == list(Web3Receipt.FIELDS)
+    assert "logs" in receipt
+    with pytest.raises(KeyError):
+        receipt["_transaction_event"]
+
+
+def test_log_fields():
+    """
+    Logs should hold web3's fields, with the topics as bytes and the address checksummed
+    """
+    receipt = Web3Receipt(gen_tx_event())
+    log = receipt["logs"][0]
+
+    assert isinstance(log, Web3Log)
+    assert receipt["logs"] is receipt.logs
+    assert log["address"] == "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+    assert log["topics"] == [bytes.fromhex(DEPOSIT_TOPIC[2:]), bytes.fromhex(ROUTER_TOPIC[2:])]
+    assert log["topic"] == log.topics[0]
+    assert log["logIndex"] == 3
+    assert log["payload"] == "0x7ff36ab5"
+    assert dict(log)["data"] == "0x" + "00" * 31 + "05"
+
+
+def test_slots():
+    """
+    The receipt and its logs should not carry a per-object dict
+    """
+    receipt = Web3Receipt(gen_tx_event())
+
+    assert not hasattr(receipt, "__dict__")
+    assert not hasattr(receipt.logs[0], "__dict__")
@@ -0,0 +1,24 @@
+"""
+WETH events checked by the agent, compiled from weth_abi.json by src/compile_abi.py.
+Do not edit, run `npm run build:abi` instead
+"""
+
+# Topic hash -> (event name, arguments). Each argument is (name, type, indexed, position),
+# where position is the index of the topic for indexed arguments and the index of the word
+# in the log data for the others
+EVENT_LAYOUTS = {
+    "0x7fcf532c15f0a6db0bd6d0e038bea71d30d808c7d98cb3bf7268a95bf5081b65": (
+        "Withdrawal",
+        (
+            ("src", "address", True, 1),
+            ("wad", "uint256", False, 0),
+        ),
+    ),
+    "0xe1fffcc4923d04b559f4d29a8bfc6cda04eb5b0d3c460751c2402c5c5cc9109c": (
+        "Deposit",
+        (
+            ("dst", "address", True, 1),
+            ("wad", "uint256", False, 0),
+        ),
+    ),
+}
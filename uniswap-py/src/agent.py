@@ -1,7 +1,26 @@
 import json
+import os
 
-from forta_agent import Finding, FindingType, FindingSeverity
-from web3 import Web3
+from forta_agent import Finding, FindingType, FindingSeverity, get_json_rpc_url
+
+from src import metrics, slow_capture
+from src.addresses import get_address_gauges, parse_address
+from src.calldata import (
+    WORD_SIZE,
+    read_address,
+    read_address_array,
+    read_array,
+    read_uint,
+)
+from src.enrichment import DEFAULT_SETTINGS as ENRICHMENT_SETTINGS
+from src.enrichment import Enricher, JsonRpcClient
+from src.event_view import EventView, get_event_views
+from src.finding_filter import build_finding_filter, filter_batch_findings, filter_findings
+from src.price_oracle import DEFAULT_SETTINGS as PRICE_ORACLE_SETTINGS
+from src.price_oracle import GET_RESERVES_SELECTOR, PriceOracle, decode_reserves, get_pair_address
+from src.router_selectors import SWAP_FUNCTIONS, SWAP_PATHS
+from src.swap_window import SwapWindow
+from src.windows import WINDOW_TYPES, get_window_position
 
 # Uniswap v2: Router 2
 # 0x7a250d5630b4cf539739df2c5dacb4c659f2488d
@@ -10,89 +29,562 @@ from web3 import Web3
 #   - ETH -> SRM tx hash: 0x315b863c34188c3c8ca399e00d59fe57ce19583eaa053e3df42caa3167a616fe
 #   - UFO -> ETH tx hash: 0xf411bd59818d7e07c3da4de2c5d9f62a3e86e1ad5bc994dcefc7e97a9dcdb7ac
 
-ROUTER_ADDR = Web3.toChecksumAddress("0x7a250d5630b4cf539739df2c5dacb4c659f2488d")
-ETHER_THRESHOLD = Web3.toWei("5", "ether")
+ROUTER_ADDR = "0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D"
+# 20-byte key of the router, compared with the key of each transaction's 'to' address
+ROUTER_KEY = parse_address(ROUTER_ADDR)
+# 5 ether, in wei
+ETHER_THRESHOLD = 5 * 10 ** 18
+# Threshold swaps are checked against, in wei. With a USD threshold this follows the price of
+# ETH, otherwise it is ETHER_THRESHOLD
+THRESHOLD_WEI = ETHER_THRESHOLD
+
+# Every swap function on the router is checked, by looking at the address and checking the
+# function signature to see which function is being called (first 4 bytes). How the amount
+# of ETH is found depends on the function:
+#   - payable functions, e.g. (0x7ff36ab5) swapExactETHForTokens(uint256 amountOutMin, address[] path, address to, uint256 deadline)
+#     swap the ETH sent with the transaction
+#   - functions that swap tokens for ETH, e.g. (0x18cbafe5) swapExactTokensForETH(uint256 amountIn, uint256 amountOutMin, address[] path, address to, uint256 deadline)
+#     receive the amountOutMin or amountOut argument in ETH
+#   - functions that swap tokens for tokens only move ETH if WETH is at one end of the path,
+#     in which case the amount in or out of that end is used. Otherwise, if the price oracle
+#     is enabled, the amount in or out is valued in ETH at the cached reserves of the token's
+#     pair with WETH
+# The method ids and argument positions are compiled from router_abi.json ahead of time by
+# src/compile_abi.py, so nothing has to be hashed or parsed when the agent starts
+WETH_ADDR = "c02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+WETH_ADDR_BYTES = bytes.fromhex(WETH_ADDR)
+
+# A 32 byte word of an ABI encoded eth_call result is 64 hex characters
+WORD_LENGTH = 64
+
+# Method ids of the ERC-20 symbol() and decimals() functions
+SYMBOL_SELECTOR = "0x95d89b41"
+DECIMALS_SELECTOR = "0x313ce567"
+
+SWAP_DECODERS = None
+# Returned by a swap decoder for a token to token swap that is decoded but swaps no ETH, or
+# can't be valued in ETH, to tell it apart from calldata that can't be decoded
+NON_ETH_SWAP = object()
+# Rolling per-sender totals of the swaps under the threshold, None if disabled
+SWAP_WINDOW = None
+WINDOW_TYPE = None
+# Fixed total that raises a window alert, in wei, or None for the window to use THRESHOLD_WEI
+WINDOW_THRESHOLD_WEI = None
+# Groups the findings raised for the same sender during a burst, None if disabled
+FINDING_FILTER = None
+# Looks up the tokens of the swap path of each alert in the background, None if disabled
+ENRICHER = None
+# Values token to token swaps in ETH from cached pair reserves, None if disabled
+PRICE_ORACLE = None
+
+
+def load_config():
+    """
+    Load the configuration values from config/agent-settings.json
+    """
+    global SWAP_WINDOW
+    global WINDOW_TYPE
+    global WINDOW_THRESHOLD_WEI
+    global FINDING_FILTER
+    global ENRICHER
+    global PRICE_ORACLE
+    global THRESHOLD_WEI
+
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    config_file = os.path.join(dirname, "config", "agent-settings.json")
+
+    with open(config_file, "r") as f:
+        data = json.loads(f.read())
+
+    metrics.configure(data.get("metrics"), "uniswap_swap")
+    slow_capture.configure(data.get("slow_capture"))
+    metrics.add_collector(get_window_gauges)
+
+    FINDING_FILTER = build_finding_filter(data.get("finding_filter"))
+    metrics.add_collector(get_filter_gauges)
+    metrics.add_collector(get_address_gauges)
+
+    if ENRICHER is not None:
+        ENRICHER.close()
+    ENRICHER = build_enricher(data.get("enrichment"))
+    metrics.add_collector(get_enrichment_gauges)
+
+    if PRICE_ORACLE is not None:
+        PRICE_ORACLE.stop()
+    THRESHOLD_WEI = ETHER_THRESHOLD
+
+    # Built before the price oracle is started, so the oracle's first refresh sees it
+    SWAP_WINDOW = None
+    window = data.get("swap_window", {})
+    if window.get("enabled"):
+        WINDOW_TYPE = window.get("type", "blocks")
+        if WINDOW_TYPE not in WINDOW_TYPES:
+            raise ValueError(f"Unknown swap window type: {WINDOW_TYPE}")
+
+        WINDOW_THRESHOLD_WEI = window.get("threshold_wei")
+        SWAP_WINDOW = SwapWindow(
+            window["size"],
+            THRESHOLD_WEI if WINDOW_THRESHOLD_WEI is None else WINDOW_THRESHOLD_WEI,
+            window.get("max_senders", 500000),
+        )
+
+    PRICE_ORACLE = build_price_oracle(data.get("price_oracle"))
+    metrics.add_collector(get_oracle_gauges)
+
+
+def get_window_gauges():
+    """
+    Return the number of senders tracked by the swap window, and the number dropped to stay
+    under its limit, as gauges for the metrics snapshot
+    """
+    if SWAP_WINDOW is None:
+        return {}
+
+    return {"window_senders": len(SWAP_WINDOW), "window_evicted": SWAP_WINDOW.evicted}
+
+
+def get_filter_gauges():
+    """
+    Return the finding filter's gauges for the metrics snapshot, if a filter is used
+    """
+    if FINDING_FILTER is None:
+        return {}
+
+    return FINDING_FILTER.get_gauges()
+
+
+def is_stateful():
+    """
+    Return True if the findings for a transaction can depend on the transactions before it,
+    e.g. with the finding filter on. Such transactions must be handed to the agent in order
+    and by a single process, so the replay doesn't split them between workers
+    """
+    return SWAP_WINDOW is not None or FINDING_FILTER is not None
+
+
+def get_enrichment_gauges():
+    """
+    Return the enrichment statistics for the metrics snapshot, if enrichment is used
+    """
+    if ENRICHER is None:
+        return {}
+
+    return ENRICHER.get_gauges()
+
+
+def get_oracle_gauges():
+    """
+    Return the number of tokens priced and the current threshold, as gauges for the metrics
+    snapshot, if the price oracle is used
+    """
+    if PRICE_ORACLE is None:
+        return {}
+
+    return {"price_oracle_tokens": len(PRICE_ORACLE), "threshold_wei": THRESHOLD_WEI}
+
+
+def read_word(data, start):
+    """
+    Read the uint256 word starting at hex character 'start' of a hex string, e.g. the result
+    of an eth_call. Returns None if the string is too short
+    """
+    end = start + WORD_LENGTH
+    if len(data) < end:
+        return None
+
+    return int(data[start:end], 16)
+
+
+def get_value_decoder():
+    """
+    Return a decoder that reads the amount of ETH sent with the transaction
+    """
 
-# When swapping token x for ETH you can see this by
-# looking at the address and checking the function signature to see which function
-# is being called (first 4 bytes)
-#   - (0x18cbafe5) swapExactTokensForETH(uint256 amountIn, uint256 amountOutMin, address[] path, address to, uint256 deadline)
-#   - (0x7ff36ab5) swapExactETHForTokens(uint256 amountOutMin, address[] path, address to, uint256 deadline)
+    def decode(event_view):
+        return event_view.transaction.value
 
-CONTRACT_INST = None
+    return decode
 
 
-def get_contract_abi():
+def get_word_decoder(arg_index):
     """
-    Given the address of a smart contract, return the abi provided by etherscan as a string
+    Return a decoder that reads a single uint256 argument straight out of the calldata.
+    Static arguments are stored in order at the start of the calldata, so the argument is
+    always at the same offset and nothing else needs to be decoded. The word is read from
+    the same bytes as the path decoders, so the calldata is only ever decoded once. Returns
+    None if the calldata is too short, in which case the contract would reject it
     """
-    # API was retrieved from f"https://api.etherscan.io/api?module=contract&action=getabi&address={ROUTER_ADDR}"
-    with open("router_abi.json", "r") as f:
-        abi = json.loads(f.read())
+    offset = arg_index * WORD_SIZE
+
+    def decode(event_view):
+        calldata = event_view.calldata
+        if calldata is None:
+            return None
+
+        return read_uint(calldata, offset)
 
-    return abi
+    return decode
 
 
-def get_contract_instance():
+def get_path_decoder(path_index, amount_in_index, amount_out_index):
     """
-    Get an instance of the contract by using the ABI saved in 'router_abi.json`
-    This will allow us to encode and decode function parameters
+    Return a decoder for a token to token swap. Only the first and last address of the path
+    are read: if the path ends with WETH the amount out is ETH, and if it starts with WETH the
+    amount in is ETH. Otherwise no ETH is swapped directly, and the value of the swap comes
+    from the price oracle or NON_ETH_SWAP is returned. None is returned if the calldata
+    doesn't hold the whole path
     """
-    global CONTRACT_INST
-    if CONTRACT_INST:
-        return CONTRACT_INST
+    # Byte offsets of the amount arguments
+    amount_in_offset = amount_in_index * WORD_SIZE
+    amount_out_offset = amount_out_index * WORD_SIZE
+
+    def decode(event_view):
+        # The path is a dynamic array, so the calldata is decoded once and only the words
+        # needed are read out of it
+        calldata = event_view.calldata
+        if calldata is None:
+            return None
+
+        path = read_array(calldata, path_index)
+        if path is None or path[1] < 2:
+            return None
+
+        first, length = path
+        first_addr = read_address(calldata, first)
+        last_addr = read_address(calldata, first + (length - 1) * WORD_SIZE)
 
-    abi = get_contract_abi()
-    w3 = Web3()
-    CONTRACT_INST = w3.eth.contract(abi=abi)
+        if last_addr == WETH_ADDR_BYTES:
+            return read_uint(calldata, amount_out_offset)
+        if first_addr == WETH_ADDR_BYTES:
+            return read_uint(calldata, amount_in_offset)
 
-    return CONTRACT_INST
+        # Neither end is WETH, so value the tokens going in, or else the ones coming out
+        price_oracle = PRICE_ORACLE
+        if price_oracle is None:
+            return NON_ETH_SWAP
 
+        amount_in = read_uint(calldata, amount_in_offset)
+        if amount_in is not None:
+            value_wei = price_oracle.get_eth_value("0x" + first_addr.hex(), amount_in)
+            if value_wei is not None:
+                return value_wei
 
-def handle_transaction(transaction_event):
+        amount_out = read_uint(calldata, amount_out_offset)
+        if amount_out is not None:
+            value_wei = price_oracle.get_eth_value("0x" + last_addr.hex(), amount_out)
+            if value_wei is not None:
+                return value_wei
+
+        return NON_ETH_SWAP
+
+    return decode
+
+
+def get_swap_decoder(kind, arg_indexes):
     """
-    Entry point for a transaction
+    Return the decoder for a swap function, from its entry in the compiled swap table
     """
-    contract_inst = get_contract_instance()
+    if kind == "value":
+        return get_value_decoder()
+    if kind == "word":
+        return get_word_decoder(*arg_indexes)
+    if kind == "path":
+        return get_path_decoder(*arg_indexes)
+
+    raise ValueError(f"Unknown swap function kind: {kind}")
 
-    input_data = transaction_event.transaction.data
-    if not input_data:
-        return []
 
+def get_swap_decoders():
+    """
+    Build a table that maps the method id of every swap function on the router to a
+    decoder that returns the amount of ETH being swapped
+    """
+    global SWAP_DECODERS
+    if SWAP_DECODERS:
+        return SWAP_DECODERS
+
+    SWAP_DECODERS = {
+        selector: get_swap_decoder(kind, arg_indexes)
+        for selector, (_, kind, arg_indexes) in SWAP_FUNCTIONS.items()
+    }
+    return SWAP_DECODERS
+
+
+def get_swap_value(event_view, swap_decoders, router_key):
+    """
+    Return the amount of ETH swapped by a transaction if it is a swap on the router,
+    otherwise None
+    """
     # Length of data must be at least of length 10
     # '0x' is 2 characters and then 8 characters (4 bytes) for the method id
     # Ex: 0x11223344
-    if len(input_data) < 10:
-        return []
-
-    swap_token_eth_method = "0x18cbafe5"
-    swap_eth_token_method = "0x7ff36ab5"
+    selector = event_view.selector
+    if selector is None:
+        if metrics.ENABLED:
+            metrics.increment("rejected_no_calldata")
+        return None
 
     # Ensure the 'to' field exists (will be a None on contract creation) and that it matches
     # the ROUTER_ADDR
-    if (
-        transaction_event.transaction.to
-        and transaction_event.transaction.to.lower() != ROUTER_ADDR.lower()
-    ):
-        return []
-
-    method_id = input_data[:10]
-    # Check to see if the method id is one of the two we want to check
-    if method_id not in [swap_token_eth_method, swap_eth_token_method]:
-        return []
-
-    # If the method being called is swapExactETHForTokens, check the value of ETH being sent
-    if method_id == swap_eth_token_method:
-        value_wei = transaction_event.transaction.value
+    if event_view.transaction.to and event_view.to_key != router_key:
+        if metrics.ENABLED:
+            metrics.increment("rejected_not_router")
+        return None
+
+    # Check to see if the method id is one of the swap functions
+    decode_value = swap_decoders.get(selector)
+    if decode_value is None:
+        if metrics.ENABLED:
+            metrics.increment("rejected_not_swap")
+        return None
+
+    if metrics.ENABLED:
+        value_wei = metrics.timed("decode", decode_value, event_view)
     else:
-        func_args = contract_inst.decode_function_input(input_data)[1]
-        value_wei = func_args["amountOutMin"]
+        value_wei = decode_value(event_view)
+
+    if value_wei is NON_ETH_SWAP:
+        if metrics.ENABLED:
+            metrics.increment("non_eth_swaps")
+        return None
+    if value_wei is None and metrics.ENABLED:
+        metrics.increment("decode_failures")
+
+    return value_wei
+
 
-    if value_wei < ETHER_THRESHOLD:
-        return []
+def get_swap_path(event_view):
+    """
+    Return the token addresses of the path of a swap, in lowercase, or None if the
+    transaction isn't a swap or its calldata doesn't hold the whole path
+    """
+    path_index = SWAP_PATHS.get(event_view.selector)
+    if path_index is None:
+        return None
+
+    calldata = event_view.calldata
+    if calldata is None:
+        return None
+
+    return read_address_array(calldata, path_index)
+
+
+def decode_symbol(result):
+    """
+    Decode the result of symbol(). Most tokens return a string, but a few older ones, such as
+    MKR, return a bytes32. Returns None if the result is neither
+    """
+    if not result or len(result) < 2 + WORD_LENGTH:
+        return None
+
+    if len(result) == 2 + WORD_LENGTH:
+        raw = bytes.fromhex(result[2:]).rstrip(b"\0")
+    else:
+        offset = read_word(result, 2)
+        length = read_word(result, 2 + offset * 2) if offset is not None else None
+        if length is None:
+            return None
+
+        start = 2 + offset * 2 + WORD_LENGTH
+        if len(result) < start + length * 2:
+            return None
+        raw = bytes.fromhex(result[start:start + length * 2])
+
+    return raw.decode("utf-8", errors="replace")
+
+
+def get_token_lookup(client):
+    """
+    Return a coroutine function that looks up the symbol and decimals of a token, with both
+    calls sent in one JSON-RPC batch
+    """
+
+    async def lookup(token_addr):
+        symbol_result, decimals_result = await client.call_batch(
+            [
+                ("eth_call", [{"to": token_addr, "data": SYMBOL_SELECTOR}, "latest"]),
+                ("eth_call", [{"to": token_addr, "data": DECIMALS_SELECTOR}, "latest"]),
+            ]
+        )
+
+        return {
+            "symbol": decode_symbol(symbol_result),
+            "decimals": read_word(decimals_result or "", 2),
+        }
+
+    return lookup
+
+
+def add_token_info(finding, tokens):
+    """
+    Add the address, symbol and decimals of each token of the swap path that was looked up
+    to the alert metadata
+    """
+    finding.metadata["tokens"] = [
+        {"address": token_addr, **token_info} for token_addr, token_info in tokens.items()
+    ]
 
-    # Send alert
-    alert = Finding(
+
+def build_enricher(settings):
+    """
+    Return an enricher for the "enrichment" section of the agent settings, or None if it is
+    disabled. Without an RPC url the one the agent is run with is used
+    """
+    settings = {**ENRICHMENT_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+
+    client = JsonRpcClient(settings["rpc_url"] or get_json_rpc_url(), settings["timeout_seconds"])
+    return Enricher(
+        get_token_lookup(client),
+        add_token_info,
+        settings["max_concurrency"],
+        settings["cache_size"],
+        settings["cache_ttl_seconds"],
+        settings["timeout_seconds"],
+        client,
+    )
+
+
+def create_tokens_finding(alert, transaction):
+    """
+    Return the finding that follows a swap alert with the tokens of its swap path, once they
+    have been looked up. It names the transaction and the alert it belongs to
+    """
+    return Finding(
+        {
+            "name": "Uniswap swap tokens",
+            "description": "Tokens of a large swap on Uniswap",
+            "alert_id": "AE-UNISWAP-LARGESWAP-TOKENS",
+            "type": FindingType.Info,
+            "severity": FindingSeverity.Info,
+            "metadata": {
+                "transaction_hash": transaction.hash,
+                "alert_id": alert.alert_id,
+                # Filled in by add_token_info with the tokens that could be looked up
+                "tokens": [],
+            },
+            "everestId": "0xa2e07f422b5d7cbbfca764e53b251484ecf945fa"
+        }
+    )
+
+
+def enrich_findings(findings, event_views):
+    """
+    Queue the lookup of the tokens of each swap alert and return the findings right away,
+    followed by the tokens findings of earlier alerts whose lookups are done. Detection never
+    waits on a lookup: a tokens finding comes out of a later call, or of flush_findings, and
+    names the transaction hash of its alert. 'event_views' maps the id of each swap alert to
+    the view of its transaction, other findings, e.g. summaries, have nothing to look up
+    """
+    for finding in findings:
+        event_view = event_views.get(id(finding))
+        token_addrs = get_swap_path(event_view) if event_view is not None else None
+        if token_addrs:
+            tokens_finding = create_tokens_finding(finding, event_view.transaction)
+            ENRICHER.submit(tokens_finding, token_addrs)
+
+    return findings + ENRICHER.collect()
+
+
+def flush_findings(timeout=None):
+    """
+    Return the findings the agent still holds back, e.g. before it is stopped: the tokens
+    findings still being looked up or not yet returned by a later call, then the summaries
+    of the finding filter's groups whose window hasn't passed yet. Each lookup gives up after
+    the enrichment timeout, so this doesn't wait longer than that unless 'timeout' is shorter
+    """
+    findings = [] if ENRICHER is None else ENRICHER.flush(timeout)
+    if FINDING_FILTER is not None:
+        findings.extend(FINDING_FILTER.flush())
+
+    return findings
+
+
+def get_reserves_fetcher(client, weth_addr, batch_size=100):
+    """
+    Return a function that fetches the reserves of the pairs of tokens with WETH, with the
+    getReserves() calls sent in JSON-RPC batches. Tokens without a pair, or with an empty one,
+    get None, and tokens whose call failed are left out so the price oracle tries them again
+    """
+
+    def fetch_reserves(token_addrs):
+        reserves = {}
+        for start in range(0, len(token_addrs), batch_size):
+            batch = token_addrs[start:start + batch_size]
+            calls = []
+            for token_addr in batch:
+                pair_addr = get_pair_address(token_addr, weth_addr)
+                call = {"to": pair_addr, "data": GET_RESERVES_SELECTOR}
+                calls.append(("eth_call", [call, "latest"]))
+            results = client.request_batch(calls, ignore_errors=True)
+
+            for token_addr, result in zip(batch, results):
+                if result is not None:
+                    reserves[token_addr] = decode_reserves(result, token_addr, weth_addr)
+
+        return reserves
+
+    return fetch_reserves
+
+
+def get_threshold_updater(threshold_usd, usd_token_addr, usd_token_decimals):
+    """
+    Return a function that sets the threshold to 'threshold_usd' worth of ETH, from the
+    reserves of the USD token's pair with WETH, after each refresh of the price oracle. The
+    swap window follows it too, unless it has a fixed threshold of its own
+    """
+    usd_token_addr = usd_token_addr.lower()
+    usd_token_unit = 10 ** usd_token_decimals
+
+    def update_threshold(price_oracle):
+        global THRESHOLD_WEI
+
+        # Keep the last threshold if the USD token couldn't be priced
+        reserves = price_oracle.get_reserves(usd_token_addr)
+        if reserves is None:
+            return
+
+        THRESHOLD_WEI = threshold_usd * usd_token_unit * reserves[1] // reserves[0]
+        swap_window = SWAP_WINDOW
+        if swap_window is not None and WINDOW_THRESHOLD_WEI is None:
+            swap_window.threshold = THRESHOLD_WEI
+
+    return update_threshold
+
+
+def build_price_oracle(settings):
+    """
+    Return a started price oracle for the "price_oracle" section of the agent settings, or
+    None if it is disabled. Without an RPC url the one the agent is run with is used
+    """
+    settings = {**PRICE_ORACLE_SETTINGS, **(settings or {})}
+    if not settings["enabled"]:
+        return None
+
+    client = JsonRpcClient(settings["rpc_url"] or get_json_rpc_url())
+    price_oracle = PriceOracle(
+        get_reserves_fetcher(client, "0x" + WETH_ADDR),
+        settings["max_tokens"],
+        settings["max_age_seconds"],
+        settings["refresh_seconds"],
+    )
+
+    if settings["threshold_usd"]:
+        price_oracle.track(settings["usd_token_addr"])
+        price_oracle.on_refresh = get_threshold_updater(
+            settings["threshold_usd"], settings["usd_token_addr"], settings["usd_token_decimals"]
+        )
+
+    price_oracle.start()
+    return price_oracle
+
+
+def create_alert(transaction, value_wei):
+    """
+    Return an alert for a large swap
+    """
+    return Finding(
         {
             "name": "Uniswap swap detector",
             "description": "Large swap on Uniswap detected",
@@ -100,12 +592,146 @@ def handle_transaction(transaction_event):
             "type": FindingType.Suspicious,
             "severity": FindingSeverity.Low,
             "metadata": {
-                "from": transaction_event.transaction.from_,
-                "to": transaction_event.transaction.to,
+                "from": transaction.from_,
+                "to": transaction.to,
+                "amount": value_wei,
+            },
+            "everestId": "0xa2e07f422b5d7cbbfca764e53b251484ecf945fa"
+        }
+    )
+
+
+def create_window_alert(transaction, value_wei, total_wei):
+    """
+    Return an alert for a swap that brings the total swapped by its sender within the window
+    over the threshold
+    """
+    return Finding(
+        {
+            "name": "Uniswap swap volume detector",
+            "description": "Large swap volume on Uniswap detected",
+            "alert_id": "AE-UNISWAP-LARGESWAP-ETH-WINDOW",
+            "type": FindingType.Suspicious,
+            "severity": FindingSeverity.Low,
+            "metadata": {
+                "from": transaction.from_,
+                "to": transaction.to,
                 "amount": value_wei,
+                "total_amount": total_wei,
+                "window": f"{SWAP_WINDOW.size} {WINDOW_TYPE}",
             },
             "everestId": "0xa2e07f422b5d7cbbfca764e53b251484ecf945fa"
         }
     )
 
-    return [alert]
+
+def check_swap(event_view, swap_decoders, router_key):
+    """
+    Return an alert for a swap over the threshold, or for a smaller swap that brings the total
+    swapped by its sender within the window over the threshold. Otherwise return None
+    """
+    transaction = event_view.transaction
+    value_wei = get_swap_value(event_view, swap_decoders, router_key)
+    if value_wei is None:
+        return None
+
+    if value_wei >= THRESHOLD_WEI:
+        if metrics.ENABLED:
+            return metrics.timed("finding", create_alert, transaction, value_wei)
+        return create_alert(transaction, value_wei)
+
+    if metrics.ENABLED:
+        metrics.increment("rejected_below_threshold")
+
+    # Smaller swaps are added up per sender, to catch a large swap split into many small ones
+    if SWAP_WINDOW is None:
+        return None
+
+    sender = event_view.from_key
+    if sender is None:
+        return None
+
+    position = get_window_position(event_view.transaction_event, WINDOW_TYPE)
+    if position is None:
+        return None
+
+    total_wei = SWAP_WINDOW.add(sender, value_wei, position)
+    if total_wei is None:
+        return None
+
+    return create_window_alert(transaction, value_wei, total_wei)
+
+
+@slow_capture.captured
+def handle_transaction(transaction_event, event_view=None):
+    """
+    Entry point for a transaction. 'event_view' is the decoded view of the event, if the
+    caller shares one between several detectors
+    """
+    if metrics.ENABLED:
+        metrics.increment("transactions")
+
+    if event_view is None:
+        event_view = EventView(transaction_event)
+    alert = check_swap(event_view, get_swap_decoders(), ROUTER_KEY)
+    if alert is None:
+        findings = filter_findings(FINDING_FILTER, transaction_event, [])
+        alert_views = {}
+    else:
+        # Send alert
+        if metrics.ENABLED:
+            metrics.increment("findings")
+        findings = filter_findings(FINDING_FILTER, transaction_event, [alert])
+        alert_views = {id(alert): event_view}
+
+    if ENRICHER is None:
+        return findings
+
+    # Also picks up the tokens findings of earlier alerts, even without an alert here
+    return enrich_findings(findings, alert_views)
+
+
+@slow_capture.captured
+def handle_transaction_batch(transaction_events, event_views=None):
+    """
+    Entry point for a batch of transactions, e.g. every transaction in a block. Returns the
+    same alerts, in the same order, as calling handle_transaction on each transaction, but
+    the selector table and router address are only looked up once for the whole batch.
+    'event_views' are the decoded views of the events, if the caller shares them between
+    several detectors
+    """
+    if metrics.ENABLED:
+        metrics.increment("transactions", len(transaction_events))
+
+    swap_decoders = get_swap_decoders()
+    router_key = ROUTER_KEY
+
+    finding_filter = FINDING_FILTER
+
+    alerts = []
+    # The alerts of each transaction, for the finding filter
+    tx_alerts = []
+    alert_views = {}
+    for event_view in get_event_views(transaction_events, event_views):
+        alert = check_swap(event_view, swap_decoders, router_key)
+        if alert is not None:
+            alerts.append(alert)
+            alert_views[id(alert)] = event_view
+        if finding_filter is not None:
+            tx_alerts.append([] if alert is None else [alert])
+
+    if metrics.ENABLED:
+        metrics.increment("findings", len(alerts))
+
+    if finding_filter is not None:
+        alerts = filter_batch_findings(finding_filter, transaction_events, tx_alerts)
+
+    if ENRICHER is None:
+        return alerts
+
+    return enrich_findings(alerts, alert_views)
+
+
+load_config()
+# Build the decoders at startup so the first transaction costs the same as any other
+get_swap_decoders()
@@ -1,11 +1,25 @@
+import asyncio
+import threading
+import time
+
 import pytest
 from web3 import Web3
 
 from forta_agent import Finding, FindingSeverity, FindingType, create_transaction_event
-from agent import handle_transaction, get_contract_instance, ROUTER_ADDR, CONTRACT_INST
+
+import agent
+from agent import (
+    handle_transaction,
+    handle_transaction_batch,
+    get_swap_decoders,
+    ROUTER_ADDR,
+)
+from compile_abi import get_contract_abi
+from event_view import UNSET, EventView
 
 
 BURN_ADDR = "0x000000000000000000000000000000000000dEaD"
+WETH_ADDR = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
 
 
 @pytest.fixture(scope="session")
@@ -13,7 +27,7 @@ def contract():
     """
     Returns a contract instance which allows encoding and decoding of function parameters
     """
-    return get_contract_instance()
+    return Web3().eth.contract(abi=get_contract_abi())
 
 
 @pytest.fixture
@@ -182,3 +196,463 @@ def test_transaction_high_value_token_eth(contract, alert):
 
     # Checks to ensure the correct alert was raised
     check_alerts(alert, finding)
+
+
+def test_swap_decoders(contract):
+    """
+    The selector table should hold the swap functions and read the same amount as a full
+    decode of the calldata
+    """
+    decoders = get_swap_decoders()
+
+    # Every swap function on Uniswap V2 Router 2
+    assert len(decoders) == 9
+    assert {"0x18cbafe5", "0x7ff36ab5"} <= set(decoders)
+
+    args = [
+        Web3.toWei("1", "ether"),
+        Web3.toWei("12.5", "ether"),
+        [BURN_ADDR, BURN_ADDR, BURN_ADDR],
+        ROUTER_ADDR,
+        1,
+    ]
+    data = contract.encodeABI(fn_name="swapExactTokensForETH", args=args)
+    tx_event = create_transaction_event(gen_tx_data(to=ROUTER_ADDR, data=data))
+
+    value_wei = decoders[data[:10]](EventView(tx_event))
+
+    assert value_wei == contract.decode_function_input(data)[1]["amountOutMin"]
+
+    # Word arguments are read from the same decoded bytes as the path, so calldata that
+    # isn't valid hex is rejected rather than read
+    invalid = create_transaction_event(gen_tx_data(to=ROUTER_ADDR, data=data[:10] + "zz" * 96))
+    assert decoders[data[:10]](EventView(invalid)) is None
+
+
+def test_transaction_truncated_calldata(contract):
+    """
+    Send a transaction with calldata that is too short to hold the swap arguments
+    This should not raise an alert
+    """
+    args = [
+        Web3.toWei("1", "ether"),
+        Web3.toWei("100", "ether"),
+        [BURN_ADDR, BURN_ADDR],
+        ROUTER_ADDR,
+        1,
+    ]
+    data = contract.encodeABI(fn_name="swapExactTokensForETH", args=args)
+    tx_data = gen_tx_data(to=ROUTER_ADDR, data=data[:80])
+
+    tx_event = create_transaction_event(tx_data)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 0
+
+
+@pytest.mark.parametrize(
+    "fn_name,args,value,path",
+    [
+        # Functions that swap the ETH sent with the transaction
+        ("swapExactETHForTokens", ["1"], "100", [WETH_ADDR, BURN_ADDR]),
+        ("swapExactETHForTokensSupportingFeeOnTransferTokens", ["1"], "100", [WETH_ADDR, BURN_ADDR]),
+        ("swapETHForExactTokens", ["1"], "100", [WETH_ADDR, BURN_ADDR]),
+        # Functions that swap tokens for ETH
+        ("swapExactTokensForETH", ["1", "100"], "0", [BURN_ADDR, WETH_ADDR]),
+        ("swapExactTokensForETHSupportingFeeOnTransferTokens", ["1", "100"], "0", [BURN_ADDR, WETH_ADDR]),
+        ("swapTokensForExactETH", ["100", "1"], "0", [BURN_ADDR, WETH_ADDR]),
+        # Token to token swaps that end in WETH use the amount out
+        ("swapExactTokensForTokens", ["1", "100"], "0", [BURN_ADDR, BURN_ADDR, WETH_ADDR]),
+        ("swapExactTokensForTokensSupportingFeeOnTransferTokens", ["1", "100"], "0", [BURN_ADDR, WETH_ADDR]),
+        ("swapTokensForExactTokens", ["100", "1"], "0", [BURN_ADDR, WETH_ADDR]),
+        # Token to token swaps that start with WETH use the amount in
+        ("swapExactTokensForTokens", ["100", "1"], "0", [WETH_ADDR, BURN_ADDR]),
+        ("swapTokensForExactTokens", ["1", "100"], "0", [WETH_ADDR, BURN_ADDR, BURN_ADDR]),
+    ],
+)
+def test_transaction_high_value_all_swaps(contract, alert, fn_name, args, value, path):
+    """
+    Send a high value (100 ether) swap through each of the router's swap functions
+    This should raise an alert
+    """
+    args = [Web3.toWei(arg, "ether") for arg in args] + [path, ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name=fn_name, args=args)
+    tx_data = gen_tx_data(value=str(Web3.toWei(value, "ether")), to=ROUTER_ADDR, data=data)
+
+    tx_event = create_transaction_event(tx_data)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 1
+    check_alerts(alert, findings[0])
+    assert findings[0].metadata["amount"] == Web3.toWei("100", "ether")
+
+
+def test_transaction_token_token_without_weth(contract):
+    """
+    Send a large token to token swap that doesn't go in or out of WETH
+    This should not raise an alert as no ETH is swapped
+    """
+    args = [
+        Web3.toWei("100", "ether"),
+        Web3.toWei("100", "ether"),
+        [BURN_ADDR, WETH_ADDR, BURN_ADDR],
+        ROUTER_ADDR,
+        1,
+    ]
+    data = contract.encodeABI(fn_name="swapExactTokensForTokens", args=args)
+    tx_data = gen_tx_data(to=ROUTER_ADDR, data=data)
+
+    tx_event = create_transaction_event(tx_data)
+    findings = handle_transaction(tx_event)
+
+    assert len(findings) == 0
+
+
+def test_transaction_batch(contract):
+    """
+    Checking a batch of transactions should give the same alerts as checking them one by one
+    """
+    tx_datas = [gen_tx_data()]
+    for fn_name, args, value in [
+        ("swapExactETHForTokens", ["1"], "100"),
+        ("swapExactETHForTokens", ["1"], ".01"),
+        ("swapExactTokensForETH", ["1", "100"], "0"),
+        ("swapExactTokensForETH", ["1", ".01"], "0"),
+        ("swapETHForExactTokens", ["1"], "6"),
+    ]:
+        args = [Web3.toWei(arg, "ether") for arg in args] + [[BURN_ADDR, WETH_ADDR], ROUTER_ADDR, 1]
+        data = contract.encodeABI(fn_name=fn_name, args=args)
+        tx_datas.append(gen_tx_data(value=str(Web3.toWei(value, "ether")), to=ROUTER_ADDR, data=data))
+
+    # The same large swap sent to some other contract
+    tx_datas.append(dict(tx_datas[1], transaction=dict(tx_datas[1]["transaction"], to=BURN_ADDR)))
+
+    tx_events = [create_transaction_event(tx_data) for tx_data in tx_datas]
+
+    expected = [finding for tx_event in tx_events for finding in handle_transaction(tx_event)]
+    findings = handle_transaction_batch(tx_events)
+
+    assert len(findings) == 3
+    assert [finding.toJson() for finding in findings] == [
+        finding.toJson() for finding in expected
+    ]
+
+
+def test_metrics(contract):
+    """
+    With instrumentation on, the agent should count the transactions rejected by each
+    filter, the swaps it could not decode, the token swaps without ETH and its findings
+    """
+    args = [
+        Web3.toWei("1", "ether"),
+        Web3.toWei("100", "ether"),
+        [BURN_ADDR, WETH_ADDR],
+        ROUTER_ADDR,
+        1,
+    ]
+    data = contract.encodeABI(fn_name="swapExactTokensForETH", args=args)
+    args[2] = [BURN_ADDR, ROUTER_ADDR]
+    token_data = contract.encodeABI(fn_name="swapExactTokensForTokens", args=args)
+    tx_datas = [
+        gen_tx_data(to=ROUTER_ADDR, data=data),
+        gen_tx_data(to=ROUTER_ADDR, data=data[:80]),
+        gen_tx_data(to=ROUTER_ADDR, data=token_data),
+        gen_tx_data(to=BURN_ADDR, data=data),
+        gen_tx_data(to=ROUTER_ADDR, data="0x12345678"),
+        gen_tx_data(to=ROUTER_ADDR),
+    ]
+
+    agent.metrics.configure({"enabled": True})
+    try:
+        for tx_data in tx_datas:
+            handle_transaction(create_transaction_event(tx_data))
+        snapshot = agent.metrics.get_snapshot()
+    finally:
+        agent.metrics.configure({"enabled": False})
+
+    assert snapshot["counters"] == {
+        "transactions": 6,
+        "findings": 1,
+        "decode_failures": 1,
+        "non_eth_swaps": 1,
+        "rejected_not_router": 1,
+        "rejected_not_swap": 1,
+        "rejected_no_calldata": 1,
+    }
+    assert snapshot["timings"]["decode"]["count"] == 3
+    assert snapshot["timings"]["finding"]["count"] == 1
+
+
+def test_metrics_decode_once(contract):
+    """
+    Telling a token swap without ETH from calldata that can't be decoded should not decode
+    the calldata a second time
+    """
+    args = [Web3.toWei("1", "ether"), 1, [BURN_ADDR, ROUTER_ADDR], ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name="swapExactTokensForTokens", args=args)
+    tx_event = create_transaction_event(gen_tx_data(to=ROUTER_ADDR, data=data))
+    decoded = []
+
+    class CountingView(EventView):
+        __slots__ = ()
+
+        @property
+        def calldata(self):
+            if self._calldata is UNSET:
+                decoded.append(self.transaction.data)
+            return EventView.calldata.fget(self)
+
+    agent.metrics.configure({"enabled": True})
+    try:
+        assert handle_transaction(tx_event, CountingView(tx_event)) == []
+        snapshot = agent.metrics.get_snapshot()
+    finally:
+        agent.metrics.configure({"enabled": False})
+
+    assert snapshot["counters"]["non_eth_swaps"] == 1
+    assert len(decoded) == 1
+
+
+def test_transaction_split_swaps(contract, monkeypatch):
+    """
+    Send several swaps under the threshold from the same address in nearby blocks
+    This should raise a single alert once their total crosses the threshold
+    """
+    monkeypatch.setattr(agent, "SWAP_WINDOW", agent.SwapWindow(100, Web3.toWei("5", "ether")))
+    monkeypatch.setattr(agent, "WINDOW_TYPE", "blocks")
+    args = [Web3.toWei("1", "ether"), [WETH_ADDR, BURN_ADDR], ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name="swapExactETHForTokens", args=args)
+
+    findings = []
+    for block_number in range(1000, 1004):
+        tx_data = gen_tx_data(value=str(Web3.toWei("1.5", "ether")), to=ROUTER_ADDR, data=data)
+        tx_data["transaction"]["from"] = BURN_ADDR
+        tx_data["block"] = {"number": block_number}
+        findings.extend(handle_transaction(create_transaction_event(tx_data)))
+
+    # A swap from the same address long after the others is not added to them
+    tx_data["block"] = {"number": 2000}
+    findings.extend(handle_transaction(create_transaction_event(tx_data)))
+
+    assert len(findings) == 1
+    assert findings[0].alert_id == "AE-UNISWAP-LARGESWAP-ETH-WINDOW"
+    assert findings[0].metadata["amount"] == Web3.toWei("1.5", "ether")
+    assert findings[0].metadata["total_amount"] == Web3.toWei("6", "ether")
+
+
+def test_finding_filter(contract, monkeypatch):
+    """
+    With the finding filter on, a burst of large swaps from the same address should raise
+    one alert, then a summary with the count once the window has passed
+    """
+    finding_filter = agent.build_finding_filter(
+        {"enabled": True, "size": 10, "key_fields": {"AE-UNISWAP-LARGESWAP-ETH": ["from"]}}
+    )
+    monkeypatch.setattr(agent, "FINDING_FILTER", finding_filter)
+    args = [Web3.toWei("1", "ether"), [WETH_ADDR, BURN_ADDR], ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name="swapExactETHForTokens", args=args)
+
+    findings = []
+    for block_number in range(1000, 1004):
+        tx_data = gen_tx_data(value=str(Web3.toWei("10", "ether")), to=ROUTER_ADDR, data=data)
+        tx_data["transaction"]["from"] = BURN_ADDR
+        tx_data["block"] = {"number": block_number}
+        findings.extend(handle_transaction(create_transaction_event(tx_data)))
+    assert [finding.alert_id for finding in findings] == ["AE-UNISWAP-LARGESWAP-ETH"]
+
+    # The next swap after the window closes it, and is raised as usual
+    tx_data["block"] = {"number": 1010}
+    findings = handle_transaction_batch([create_transaction_event(tx_data)])
+    assert [finding.alert_id for finding in findings] == [
+        "AE-UNISWAP-LARGESWAP-ETH-SUMMARY",
+        "AE-UNISWAP-LARGESWAP-ETH",
+    ]
+    assert findings[0].metadata["from"] == BURN_ADDR
+    assert findings[0].metadata["count"] == 4
+
+
+def test_swap_path(contract):
+    """
+    The whole path of a swap should be read from the calldata, in lowercase
+    """
+    args = [1, 2, [BURN_ADDR, ROUTER_ADDR, WETH_ADDR], ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name="swapExactTokensForETH", args=args)
+
+    path = agent.get_swap_path(EventView(create_transaction_event(gen_tx_data(data=data))))
+    assert path == [BURN_ADDR.lower(), ROUTER_ADDR.lower(), WETH_ADDR.lower()]
+
+    truncated = EventView(create_transaction_event(gen_tx_data(data=data[:-64])))
+    assert agent.get_swap_path(truncated) is None
+
+
+def test_enrichment(contract, monkeypatch):
+    """
+    With enrichment on, an alert should be returned right away, however slow the lookups
+    of its tokens are. The finding with the tokens of its swap path should come out of a
+    later call, or of flush_findings, naming the transaction of the alert
+    """
+    looked_up = []
+    release = threading.Event()
+
+    async def lookup(token_addr):
+        looked_up.append(token_addr)
+        while not release.is_set():
+            await asyncio.sleep(0.001)
+        return {"symbol": token_addr[-4:], "decimals": 18}
+
+    enricher = agent.Enricher(lookup, agent.add_token_info)
+    monkeypatch.setattr(agent, "ENRICHER", enricher)
+    args = [Web3.toWei("1", "ether"), [WETH_ADDR, BURN_ADDR], ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name="swapExactETHForTokens", args=args)
+    tx_data = gen_tx_data(value=str(Web3.toWei("10", "ether")), to=ROUTER_ADDR, data=data)
+    tx_data["transaction"]["hash"] = "0x" + "ab" * 32
+    no_alert_event = create_transaction_event(gen_tx_data())
+
+    assert handle_transaction(no_alert_event) == []
+    assert looked_up == []
+
+    # The lookups don't finish until released, and would time out after 10 seconds
+    start = time.perf_counter()
+    findings = handle_transaction(create_transaction_event(tx_data))
+    assert time.perf_counter() - start < 0.5
+    assert [finding.alert_id for finding in findings] == ["AE-UNISWAP-LARGESWAP-ETH"]
+    assert "tokens" not in findings[0].metadata
+    assert handle_transaction(no_alert_event) == []
+
+    release.set()
+    tokens_findings = agent.flush_findings(5)
+    assert [finding.alert_id for finding in tokens_findings] == ["AE-UNISWAP-LARGESWAP-TOKENS"]
+    assert tokens_findings[0].metadata["transaction_hash"] == "0x" + "ab" * 32
+    assert tokens_findings[0].metadata["alert_id"] == "AE-UNISWAP-LARGESWAP-ETH"
+    assert tokens_findings[0].metadata["tokens"] == [
+        {"address": WETH_ADDR.lower(), "symbol": "6cc2", "decimals": 18},
+        {"address": BURN_ADDR.lower(), "symbol": "dead", "decimals": 18},
+    ]
+
+    # Once its lookups are done, a tokens finding is returned by the next call. The tokens
+    # are cached now, so it may be done in time for the call of its own alert
+    findings = handle_transaction(create_transaction_event(tx_data))
+    assert findings[0].alert_id == "AE-UNISWAP-LARGESWAP-ETH"
+    later = findings[1:]
+    deadline = time.monotonic() + 5
+    while not later and time.monotonic() < deadline:
+        time.sleep(0.001)
+        later = handle_transaction(no_alert_event)
+    enricher.close()
+    assert [finding.alert_id for finding in later] == ["AE-UNISWAP-LARGESWAP-TOKENS"]
+    assert later[0].metadata["transaction_hash"] == "0x" + "ab" * 32
+
+
+def test_token_swap_priced_by_oracle(contract, monkeypatch):
+    """
+    With the price oracle on, a large token to token swap should be valued in ETH at the
+    cached reserves of the token going in
+    """
+    token_addr = "0x6b175474e89094c44da98b954eedeac495271d0f"
+    # 4000 tokens per ETH
+    price_oracle = agent.PriceOracle(lambda token_addrs: {token_addr: (4000, 1)})
+    monkeypatch.setattr(agent, "PRICE_ORACLE", price_oracle)
+    path = [Web3.toChecksumAddress(token_addr), BURN_ADDR]
+    args = [Web3.toWei("40000", "ether"), 1, path, ROUTER_ADDR, 1]
+    data = contract.encodeABI(fn_name="swapExactTokensForTokens", args=args)
+    tx_event = create_transaction_event(gen_tx_data(to=ROUTER_ADDR, data=data))
+
+    # The token isn't priced until the oracle has fetched it
+    assert handle_transaction(tx_event) == []
+    price_oracle.refresh(full=False)
+
+    findings = handle_transaction(tx_event)
+    assert len(findings) == 1
+    assert findings[0].metadata["amount"] == Web3.toWei("10", "ether")
+
+
+def test_reserves_fetcher(monkeypatch):
+    """
+    Reserves should be fetched from the WETH pair of each token in one batch, with None for
+    tokens without a pair, leaving out tokens whose call failed
+    """
+    usdc_addr = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+    no_pair_addr = "0x0000000000000000000000000000000000000001"
+    failed_addr = "0x0000000000000000000000000000000000000002"
+    requests = []
+
+    class StubClient:
+        def request_batch(self, calls, ignore_errors=False):
+            requests.append(calls)
+            # The USDC/WETH pair holds 2000 USDC and 1 ETH
+            reserves = "0x" + f"{2000 * 10 ** 6:064x}" + f"{10 ** 18:064x}" + "0" * 64
+            return [reserves, "0x", None][:len(calls)]
+
+    fetch_reserves = agent.get_reserves_fetcher(StubClient(), WETH_ADDR.lower())
+    reserves = fetch_reserves([usdc_addr, no_pair_addr, failed_addr])
+
+    assert reserves == {usdc_addr: (2000 * 10 ** 6, 10 ** 18), no_pair_addr: None}
+    assert len(requests) == 1
+    assert requests[0][0][1][0]["to"] == "0xb4e16d0168e52d35cacd2c6185b44281ec28c9dc"
+
+    # A $100,000 threshold is worth 50 ETH at that price
+    monkeypatch.setattr(agent, "THRESHOLD_WEI", agent.ETHER_THRESHOLD)
+    price_oracle = agent.PriceOracle(fetch_reserves)
+    price_oracle.on_refresh = agent.get_threshold_updater(100000, usdc_addr, 6)
+    price_oracle.track(usdc_addr)
+    price_oracle.refresh()
+    assert agent.THRESHOLD_WEI == Web3.toWei("50", "ether")
+
+
+def test_threshold_updates_past_max_tokens(monkeypatch):
+    """
+    The threshold should keep following the price of the USD token once other tokens have
+    filled the price oracle past its limit
+    """
+    usdc_addr = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+    tokens = [f"0x{i:040x}" for i in range(1, 5)]
+    # USDC per ETH
+    usd_price = [2000]
+
+    def fetch_reserves(token_addrs):
+        reserves = {token_addr: (1, 1) for token_addr in token_addrs}
+        if usdc_addr in reserves:
+            reserves[usdc_addr] = (usd_price[0] * 10 ** 6, 10 ** 18)
+        return reserves
+
+    monkeypatch.setattr(agent, "THRESHOLD_WEI", agent.ETHER_THRESHOLD)
+    price_oracle = agent.PriceOracle(fetch_reserves, max_tokens=2)
+    price_oracle.on_refresh = agent.get_threshold_updater(100000, usdc_addr, 6)
+    price_oracle.track(usdc_addr)
+    price_oracle.refresh()
+    assert agent.THRESHOLD_WEI == Web3.toWei("50", "ether")
+
+    for token in tokens:
+        price_oracle.get_eth_value(token, 1)
+        price_oracle.refresh()
+
+    usd_price[0] = 4000
+    price_oracle.refresh()
+    assert agent.THRESHOLD_WEI == Web3.toWei("25", "ether")
+
+
+def test_window_threshold_follows_usd_threshold(monkeypatch):
+    """
+    The swap window should use the same USD derived threshold as single swaps, unless it has
+    a fixed threshold of its own
+    """
+    usdc_addr = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+
+    def fetch_reserves(token_addrs):
+        return {token_addr: (2000 * 10 ** 6, 10 ** 18) for token_addr in token_addrs}
+
+    swap_window = agent.SwapWindow(100, agent.ETHER_THRESHOLD)
+    monkeypatch.setattr(agent, "THRESHOLD_WEI", agent.ETHER_THRESHOLD)
+    monkeypatch.setattr(agent, "SWAP_WINDOW", swap_window)
+    monkeypatch.setattr(agent, "WINDOW_THRESHOLD_WEI", None)
+    price_oracle = agent.PriceOracle(fetch_reserves)
+    price_oracle.on_refresh = agent.get_threshold_updater(100000, usdc_addr, 6)
+    price_oracle.track(usdc_addr)
+    price_oracle.refresh()
+    assert swap_window.threshold == agent.THRESHOLD_WEI == Web3.toWei("50", "ether")
+
+    fixed_window = agent.SwapWindow(100, Web3.toWei("8", "ether"))
+    monkeypatch.setattr(agent, "SWAP_WINDOW", fixed_window)
+    monkeypatch.setattr(agent, "WINDOW_THRESHOLD_WEI", Web3.toWei("8", "ether"))
+    price_oracle.refresh()
+    assert fixed_window.threshold == Web3.toWei("8", "ether")
@@ -0,0 +1,94 @@
+"""
+Reads ABI encoded arguments straight out of calldata. The hex calldata is decoded into a
+bytes buffer once, and only the words that are read are turned into ints or addresses, so
+reading a field costs the same whatever the size of the calldata. Offsets are in bytes from
+the start of the arguments, after the method id, as in the ABI encoding.
+
+Slices of the buffer are used rather than memoryview slices: a 32 byte slice is cheaper to
+copy than a memoryview object is to create, and int.from_bytes copies a memoryview anyway
+"""
+
+# Each ABI word is 32 bytes
+WORD_SIZE = 32
+# The method id takes the first 4 bytes of the calldata
+SELECTOR_SIZE = 4
+# An address is stored in the last 20 bytes of a word
+ADDRESS_OFFSET = WORD_SIZE - 20
+ADDRESS_SIZE = 20
+
+
+def decode_calldata(data):
+    """
+    Decode '0x' prefixed hex calldata into a bytes buffer. Returns None if it isn't valid hex
+    """
+    try:
+        return bytes.fromhex(data[2:])
+    except ValueError:
+        return None
+
+
+def read_uint(buffer, offset):
+    """
+    Return the uint256 word at 'offset', or None if the calldata is too short
+    """
+    start = SELECTOR_SIZE + offset
+    end = start + WORD_SIZE
+    if len(buffer) < end:
+        return None
+
+    return int.from_bytes(buffer[start:end], "big")
+
+
+def read_address(buffer, offset):
+    """
+    Return the address in the word at 'offset' as 20 bytes, or None if the calldata is too
+    short
+    """
+    start = SELECTOR_SIZE + offset + ADDRESS_OFFSET
+    end = start + ADDRESS_SIZE
+    if len(buffer) < end:
+        return None
+
+    return buffer[start:end]
+
+
+def read_array(buffer, arg_index):
+    """
+    Return the offset of the first item and the length of the dynamic array argument at
+    position 'arg_index', or None if the calldata doesn't hold the whole array. The head
+    holds the offset of the array, where its length is stored followed by its items
+    """
+    size = len(buffer)
+    head = SELECTOR_SIZE + arg_index * WORD_SIZE
+    if size < head + WORD_SIZE:
+        return None
+
+    array_offset = int.from_bytes(buffer[head:head + WORD_SIZE], "big")
+    length_start = SELECTOR_SIZE + array_offset
+    if size < length_start + WORD_SIZE:
+        return None
+
+    length = int.from_bytes(buffer[length_start:length_start + WORD_SIZE], "big")
+    first = array_offset + WORD_SIZE
+    if size < SELECTOR_SIZE + first + length * WORD_SIZE:
+        return None
+
+    return first, length
+
+
+def read_address_array(buffer, arg_index):
+    """
+    Return the items of the address[] argument at position 'arg_index' as '0x' prefixed
+    lowercase hex strings, or None if the calldata doesn't hold the whole array
+    """
+    array = read_array(buffer, arg_index)
+    if array is None:
+        return None
+
+    first, length = array
+    start = SELECTOR_SIZE + first + ADDRESS_OFFSET
+
+    return [
+        "0x" + buffer[item:item + ADDRESS_SIZE].hex()
+        for item in range(start, start + length * WORD_SIZE, WORD_SIZE)
+    ]
@@ -0,0 +1,75 @@
+from calldata import (
+    decode_calldata,
+    read_address,
+    read_address_array,
+    read_array,
+    read_uint,
+)
+
+WETH_ADDR = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+DAI_ADDR = "0x6b175474e89094c44da98b954eedeac495271d0f"
+
+
+def gen_calldata():
+    """
+    Generate calldata for swapExactTokensForTokens(5, 7, [WETH, DAI], 0xdead, 9)
+    """
+    words = [
+        5,
+        7,
+        # The path is stored after the five head words
+        5 * 32,
+        0xDEAD,
+        9,
+        2,
+        int(WETH_ADDR, 16),
+        int(DAI_ADDR, 16),
+    ]
+    return "0x38ed1739" + "".join(f"{word:064x}" for word in words)
+
+
+def test_read_words():
+    """
+    Words should be read at byte offsets from the start of the arguments
+    """
+    calldata = decode_calldata(gen_calldata())
+
+    assert read_uint(calldata, 0) == 5
+    assert read_uint(calldata, 32) == 7
+    assert read_address(calldata, 3 * 32) == bytes.fromhex("dead".zfill(40))
+
+
+def test_read_arrays():
+    """
+    A dynamic array should be found through its offset, and its addresses read in order
+    """
+    calldata = decode_calldata(gen_calldata())
+
+    assert read_array(calldata, 2) == (6 * 32, 2)
+    assert read_address_array(calldata, 2) == [WETH_ADDR, DAI_ADDR]
+
+
+def test_truncated_calldata():
+    """
+    Reads past the end of the calldata, and arrays that don't fit in it, should return None
+    """
+    data = gen_calldata()
+    calldata = decode_calldata(data)
+
+    assert read_uint(calldata, 8 * 32) is None
+    assert read_address(calldata, 8 * 32) is None
+
+    # Cut the last address of the path
+    truncated = decode_calldata(data[:-64])
+    assert read_uint(truncated, 0) == 5
+    assert read_array(truncated, 2) is None
+    assert read_address_array(truncated, 2) is None
+
+
+def test_invalid_calldata():
+    """
+    Calldata that isn't valid hex should not be decoded
+    """
+    assert decode_calldata("0x38ed173") is None
+    assert decode_calldata("0xzz") is None
+    assert decode_calldata("0x") == b""
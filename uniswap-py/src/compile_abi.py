@@ -0,0 +1,137 @@
+import json
+import os
+
+from web3 import Web3
+
+# Module the compiled swap table is written to, imported by the agent
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_selectors.py")
+
+# Arguments that hold the amount going into and coming out of a swap, in order of preference
+AMOUNT_IN_ARGS = ("amountIn", "amountInMax")
+AMOUNT_OUT_ARGS = ("amountOutMin", "amountOut")
+
+HEADER = '''"""
+Swap functions of the Uniswap V2 Router, compiled from router_abi.json by
+src/compile_abi.py. Do not edit, run `npm run build:abi` instead
+"""
+
+# Method id -> (function name, where the amount of ETH comes from, argument positions):
+#   - "value": the ETH sent with the transaction
+#   - "word": the uint256 argument at the given position
+#   - "path": the path, amount in and amount out arguments at the given positions
+'''
+
+PATHS_HEADER = '''
+# Method id -> position of the path argument, for every swap function
+'''
+
+
+def get_contract_abi():
+    """
+    Return the router ABI saved in 'router_abi.json' as a list
+    """
+    # The saved ABI is a JSON string, as returned by etherscan
+    with open("router_abi.json", "r") as f:
+        return json.loads(json.loads(f.read()))
+
+
+def get_function_selector(function_abi):
+    """
+    Return the method id of a function in the ABI as a hex string, e.g. '0x18cbafe5'
+    """
+    arg_types = ",".join(arg["type"] for arg in function_abi["inputs"])
+    signature = f"{function_abi['name']}({arg_types})"
+
+    return "0x" + bytes(Web3.keccak(text=signature)[:4]).hex()
+
+
+def get_arg_index(function_abi, arg_names):
+    """
+    Return the position of the first argument of a function that has one of the given names
+    """
+    names = [arg["name"] for arg in function_abi["inputs"]]
+    for arg_name in arg_names:
+        if arg_name in names:
+            return names.index(arg_name)
+
+    raise ValueError(f"{function_abi['name']} has none of the arguments {arg_names}")
+
+
+def get_swap_layout(function_abi):
+    """
+    Return where the amount of ETH being swapped is found for a swap function
+    """
+    if function_abi.get("stateMutability") == "payable":
+        return ("value", ())
+
+    # Functions that swap for ETH end in 'ETH', before any SupportingFeeOnTransferTokens suffix
+    if function_abi["name"].split("Supporting")[0].endswith("ETH"):
+        return ("word", (get_arg_index(function_abi, AMOUNT_OUT_ARGS),))
+
+    return (
+        "path",
+        (
+            get_arg_index(function_abi, ("path",)),
+            get_arg_index(function_abi, AMOUNT_IN_ARGS),
+            get_arg_index(function_abi, AMOUNT_OUT_ARGS),
+        ),
+    )
+
+
+def compile_swap_functions(abi):
+    """
+    Build the table of every swap function on the router, keyed on method id
+    """
+    swap_functions = {}
+    for function_abi in abi:
+        if function_abi.get("type") != "function" or not function_abi["name"].startswith("swap"):
+            continue
+
+        kind, arg_indexes = get_swap_layout(function_abi)
+        swap_functions[get_function_selector(function_abi)] = (function_abi["name"], kind, arg_indexes)
+
+    return swap_functions
+
+
+def compile_swap_paths(abi):
+    """
+    Build the table of the position of the path argument of every swap function on the
+    router, keyed on method id
+    """
+    swap_paths = {}
+    for function_abi in abi:
+        if function_abi.get("type") != "function" or not function_abi["name"].startswith("swap"):
+            continue
+
+        swap_paths[get_function_selector(function_abi)] = get_arg_index(function_abi, ("path",))
+
+    return swap_paths
+
+
+def render_module(abi):
+    """
+    Return the source of the compiled module
+    """
+    lines = [HEADER, "SWAP_FUNCTIONS = {\n"]
+    for selector, (name, kind, arg_indexes) in sorted(compile_swap_functions(abi).items()):
+        lines.append(f'    "{selector}": ("{name}", "{kind}", {arg_indexes!r}),\n')
+    lines.append("}\n")
+
+    lines.append(PATHS_HEADER)
+    lines.append("SWAP_PATHS = {\n")
+    for selector, path_index in sorted(compile_swap_paths(abi).items()):
+        lines.append(f'    "{selector}": {path_index},\n')
+    lines.append("}\n")
+
+    return "".join(lines)
+
+
+def main():
+    with open(OUTPUT_PATH, "w") as f:
+        f.write(render_module(get_contract_abi()))
+
+    print(f"Wrote {OUTPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+from web3 import Web3
+
+from compile_abi import OUTPUT_PATH, get_contract_abi, render_module
+from router_selectors import SWAP_FUNCTIONS
+
+
+def test_compiled_module_is_up_to_date():
+    """
+    router_selectors.py should match what the build step generates from router_abi.json.
+    If this fails run `npm run build:abi`
+    """
+    with open(OUTPUT_PATH, "r") as f:
+        compiled = f.read()
+
+    assert compiled == render_module(get_contract_abi())
+
+
+def test_compiled_selectors_match_abi():
+    """
+    Every compiled method id should belong to the swap function of the same name
+    """
+    contract = Web3().eth.contract(abi=get_contract_abi())
+
+    for selector, (name, _, _) in SWAP_FUNCTIONS.items():
+        assert contract.get_function_by_selector(selector).fn_name == name
@@ -0,0 +1,327 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+
+import aiohttp
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "rpc_url": "",
+    "max_concurrency": 8,
+    "cache_size": 10000,
+    "cache_ttl_seconds": 3600,
+    "timeout_seconds": 10,
+}
+
+# Returned for keys that aren't cached or couldn't be looked up, since None can be a value
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries also expire 'ttl' seconds after they are set
+    """
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # Key -> (expiry time, value), least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the value cached for a key, or MISSING if it isn't cached or has expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+
+        if entry[0] <= self.clock():
+            del self._entries[key]
+            return MISSING
+
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value):
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class RpcError(Exception):
+    pass
+
+
+def get_results(payload, body, ignore_errors):
+    """
+    Return the results of the calls of a JSON-RPC batch in the order they were sent
+    """
+    if not isinstance(body, list):
+        raise RpcError(f"Unexpected batch response: {body}")
+
+    # Responses to a batch can come back in any order
+    responses = {response.get("id"): response for response in body}
+    results = []
+    for call in payload:
+        response = responses.get(call["id"])
+        if response is None or "error" in response:
+            if ignore_errors:
+                results.append(None)
+                continue
+            error = response.get("error") if response else "no response"
+            raise RpcError(f"{call['method']} failed: {error}")
+        results.append(response.get("result"))
+
+    return results
+
+
+class JsonRpcClient:
+    """
+    Minimal JSON-RPC client over HTTP. 'request_batch' blocks, for background threads such as
+    the price oracle's, and 'call_batch' is its non-blocking version for an event loop. The
+    HTTP session of 'call_batch' is opened on the loop of its first call and closed by
+    'aclose' on the same loop
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        self._request_ids = itertools.count(1)
+        self._session = None
+
+    def _get_payload(self, calls):
+        return [
+            {"jsonrpc": "2.0", "id": next(self._request_ids), "method": method, "params": params}
+            for method, params in calls
+        ]
+
+    def request_batch(self, calls, ignore_errors=False):
+        """
+        Send a batch of (method, params) calls in a single request and return their results
+        in the same order. Raises RpcError if any of the calls failed, unless 'ignore_errors'
+        is set, in which case their result is None
+        """
+        payload = self._get_payload(calls)
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = json.loads(response.read())
+
+        return get_results(payload, body, ignore_errors)
+
+    async def call_batch(self, calls, ignore_errors=False):
+        """
+        Same as 'request_batch', awaited on the event loop instead of blocking
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+
+        payload = self._get_payload(calls)
+        async with self._session.post(self.url, json=payload) as response:
+            body = json.loads(await response.read())
+
+        return get_results(payload, body, ignore_errors)
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class Enricher:
+    """
+    Enriches findings on an event loop in a background thread. Findings are submitted with
+    the keys to look up, e.g. token addresses, and each gives a future that is done once its
+    lookups are, or once 'timeout' seconds have passed, in which case the finding has what
+    was found so far. Submitting never waits: the findings that are done are picked up later
+    with 'collect', or waited on with 'wait' and 'flush'. The lookups are coroutines, so they run side by side on the one thread.
+    At most 'max_concurrency' lookups run at once, findings waiting on the same key share a
+    single lookup, and results are kept in a TTL/LRU cache. Failed lookups are not cached
+    """
+
+    def __init__(
+        self,
+        lookup,
+        apply,
+        max_concurrency=8,
+        cache_size=10000,
+        cache_ttl=3600,
+        timeout=10,
+        client=None,
+    ):
+        # Coroutine function that returns the value for a key
+        self.lookup = lookup
+        # Function that adds the values found, a dict of key -> value, to a finding
+        self.apply = apply
+        # Client the lookups run on, e.g. a JsonRpcClient, closed with the enricher on its
+        # loop. May be None
+        self.client = client
+        self.timeout = timeout
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.stats = {
+            "lookups": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "failures": 0,
+            "timeouts": 0,
+        }
+        # Futures of the findings submitted and not yet returned, in the order they were
+        # submitted. Only used on the agent's thread
+        self._pending = {}
+        # Key -> task of the lookup running for it. Only used on the loop thread
+        self._in_flight = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._max_concurrency = max_concurrency
+        self._thread = threading.Thread(target=self._run, name="enricher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        # Created here, as the semaphore belongs to the loop it is created on
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        self._loop.run_forever()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def submit(self, finding, keys):
+        """
+        Queue a finding to be enriched with the values of 'keys'. Returns immediately, with
+        a future of the finding
+        """
+        keys = tuple(dict.fromkeys(keys))
+        if not keys:
+            future = concurrent.futures.Future()
+            future.set_result(finding)
+        else:
+            future = asyncio.run_coroutine_threadsafe(self._enrich(finding, keys), self._loop)
+
+        self._pending[future] = None
+        return future
+
+    def collect(self):
+        """
+        Return the submitted findings that are done, in the order they were submitted,
+        without waiting on the others
+        """
+        done = [future for future in self._pending if future.done()]
+        for future in done:
+            del self._pending[future]
+
+        return [future.result() for future in done]
+
+    def wait(self, futures, timeout=None):
+        """
+        Wait for the futures of submitted findings, at most 'timeout' seconds, and return the
+        findings that are done, in the order of 'futures'. Each finding gives up on its
+        lookups after the enrichment timeout, so without 'timeout' this waits that long at most
+        """
+        done, _ = concurrent.futures.wait(futures, timeout)
+        findings = []
+        for future in futures:
+            if future in done:
+                self._pending.pop(future, None)
+                findings.append(future.result())
+
+        return findings
+
+    def flush(self, timeout=None):
+        """
+        Wait for every finding submitted and not yet returned, at most 'timeout' seconds,
+        and return those that are done, e.g. on shutdown
+        """
+        return self.wait(list(self._pending), timeout)
+
+    def close(self):
+        if self.client is not None:
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _fetch(self, key):
+        """
+        Look up a key, keeping at most 'max_concurrency' lookups running. Returns MISSING if
+        the lookup failed
+        """
+        try:
+            async with self._semaphore:
+                self.stats["lookups"] += 1
+                value = await self.lookup(key)
+        except Exception:
+            self.stats["failures"] += 1
+            return MISSING
+        finally:
+            del self._in_flight[key]
+
+        self.cache.set(key, value)
+        return value
+
+    async def _enrich(self, finding, keys):
+        values = {}
+        waiting = {}
+        for key in keys:
+            value = self.cache.get(key)
+            if value is not MISSING:
+                self.stats["cache_hits"] += 1
+                values[key] = value
+                continue
+
+            task = self._in_flight.get(key)
+            if task is None:
+                task = self._in_flight[key] = self._loop.create_task(self._fetch(key))
+            else:
+                self.stats["coalesced"] += 1
+            waiting[key] = task
+
+        if waiting:
+            # The lookups are shielded so one finding timing out doesn't cancel a lookup that
+            # other findings, or the cache, are waiting on
+            lookups = asyncio.gather(*[asyncio.shield(task) for task in waiting.values()])
+            try:
+                await asyncio.wait_for(lookups, self.timeout)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+
+            for key, task in waiting.items():
+                values[key] = task.result() if task.done() else MISSING
+
+        found = {key: values[key] for key in keys if values[key] is not MISSING}
+        if found:
+            try:
+                self.apply(finding, found)
+            except Exception:
+                # A finding is never held back, even if it couldn't be enriched
+                self.stats["failures"] += 1
+
+        return finding
+
+    def get_gauges(self):
+        """
+        Return the lookup statistics, the number of findings being enriched and the size of
+        the cache, as gauges for the metrics snapshot
+        """
+        gauges = {f"enrichment_{name}": value for name, value in self.stats.items()}
+        gauges["enrichment_pending"] = self.pending
+        gauges["enrichment_cache_entries"] = len(self.cache)
+
+        return gauges
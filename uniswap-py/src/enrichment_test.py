@@ -0,0 +1,253 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from agent import DECIMALS_SELECTOR, SYMBOL_SELECTOR, get_token_lookup
+from enrichment import MISSING, Enricher, JsonRpcClient, RpcError, TTLCache
+
+TOKEN_ADDR = "0x6b175474e89094c44da98b954eedeac495271d0f"
+BYTES32_TOKEN_ADDR = "0x9f8f72aa9304c8b593d555f12ef6589cc3a579a2"
+
+
+def encode_word(value):
+    return f"{value:064x}"
+
+
+def encode_string(text):
+    """
+    ABI encode a string, as returned by symbol()
+    """
+    raw = text.encode().hex()
+    padding = "0" * (-len(raw) % 64)
+
+    return "0x" + encode_word(32) + encode_word(len(text)) + raw + padding
+
+
+# (to, data) -> result of eth_call on the stub node
+CALL_RESULTS = {
+    (TOKEN_ADDR, SYMBOL_SELECTOR): encode_string("DAI"),
+    (TOKEN_ADDR, DECIMALS_SELECTOR): "0x" + encode_word(18),
+    (BYTES32_TOKEN_ADDR, SYMBOL_SELECTOR): "0x" + b"MKR".hex().ljust(64, "0"),
+    (BYTES32_TOKEN_ADDR, DECIMALS_SELECTOR): "0x" + encode_word(18),
+}
+
+
+class StubRpcHandler(BaseHTTPRequestHandler):
+    """
+    Answers JSON-RPC batches of eth_call from CALL_RESULTS, and counts the requests
+    """
+
+    def do_POST(self):
+        self.server.requests += 1
+        batch = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        responses = []
+        for call in batch:
+            params = call["params"][0]
+            result = CALL_RESULTS.get((params["to"], params["data"]))
+            response = {"jsonrpc": "2.0", "id": call["id"]}
+            if result is None:
+                response["error"] = {"code": -32000, "message": "execution reverted"}
+            else:
+                response["result"] = result
+            responses.append(response)
+
+        # Answer in reverse, as nodes don't have to keep the order of a batch
+        body = json.dumps(responses[::-1]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rpc_server():
+    """
+    Run a stub JSON-RPC node on a local port for the duration of a test
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRpcHandler)
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def gen_finding():
+    return SimpleNamespace(metadata={})
+
+
+def add_values(finding, values):
+    finding.metadata.update(values)
+
+
+def test_cache_expiry_and_eviction():
+    """
+    Entries should expire after the TTL, and the least recently used should be evicted first
+    """
+    now = [0]
+    cache = TTLCache(2, 10, clock=lambda: now[0])
+
+    cache.set("a", 1)
+    cache.set("b", None)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+    now[0] = 10
+    assert cache.get("a") is MISSING
+    assert len(cache) == 1
+
+
+def get_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_token_lookup(rpc_server):
+    """
+    The symbol and decimals of a token should be read from the node in one batch
+    """
+    client = JsonRpcClient(get_url(rpc_server))
+    lookup = get_token_lookup(client)
+
+    async def run():
+        assert await lookup(TOKEN_ADDR) == {"symbol": "DAI", "decimals": 18}
+        assert await lookup(BYTES32_TOKEN_ADDR) == {"symbol": "MKR", "decimals": 18}
+        with pytest.raises(RpcError):
+            await lookup("0x0000000000000000000000000000000000000001")
+        await client.aclose()
+
+    asyncio.run(run())
+    assert rpc_server.requests == 3
+    # The blocking version sends the same batches
+    assert client.request_batch([("eth_call", [{"to": TOKEN_ADDR, "data": DECIMALS_SELECTOR}])])
+    assert rpc_server.requests == 4
+
+
+def test_enricher_with_rpc(rpc_server):
+    """
+    Findings waiting on the same token should share a lookup, later ones should be served
+    from the cache, and findings whose lookups fail should still come out. Closing the
+    enricher should close its client
+    """
+    client = JsonRpcClient(get_url(rpc_server))
+    enricher = Enricher(get_token_lookup(client), add_values, max_concurrency=2, client=client)
+
+    findings = [gen_finding() for _ in range(4)]
+    keys = [TOKEN_ADDR, BYTES32_TOKEN_ADDR]
+    futures = [enricher.submit(finding, keys) for finding in findings[:3]]
+    enricher.submit(findings[3], ["0x0000000000000000000000000000000000000001"])
+    # Only the findings waited on are returned, in the order they were submitted
+    assert enricher.wait(futures) == findings[:3]
+    assert enricher.pending == 1
+    assert enricher.flush(5) == [findings[3]]
+    assert enricher.pending == 0
+
+    for finding in findings[:3]:
+        assert finding.metadata[TOKEN_ADDR]["symbol"] == "DAI"
+        assert finding.metadata[BYTES32_TOKEN_ADDR]["symbol"] == "MKR"
+    assert findings[3].metadata == {}
+
+    later = gen_finding()
+    enricher.submit(later, [TOKEN_ADDR])
+    assert enricher.flush(5) == [later]
+    assert later.metadata[TOKEN_ADDR]["decimals"] == 18
+
+    assert enricher.stats["lookups"] == rpc_server.requests == 3
+    assert enricher.stats["failures"] == 1
+    assert enricher.stats["coalesced"] + enricher.stats["cache_hits"] == 5
+
+    enricher.close()
+    assert client._session is None
+
+
+def test_enricher_bounded_concurrency():
+    """
+    No more than 'max_concurrency' lookups should run at once
+    """
+    running = [0, 0]
+
+    async def lookup(key):
+        running[0] += 1
+        running[1] = max(running[1], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return key
+
+    enricher = Enricher(lookup, add_values, max_concurrency=2)
+    for key in range(8):
+        enricher.submit(gen_finding(), [key])
+
+    assert len(enricher.flush(5)) == 8
+    assert running[1] == 2
+    enricher.close()
+
+
+def test_enricher_timeout():
+    """
+    A finding should come out unenriched once the timeout passes, without cancelling the
+    lookup, which still fills the cache
+    """
+    release = threading.Event()
+
+    async def lookup(key):
+        while not release.is_set():
+            await asyncio.sleep(0.001)
+        return "value"
+
+    enricher = Enricher(lookup, add_values, timeout=0.05)
+    finding = gen_finding()
+    future = enricher.submit(finding, ["key"])
+    assert enricher.wait([future], 0) == []
+
+    assert enricher.wait([future]) == [finding]
+    assert finding.metadata == {}
+    assert enricher.stats["timeouts"] == 1
+
+    release.set()
+    later = gen_finding()
+    enricher.submit(later, ["key"])
+    assert enricher.flush(5) == [later]
+    assert later.metadata == {"key": "value"}
+    enricher.close()
+
+
+def test_enricher_collect():
+    """
+    Collecting should return the findings that are done, in the order they were submitted,
+    without waiting on the ones still being looked up
+    """
+    release = threading.Event()
+
+    async def lookup(key):
+        while key == "slow" and not release.is_set():
+            await asyncio.sleep(0.001)
+        return key
+
+    enricher = Enricher(lookup, add_values)
+    slow, fast = gen_finding(), gen_finding()
+    slow_future = enricher.submit(slow, ["slow"])
+    fast_future = enricher.submit(fast, ["fast"])
+    fast_future.result(5)
+
+    assert enricher.collect() == [fast]
+    assert enricher.pending == 1
+
+    release.set()
+    slow_future.result(5)
+    assert enricher.collect() == [slow]
+    assert enricher.collect() == []
+    assert enricher.pending == 0
+    enricher.close()
@@ -0,0 +1,288 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Uniswap V2 factory, and the hash of the init code of its pair contract. The address of the
+# pair of any two tokens follows from these (CREATE2), so no call is needed to find it
+FACTORY_ADDR = "0x5c69bee701ef814a2b6a3edd4b1652cb9cc5aa6f"
+PAIR_INIT_CODE_HASH = "96e8ac4277198ff8b6f785478aa9a39f403cb768dd02cbee326c3e7da348845f"
+
+# Method id of getReserves() on a pair
+GET_RESERVES_SELECTOR = "0x0902f1ac"
+
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "rpc_url": "",
+    "refresh_seconds": 60,
+    "max_age_seconds": 600,
+    "max_tokens": 10000,
+    "threshold_usd": 0,
+    # USDC, used to price ETH in USD
+    "usd_token_addr": "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48",
+    "usd_token_decimals": 6,
+}
+
+# Shortest time between two refreshes that only fetch newly requested tokens
+MIN_REQUEST_INTERVAL = 1
+
+
+def get_pair_address(token_a, token_b):
+    """
+    Return the address of the Uniswap V2 pair of two tokens, in lowercase
+    """
+    # web3 is only needed for keccak, on the refresh thread
+    from web3 import Web3
+
+    token0, token1 = sorted((token_a.lower(), token_b.lower()))
+    salt = bytes(Web3.keccak(bytes.fromhex(token0[2:] + token1[2:])))
+    pair_hash = bytes(
+        Web3.keccak(
+            b"\xff" + bytes.fromhex(FACTORY_ADDR[2:]) + salt + bytes.fromhex(PAIR_INIT_CODE_HASH)
+        )
+    )
+
+    return "0x" + pair_hash[12:].hex()
+
+
+def decode_reserves(result, token_addr, weth_addr):
+    """
+    Decode the result of getReserves() on the pair of a token and WETH into
+    (token reserve, WETH reserve). Returns None if the pair doesn't exist or is empty
+    """
+    # The reserves are the first two words, ordered by token address
+    if not result or len(result) < 2 + 2 * 64:
+        return None
+
+    reserve0 = int(result[2:66], 16)
+    reserve1 = int(result[66:130], 16)
+    if not reserve0 or not reserve1:
+        return None
+
+    if token_addr.lower() < weth_addr.lower():
+        return (reserve0, reserve1)
+
+    return (reserve1, reserve0)
+
+
+class PriceOracle:
+    """
+    Prices amounts of tokens in ETH from the reserves of each token's pair with WETH.
+    Prices are kept in a dict that a background thread rebuilds every 'refresh_interval'
+    seconds and swaps in whole, so pricing an amount is a dict lookup and never waits on the
+    node. A token that isn't priced yet is requested, and fetched shortly after on the
+    background thread.
+    At most 'max_tokens' tokens are tracked, the least recently priced are dropped first, and
+    prices that couldn't be refreshed for 'max_age' seconds are dropped. Tokens found to have
+    no pair with WETH aren't tracked, and aren't requested again for 'max_age' seconds.
+    Tokens passed to 'track' are pinned: they come on top of 'max_tokens', are never dropped
+    and are fetched on every full refresh, whether or not they are looked up
+    """
+
+    def __init__(
+        self,
+        fetch_reserves,
+        max_tokens=10000,
+        max_age=600,
+        refresh_interval=60,
+        on_refresh=None,
+        clock=time.monotonic,
+    ):
+        # Function that takes a list of token addresses and returns a dict of
+        # token -> (token reserve, WETH reserve), or None for tokens without a pair or with an
+        # empty one. Tokens that couldn't be fetched are left out, and fetched again on the
+        # next full refresh. It may block
+        self.fetch_reserves = fetch_reserves
+        self.max_tokens = max_tokens
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        # Called with the oracle on the background thread after each refresh
+        self.on_refresh = on_refresh
+        self.clock = clock
+        self.last_error = None
+
+        # Token -> (token reserve, WETH reserve). Only ever replaced, never modified in place
+        self._prices = {}
+        # Tokens without a pair, which aren't requested again. Also only ever replaced
+        self._unpaired = frozenset()
+        # Tokens requested and priced since the last refresh. The agent's thread adds to these
+        # and the background thread swaps them out, both under the lock, so the background
+        # thread has the old sets to itself once it has swapped them
+        self._lock = threading.Lock()
+        self._requested = set()
+        self._used = set()
+        # Tokens kept priced whether or not they are used. Only added to, under the lock
+        self._pinned = set()
+        # Only used on the background thread: every tracked token, least recently used first,
+        # and token -> (reserves, time fetched)
+        self._tokens = OrderedDict()
+        self._fetched = {}
+        # Token without a pair -> time it was fetched
+        self._unpaired_at = {}
+
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._prices)
+
+    def get_reserves(self, token_addr):
+        """
+        Return the (token reserve, WETH reserve) of a token, in lowercase, or None if it
+        isn't priced
+        """
+        return self._prices.get(token_addr)
+
+    def get_eth_value(self, token_addr, amount):
+        """
+        Return the value in wei of an amount of a token, in lowercase, at the cached
+        reserves. Returns None if the token isn't priced yet, and requests it, or if it has
+        no pair
+        """
+        reserves = self._prices.get(token_addr)
+        if reserves is None:
+            if token_addr in self._unpaired:
+                return None
+            with self._lock:
+                requested = token_addr not in self._requested
+                if requested:
+                    self._requested.add(token_addr)
+            if requested:
+                self._wake_event.set()
+            return None
+
+        with self._lock:
+            self._used.add(token_addr)
+        return amount * reserves[1] // reserves[0]
+
+    def track(self, token_addr):
+        """
+        Keep a token priced even if it is never looked up, e.g. the token used for USD prices
+        """
+        token_addr = token_addr.lower()
+        with self._lock:
+            self._pinned.add(token_addr)
+            self._requested.add(token_addr)
+
+    def refresh(self, full=True):
+        """
+        Fetch reserves and swap in the new prices: those of every tracked token, or only of
+        the newly requested ones. Returns False if the reserves couldn't be fetched, in which
+        case the previous prices are kept until they are older than 'max_age'
+        """
+        with self._lock:
+            requested, self._requested = self._requested, set()
+            used, self._used = self._used, set()
+            pinned = set(self._pinned)
+
+        now = self.clock()
+        oldest = now - self.max_age
+        unpaired_at = self._unpaired_at
+        for token_addr in [t for t, fetched_at in unpaired_at.items() if fetched_at <= oldest]:
+            del unpaired_at[token_addr]
+
+        tokens = self._tokens
+        # Pinned tokens are kept apart from the ones that can be dropped
+        for token_addr in pinned:
+            tokens.pop(token_addr, None)
+        for token_addr in used:
+            if token_addr in tokens:
+                tokens.move_to_end(token_addr)
+        new_tokens = [
+            token_addr
+            for token_addr in requested
+            if token_addr not in tokens
+            and token_addr not in unpaired_at
+            and token_addr not in pinned
+        ]
+        for token_addr in new_tokens:
+            tokens[token_addr] = None
+        while len(tokens) > self.max_tokens:
+            token_addr, _ = tokens.popitem(last=False)
+            self._fetched.pop(token_addr, None)
+
+        if full:
+            to_fetch = list(pinned) + list(tokens)
+        else:
+            to_fetch = [t for t in requested if t in pinned]
+            to_fetch += [t for t in new_tokens if t in tokens]
+        ok = True
+        if to_fetch:
+            try:
+                reserves = self.fetch_reserves(to_fetch)
+            except Exception as e:
+                # Keep serving the previous prices if the node can't be reached
+                self.last_error = e
+                reserves = {}
+                ok = False
+            else:
+                self.last_error = None
+
+            for token_addr, token_reserves in reserves.items():
+                if token_reserves is not None:
+                    if token_addr in tokens or token_addr in pinned:
+                        self._fetched[token_addr] = (token_reserves, now)
+                    continue
+
+                # The token has no pair, so stop tracking it rather than fetch it again on
+                # every refresh. Pinned tokens are still fetched, as the pair may be created
+                self._fetched.pop(token_addr, None)
+                if token_addr in tokens:
+                    del tokens[token_addr]
+                    unpaired_at[token_addr] = now
+
+        self._unpaired = frozenset(unpaired_at)
+        self._prices = {
+            token_addr: fetched[0]
+            for token_addr, fetched in self._fetched.items()
+            if fetched[1] > oldest
+        }
+
+        if self.on_refresh is not None:
+            self.on_refresh(self)
+
+        return ok
+
+    def _run(self):
+        next_full = self.clock()
+        while not self._stop_event.is_set():
+            self._wake_event.wait(max(0, next_full - self.clock()))
+            if self._stop_event.is_set():
+                break
+
+            self._wake_event.clear()
+            full = self.clock() >= next_full
+            try:
+                self.refresh(full)
+            except Exception as e:
+                # fetch_reserves errors are handled by refresh, this is anything else, e.g.
+                # from on_refresh. Keep the thread alive and try again on the next refresh
+                self.last_error = e
+            if full:
+                next_full = self.clock() + self.refresh_interval
+            else:
+                # Requests come in bursts, so they are fetched together rather than one by one
+                self._stop_event.wait(MIN_REQUEST_INTERVAL)
+
+    def start(self):
+        """
+        Start refreshing prices on a daemon thread, beginning right away
+        """
+        if self._thread is not None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="price-oracle", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop refreshing and wait for the background thread to finish
+        """
+        if self._thread is None:
+            return
+
+        self._stop_event.set()
+        self._wake_event.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,221 @@
+import threading
+
+from price_oracle import PriceOracle, decode_reserves, get_pair_address
+
+WETH_ADDR = "0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2"
+USDC_ADDR = "0xa0b86991c6218b36c1d19d4a2e9eb0ce3606eb48"
+DAI_ADDR = "0x6b175474e89094c44da98b954eedeac495271d0f"
+USDT_ADDR = "0xdac17f958d2ee523a2206206994597c13d831ec7"
+
+
+def gen_fetcher(reserves, calls):
+    """
+    Generate a reserves fetcher that serves 'reserves', with None for the other tokens as if
+    they had no pair, and records the tokens it is asked for
+    """
+
+    def fetch_reserves(token_addrs):
+        calls.append(list(token_addrs))
+        return {token_addr: reserves.get(token_addr) for token_addr in token_addrs}
+
+    return fetch_reserves
+
+
+def test_get_pair_address():
+    """
+    The pair address should follow from the two tokens, in either order
+    """
+    assert get_pair_address(USDC_ADDR, WETH_ADDR) == "0xb4e16d0168e52d35cacd2c6185b44281ec28c9dc"
+    assert get_pair_address(WETH_ADDR, USDC_ADDR.upper()) == get_pair_address(USDC_ADDR, WETH_ADDR)
+
+
+def test_decode_reserves():
+    """
+    Reserves should be returned as (token, WETH) whichever token sorts first in the pair
+    """
+    result = "0x" + f"{100:064x}" + f"{7:064x}" + f"{0:064x}"
+
+    # DAI sorts before WETH, so it is token0, and USDT sorts after it
+    assert decode_reserves(result, DAI_ADDR, WETH_ADDR) == (100, 7)
+    assert decode_reserves(result, USDT_ADDR, WETH_ADDR) == (7, 100)
+    assert decode_reserves("0x", DAI_ADDR, WETH_ADDR) is None
+    assert decode_reserves("0x" + "0" * 192, DAI_ADDR, WETH_ADDR) is None
+
+
+def test_oracle_prices_requested_tokens():
+    """
+    A token that isn't priced should be requested, then priced from its reserves once the
+    oracle has refreshed
+    """
+    calls = []
+    oracle = PriceOracle(gen_fetcher({DAI_ADDR: (4000, 1)}, calls))
+
+    assert oracle.get_eth_value(DAI_ADDR, 8000) is None
+    assert oracle.get_eth_value(USDC_ADDR, 1) is None
+
+    oracle.refresh(full=False)
+    assert sorted(calls[0]) == [DAI_ADDR, USDC_ADDR]
+    assert oracle.get_eth_value(DAI_ADDR, 8000) == 2
+    # Tokens without a pair stay unpriced
+    assert oracle.get_eth_value(USDC_ADDR, 1) is None
+    assert len(oracle) == 1
+
+    # A partial refresh only fetches newly requested tokens, and tokens without a pair are
+    # no longer tracked
+    oracle.refresh(full=False)
+    assert calls[1:] == []
+    oracle.refresh()
+    assert calls[1] == [DAI_ADDR]
+
+
+def test_oracle_remembers_unpaired_tokens():
+    """
+    A token without a pair should not be requested again, until 'max_age' has passed
+    """
+    now = [0]
+    calls = []
+    oracle = PriceOracle(gen_fetcher({}, calls), max_age=100, clock=lambda: now[0])
+
+    assert oracle.get_eth_value(USDC_ADDR, 1) is None
+    oracle.refresh(full=False)
+    assert calls == [[USDC_ADDR]]
+
+    oracle._wake_event.clear()
+    assert oracle.get_eth_value(USDC_ADDR, 1) is None
+    assert not oracle._wake_event.is_set()
+    oracle.refresh()
+    assert calls == [[USDC_ADDR]]
+
+    now[0] = 100
+    oracle.refresh()
+    assert oracle.get_eth_value(USDC_ADDR, 1) is None
+    assert oracle._wake_event.is_set()
+    oracle.refresh(full=False)
+    assert calls == [[USDC_ADDR], [USDC_ADDR]]
+
+
+def test_oracle_max_tokens():
+    """
+    Past the limit the least recently priced tokens should be dropped
+    """
+    tokens = [f"0x{i:040x}" for i in range(3)]
+    oracle = PriceOracle(gen_fetcher({token: (1, 1) for token in tokens}, []), max_tokens=2)
+
+    oracle.get_eth_value(tokens[0], 1)
+    oracle.get_eth_value(tokens[1], 1)
+    oracle.refresh()
+    assert oracle.get_eth_value(tokens[0], 1) == 1
+
+    oracle.get_eth_value(tokens[2], 1)
+    oracle.refresh()
+    assert oracle.get_reserves(tokens[0]) == (1, 1)
+    assert oracle.get_reserves(tokens[1]) is None
+    assert oracle.get_reserves(tokens[2]) == (1, 1)
+
+
+def test_oracle_max_tokens_keeps_pinned_tokens():
+    """
+    A tracked token should never be dropped, even if it is never looked up and the other
+    tokens fill the oracle past the limit, and should be fetched on every full refresh
+    """
+    tokens = [f"0x{i:040x}" for i in range(1, 5)]
+    reserves = {token: (1, 1) for token in tokens}
+    reserves[USDC_ADDR] = (2, 1)
+    calls = []
+    oracle = PriceOracle(gen_fetcher(reserves, calls), max_tokens=2)
+    oracle.track(USDC_ADDR.upper())
+
+    for token in tokens:
+        oracle.get_eth_value(token, 1)
+        oracle.refresh()
+
+    assert len(oracle) == 3
+    assert oracle.get_reserves(USDC_ADDR) == (2, 1)
+    assert USDC_ADDR in calls[-1]
+
+
+def test_oracle_retries_failed_tokens():
+    """
+    A token whose call failed should be fetched again on the next full refresh rather than
+    taken to have no pair
+    """
+    failed = [True]
+    calls = []
+
+    def fetch_reserves(token_addrs):
+        calls.append(list(token_addrs))
+        if failed[0]:
+            return {}
+        return {token_addr: (1, 2) for token_addr in token_addrs}
+
+    oracle = PriceOracle(fetch_reserves)
+    assert oracle.get_eth_value(DAI_ADDR, 1) is None
+    oracle.refresh(full=False)
+    assert oracle.get_reserves(DAI_ADDR) is None
+    assert DAI_ADDR not in oracle._unpaired
+
+    failed[0] = False
+    oracle.refresh()
+    assert calls == [[DAI_ADDR], [DAI_ADDR]]
+    assert oracle.get_eth_value(DAI_ADDR, 10) == 20
+
+
+def test_oracle_keeps_prices_until_max_age():
+    """
+    If the reserves can't be fetched the previous prices should be kept, until they are
+    older than the maximum age
+    """
+    now = [0]
+    failing = [False]
+
+    def fetch_reserves(token_addrs):
+        if failing[0]:
+            raise OSError("node unreachable")
+        return {token_addr: (1, 2) for token_addr in token_addrs}
+
+    oracle = PriceOracle(fetch_reserves, max_age=100, clock=lambda: now[0])
+    oracle.get_eth_value(DAI_ADDR, 1)
+    assert oracle.refresh()
+
+    failing[0] = True
+    now[0] = 50
+    assert not oracle.refresh()
+    assert isinstance(oracle.last_error, OSError)
+    assert oracle.get_eth_value(DAI_ADDR, 10) == 20
+
+    now[0] = 100
+    oracle.refresh()
+    assert oracle.get_eth_value(DAI_ADDR, 10) is None
+
+
+def test_oracle_thread_survives_errors():
+    """
+    An error during a refresh should not stop the background thread, and tokens requested
+    while a refresh runs should be fetched by the next one
+    """
+    refreshed = threading.Event()
+    refreshes = []
+
+    def on_refresh(oracle):
+        refreshes.append(len(oracle))
+        if len(refreshes) == 1:
+            # Requested while the refresh thread holds the sets it swapped out
+            oracle.get_eth_value(USDT_ADDR, 1)
+            raise ValueError("bad refresh")
+        if len(oracle) == 2:
+            refreshed.set()
+
+    oracle = PriceOracle(
+        gen_fetcher({DAI_ADDR: (1, 1), USDT_ADDR: (1, 1)}, []), on_refresh=on_refresh
+    )
+    oracle.track(DAI_ADDR)
+    oracle.start()
+    try:
+        assert refreshed.wait(5)
+    finally:
+        oracle.stop()
+
+    # The next refresh fetched the token requested during the one that failed
+    assert refreshes[0] == 1
+    assert oracle.get_reserves(USDT_ADDR) == (1, 1)
+    assert oracle.last_error is None
@@ -0,0 +1,33 @@
+"""
+Swap functions of the Uniswap V2 Router, compiled from router_abi.json by
+src/compile_abi.py. Do not edit, run `npm run build:abi` instead
+"""
+
+# Method id -> (function name, where the amount of ETH comes from, argument positions):
+#   - "value": the ETH sent with the transaction
+#   - "word": the uint256 argument at the given position
+#   - "path": the path, amount in and amount out arguments at the given positions
+SWAP_FUNCTIONS = {
+    "0x18cbafe5": ("swapExactTokensForETH", "word", (1,)),
+    "0x38ed1739": ("swapExactTokensForTokens", "path", (2, 0, 1)),
+    "0x4a25d94a": ("swapTokensForExactETH", "word", (0,)),
+    "0x5c11d795": ("swapExactTokensForTokensSupportingFeeOnTransferTokens", "path", (2, 0, 1)),
+    "0x791ac947": ("swapExactTokensForETHSupportingFeeOnTransferTokens", "word", (1,)),
+    "0x7ff36ab5": ("swapExactETHForTokens", "value", ()),
+    "0x8803dbee": ("swapTokensForExactTokens", "path", (2, 1, 0)),
+    "0xb6f9de95": ("swapExactETHForTokensSupportingFeeOnTransferTokens", "value", ()),
+    "0xfb3bdb41": ("swapETHForExactTokens", "value", ()),
+}
+
+# Method id -> position of the path argument, for every swap function
+SWAP_PATHS = {
+    "0x18cbafe5": 2,
+    "0x38ed1739": 2,
+    "0x4a25d94a": 2,
+    "0x5c11d795": 2,
+    "0x791ac947": 2,
+    "0x7ff36ab5": 1,
+    "0x8803dbee": 2,
+    "0xb6f9de95": 1,
+    "0xfb3bdb41": 1,
+}
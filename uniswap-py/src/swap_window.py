@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+# Layout of the list kept for each sender: its total, whether the total was already reported,
+# then the position and amount of each of its swaps still in the window, oldest first
+TOTAL = 0
+ALERTED = 1
+FIRST_SWAP = 2
+
+
+class SwapWindow:
+    """
+    Rolling per-sender swap totals over a window of blocks or seconds. Memory is bounded:
+    senders whose swaps have all left the window are dropped, and when more than
+    'max_senders' are tracked the least recently active ones are dropped first
+    """
+
+    def __init__(self, size, threshold, max_senders=500000):
+        if size <= 0:
+            raise ValueError(f"Window size must be positive, got {size}")
+
+        self.size = size
+        self.threshold = threshold
+        self.max_senders = max_senders
+        # Sender -> flat list laid out as described above, least recently active first. Most
+        # senders only have a swap or two in the window, so one small list per sender keeps
+        # millions of them cheap
+        self._senders = OrderedDict()
+        # Number of senders dropped to stay under 'max_senders'
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._senders)
+
+    def _expire(self, position):
+        """
+        Drop the senders that have been idle for the whole window. They are kept in order of
+        activity, so only the oldest ones need to be looked at
+        """
+        oldest = position - self.size
+        senders = self._senders
+        while senders:
+            sender = next(iter(senders))
+            # Position of the sender's latest swap
+            if senders[sender][-2] > oldest:
+                break
+            del senders[sender]
+
+        while len(senders) > self.max_senders:
+            senders.popitem(last=False)
+            self.evicted += 1
+
+    def add(self, sender, amount, position):
+        """
+        Add a swap to the sender's total. Returns the new total if it just crossed the
+        threshold, otherwise None. Positions must not go backwards
+        """
+        state = self._senders.get(sender)
+        if state is None:
+            state = self._senders[sender] = [0, False]
+        else:
+            self._senders.move_to_end(sender)
+
+        # Swaps at the same position are merged
+        if len(state) > FIRST_SWAP and state[-2] == position:
+            state[-1] += amount
+        else:
+            state.append(position)
+            state.append(amount)
+        state[TOTAL] += amount
+
+        # Take out the swaps that have left the window
+        oldest = position - self.size
+        end = FIRST_SWAP
+        while state[end] <= oldest:
+            state[TOTAL] -= state[end + 1]
+            end += 2
+        if end > FIRST_SWAP:
+            del state[FIRST_SWAP:end]
+
+        self._expire(position)
+
+        if state[TOTAL] < self.threshold:
+            state[ALERTED] = False
+            return None
+
+        if state[ALERTED]:
+            return None
+
+        state[ALERTED] = True
+        return state[TOTAL]
@@ -0,0 +1,218 @@
+"""
+Serves the agent from a long-lived Python process, without the Node runner, for local tools
+such as load tests, replays and the host of agent-tools-py. This is a test harness, not a way
+to deploy the agent: the Forta scanner only talks to agents over gRPC on port 50051, which the
+Node runner serves, and doesn't speak this protocol.
+
+Clients connect over TCP or a Unix socket and send one JSON request per line:
+
+    {"id": 1, "events": [<transaction event>, ...]}
+
+The events are in the format accepted by forta_agent.create_transaction_event. They are
+handled as one batch, e.g. the transactions of a block, and the findings are streamed back one
+per line, followed by a line that ends the request:
+
+    {"id": 1, "finding": {...}}
+    {"id": 1, "done": true, "events": 2, "findings": 1, "handle_us": 35.2, "overhead_us": 9.8}
+
+'handle_us' is the time the agent took per event and 'overhead_us' the time spent per event
+decoding the request and encoding the findings. A request that can't be handled is answered
+with {"id": 1, "error": "..."} and the connection stays open.
+
+A request with "flush": true is also answered with the findings the agent still holds back,
+e.g. alerts waiting on a lookup, once it is done waiting for them. Clients send one before
+disconnecting for good, e.g. {"id": 2, "events": [], "flush": true}
+"""
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+
+DEFAULT_HOST = "127.0.0.1"
+# The Forta scanner talks to agents over gRPC on port 50051, so the harness keeps off it
+DEFAULT_PORT = 50052
+
+
+def run_batch(agent, tx_events):
+    """
+    Run a batch of transactions through the agent, in a single call if the agent supports it
+    """
+    handle_transaction_batch = getattr(agent, "handle_transaction_batch", None)
+    if handle_transaction_batch is not None:
+        return handle_transaction_batch(tx_events)
+
+    findings = []
+    for tx_event in tx_events:
+        findings.extend(agent.handle_transaction(tx_event))
+
+    return findings
+
+
+def flush_agent(agent):
+    """
+    Return the findings an agent still holds back, if it has a flush_findings() function
+    """
+    flush_findings = getattr(agent, "flush_findings", None)
+    if flush_findings is None:
+        return []
+
+    return flush_findings()
+
+
+def encode_line(response):
+    return (json.dumps(response) + "\n").encode()
+
+
+class Worker:
+    """
+    Handles requests for an agent module. The agent keeps its state in module globals, so
+    requests from different connections are handled one at a time
+    """
+
+    def __init__(self, agent, metrics=None):
+        self.agent = agent
+        # The agent's own metrics, so the worker's timings are exported along with the agent's
+        self.metrics = agent.metrics if metrics is None else metrics
+        self.lock = threading.Lock()
+
+    def run(self, tx_events, flush=False):
+        """
+        Return the findings of the agent for a batch of transactions, followed by the ones it
+        still holds back if 'flush' is set
+        """
+        findings = run_batch(self.agent, tx_events)
+        if flush:
+            findings = findings + flush_agent(self.agent)
+
+        return findings
+
+    def encode_findings(self, request_id, findings):
+        """
+        Return the response lines of the findings of a request
+        """
+        # Finding.toJson already returns JSON, so it is inserted as it is rather than decoded
+        # and encoded again
+        prefix = '{"id": ' + json.dumps(request_id) + ', "finding": '
+        return [(prefix + finding.toJson() + "}\n").encode() for finding in findings]
+
+    def handle_request(self, line):
+        """
+        Handle one request line and yield the encoded response lines
+        """
+        from forta_agent import create_transaction_event
+
+        start = time.perf_counter_ns()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            tx_events = [create_transaction_event(event) for event in request["events"]]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield encode_line({"id": request_id, "error": f"invalid request: {e!r}"})
+            return
+        decode_ns = time.perf_counter_ns() - start
+
+        error = None
+        with self.lock:
+            handle_start = time.perf_counter_ns()
+            try:
+                findings = self.run(tx_events, bool(request.get("flush")))
+            except Exception as e:
+                error = e
+            handle_ns = time.perf_counter_ns() - handle_start
+
+            # Counted under the lock, so requests from several connections don't race on the
+            # counters
+            if error is None and self.metrics.ENABLED:
+                self.metrics.increment("worker_requests")
+                self.metrics.increment("worker_events", len(tx_events))
+                self.metrics.record_time("worker_handle", handle_ns)
+
+        if error is not None:
+            yield encode_line({"id": request_id, "error": f"agent error: {error!r}"})
+            return
+
+        encode_start = time.perf_counter_ns()
+        lines = self.encode_findings(request_id, findings)
+        overhead_ns = decode_ns + time.perf_counter_ns() - encode_start
+
+        if self.metrics.ENABLED:
+            with self.lock:
+                self.metrics.record_time("worker_overhead", overhead_ns)
+
+        yield from lines
+        count = max(len(tx_events), 1)
+        yield encode_line(
+            {
+                "id": request_id,
+                "done": True,
+                "events": len(tx_events),
+                "findings": len(findings),
+                "handle_us": round(handle_ns / count / 1000, 3),
+                "overhead_us": round(overhead_ns / count / 1000, 3),
+            }
+        )
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads request lines from a connection until the client closes it
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            for response in self.server.worker.handle_request(line):
+                self.wfile.write(response)
+            self.wfile.flush()
+
+
+class TCPWorkerServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class UnixWorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(worker, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """
+    Create a server for a worker, listening on a Unix socket if 'socket_path' is set and on
+    TCP otherwise
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixWorkerServer(socket_path, RequestHandler)
+    else:
+        server = TCPWorkerServer((host, port), RequestHandler)
+
+    server.worker = worker
+
+    return server
+
+
+def main(argv=None):
+    """
+    Import the agent, which loads its settings and indexes once, and serve it until stopped
+    """
+    parser = argparse.ArgumentParser(description="Serve the agent from a long-lived process")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--socket", dest="socket_path", help="listen on a Unix socket instead")
+    args = parser.parse_args(argv)
+
+    from src import agent
+
+    server = create_server(Worker(agent), args.host, args.port, args.socket_path)
+    with server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()